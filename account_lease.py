@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from typing import Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，租约退化为不加锁
+    fcntl = None
+
+
+def _stamp(fd: int, ttl: float) -> None:
+    """写入持有者信息和到期时间，供等待方判断是否过期"""
+    holder = json.dumps({"pid": os.getpid(), "host": socket.gethostname(), "expires_at": time.time() + ttl})
+    data = holder.encode('utf-8')
+    # 先覆盖再截断，等待方任何时候都不会读到空文件
+    os.pwrite(fd, data, 0)
+    os.ftruncate(fd, len(data))
+
+
+class Lease:
+    """
+    一个账号的租约
+
+    属性:
+        locked: 是否真正持有文件锁（未启用租约或持有者超时被接管时为 False）
+        contended: 获取前是否等待过其他进程
+        waited_since: 开始等待的时间戳
+    """
+
+    def __init__(self, fd: Optional[int] = None, contended: bool = False, waited_since: float = 0.0,
+                 owner: Optional["AccountLeases"] = None):
+        self.fd = fd
+        self.contended = contended
+        self.waited_since = waited_since
+        self._owner = owner
+
+    @property
+    def locked(self) -> bool:
+        return self.fd is not None
+
+    def release(self) -> None:
+        """释放租约，重复调用无副作用"""
+        if self.fd is None:
+            return
+        if self._owner is not None:
+            # 先停止续期，之后续期线程不会再写这个文件
+            self._owner._forget(self)
+        fd, self.fd = self.fd, None
+        try:
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class AccountLeases:
+    """
+    跨进程的账号租约
+
+    每个站点账号对应一个锁文件，持有者用 fcntl.flock 加排他锁并写入 pid、主机和到期时间，
+    持有期间后台线程每隔三分之一有效期续期一次，耗时较长的处理（如排队等验证码）不会被接管。
+    进程退出时系统自动释放锁；持有者停止续期超过有效期时，等待方不再等待，直接接管。
+    同一账号在多个进程（分片重叠、手动运行与定时任务重叠）中不会同时刷新 Cookie 和签到，
+    后到的进程等待先到的进程完成，复用其刚保存的 Cookie。
+    """
+
+    def __init__(self, directory: str, ttl: float = 300, poll_interval: float = 0.5):
+        """
+        初始化
+
+        参数:
+            directory: 锁文件目录，需在共用账号的各进程之间共享
+            ttl: 租约有效期(秒)，0 表示不启用
+            poll_interval: 等待时检查锁的间隔(秒)
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._held: Set[Lease] = set()
+        self._heartbeat: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return fcntl is not None and self.ttl > 0
+
+    def _path(self, site: str, key: str) -> str:
+        # 账号标识可能包含路径字符，文件名只用摘要
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f"{site}-{digest}.lock")
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _hold(self, fd: int, contended: bool = False, waited_since: float = 0.0) -> Lease:
+        """登记新持有的租约，确保续期线程在运行"""
+        _stamp(fd, self.ttl)
+        lease = Lease(fd, contended, waited_since, self)
+        with self._lock:
+            self._held.add(lease)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._renew, name="lease-heartbeat", daemon=True)
+                self._heartbeat.start()
+        return lease
+
+    def _forget(self, lease: Lease) -> None:
+        with self._lock:
+            self._held.discard(lease)
+
+    def _renew(self) -> None:
+        """为所有持有中的租约续期，没有租约时退出"""
+        while True:
+            time.sleep(self.ttl / 3)
+            with self._lock:
+                if not self._held:
+                    self._heartbeat = None
+                    return
+                for lease in self._held:
+                    try:
+                        _stamp(lease.fd, self.ttl)
+                    except OSError as e:
+                        print(f"租约续期失败: {e}")
+
+    def _holder(self, path: str) -> dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.loads(f.read() or "{}")
+        except (OSError, ValueError):
+            return {}
+
+    def _open(self, site: str, key: str) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.open(self._path(site, key), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def try_acquire(self, site: str, key: str) -> Optional[Lease]:
+        """
+        不等待地获取租约
+
+        返回:
+            获取成功或未启用租约时返回 Lease，被其他进程持有时返回 None
+        """
+        if not self.enabled:
+            return Lease()
+        try:
+            fd = self._open(site, key)
+        except OSError as e:
+            print(f"打开租约文件失败: {e}，不加锁继续")
+            return Lease()
+        if not self._try_lock(fd):
+            os.close(fd)
+            return None
+        return self._hold(fd)
+
+    def acquire(self, site: str, key: str) -> Lease:
+        """
+        获取租约，被其他进程持有时等待其释放
+
+        持有者停止续期超过有效期时不再等待，返回未加锁的 Lease
+        """
+        if not self.enabled:
+            return Lease()
+        try:
+            fd = self._open(site, key)
+        except OSError as e:
+            print(f"打开租约文件失败: {e}，不加锁继续")
+            return Lease()
+        started = time.time()
+        contended = False
+        # 持有者会持续续期，以最近一次读到的到期时间为准；一直读不到时最多等待一个有效期
+        expires_at = started + self.ttl
+        while True:
+            if self._try_lock(fd):
+                return self._hold(fd, contended, started)
+            holder = self._holder(self._path(site, key))
+            if not contended:
+                contended = True
+                print(f"账号正由其他进程处理（pid {holder.get('pid', '?')}@{holder.get('host', '?')}），等待其完成...")
+            expires_at = holder.get("expires_at", expires_at)
+            if time.time() >= expires_at:
+                os.close(fd)
+                print("其他进程持有的账号租约已停止续期并过期，不再等待")
+                return Lease(None, contended, started)
+            time.sleep(self.poll_interval)
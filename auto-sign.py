@@ -2,21 +2,41 @@
 
 import os
 import time
-import json
-import re
+import hashlib
+import asyncio
+import contextlib
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from curl_cffi import requests
+from session_pool import SessionPool
+from credit_ledger import CreditLedger, parse_record_time
+from credit_cache import CreditPageCache
+from validity_cache import CookieValidityCache
+from state_store import StateStore
+from captcha_poller import AdaptivePoller
+from solver_registry import SolverRegistry
+from login_scheduler import LoginScheduler
+from run_trace import RunTracer, set_trace_context
+from metrics_exporter import PrometheusTextfileExporter
+from sharding import ShardPlan, ShardSummaryBoard
+from account_lease import AccountLeases
+from pipeline import Pipeline, Stage
+from rate_limiter import OriginRateLimiter, RateLimitedError, backoff_delay
+from sign_daemon import DailySchedule, EnvFileWatcher, SignDaemon, spread_offset, next_reset, sleep_until
 
 # 导入验证码解决器
 try:
     from turnstile_solver import TurnstileSolver, TurnstileSolverError
     from yescaptcha import YesCaptchaSolver, YesCaptchaSolverError
+    from hedged_solver import HedgedSolver, HedgedSolverError
 except ImportError:
     print("警告：验证码解决器模块未找到，自动登录功能将不可用")
 
 # 加载环境变量
-from dotenv import load_dotenv
+from dotenv import load_dotenv, find_dotenv
 load_dotenv()  # 加载默认.env文件
 
 # 禁用SSL证书验证警告
@@ -45,7 +65,8 @@ SITES_CONFIG = {
         "login_api": "https://www.nodeseek.com/api/account/signIn",
         "sitekey": "0x4AAAAAAAaNy7leGjewpVyR",
         "user_var": "NS_USER",
-        "pass_var": "NS_PASS"
+        "pass_var": "NS_PASS",
+        "concurrency_var": "NS_CONCURRENCY"
     },
     "deepflood": {
         "name": "DeepFlood", 
@@ -58,52 +79,128 @@ SITES_CONFIG = {
         "login_api": "https://www.deepflood.com/api/account/signIn",
         "sitekey": "0x4AAAAAAAaNy7leGjewpVyR",
         "user_var": "DF_USER",
-        "pass_var": "DF_PASS"
+        "pass_var": "DF_PASS",
+        "concurrency_var": "DF_CONCURRENCY"
     }
 }
 
-# ---------------- 通知状态管理 ----------------
-NOTIFICATION_FILE = "./cookie/notification_status.json"
+# 按站点 origin 复用的连接池，所有站点接口请求都经由此处发出
+SESSION_POOL = SessionPool(impersonate="chrome110")
+
+# 单次运行内的收益页面缓存，有效性检查拿到的第一页直接用作统计第一页
+CREDIT_CACHE = CreditPageCache()
 
-def load_notification_status():
-    """加载通知状态"""
+# ---------------- 运行参数 ----------------
+def env_bool(name, default=False):
+    """读取布尔型环境变量"""
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes", "on")
+
+def env_int(name, default):
+    """读取整数型环境变量，格式错误时使用默认值"""
     try:
-        if os.path.exists(NOTIFICATION_FILE):
-            with open(NOTIFICATION_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"加载通知状态失败: {e}")
-    return {}
+        return int(os.getenv(name, "").strip())
+    except ValueError:
+        return default
 
-def save_notification_status(status):
-    """保存通知状态"""
+def env_float(name, default):
+    """读取浮点型环境变量，格式错误时使用默认值"""
     try:
-        os.makedirs(os.path.dirname(NOTIFICATION_FILE), exist_ok=True)
-        with open(NOTIFICATION_FILE, 'w', encoding='utf-8') as f:
-            json.dump(status, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"保存通知状态失败: {e}")
+        return float(os.getenv(name, "").strip())
+    except ValueError:
+        return default
+
+def get_site_concurrency(site_config):
+    """获取站点并发数，站点变量优先于全局 SIGN_CONCURRENCY"""
+    default = env_int("SIGN_CONCURRENCY", 5)
+    return max(1, env_int(site_config["concurrency_var"], default))
+
+def get_stage_workers(stage, default):
+    """获取流水线阶段的工作协程数量，PIPELINE_<阶段>_WORKERS 优先"""
+    return max(1, env_int(f"PIPELINE_{stage.upper()}_WORKERS", default))
+
+# 按站点 origin 共享的限流器：RATE_LIMIT 为每秒请求数上限，0 表示平时不限速；
+# 遇到 429 或 Cloudflare 质询时自动降速并按 Retry-After 暂停，之后逐步恢复
+SESSION_POOL.limiter = OriginRateLimiter(env_float("RATE_LIMIT", 0), max(1, env_int("RATE_BURST", 10)))
+
+# Cookie、有效性、通知状态和运行结果统一保存在一个 SQLite 文件中，首次运行时自动导入旧版文件
+STATE = StateStore(os.getenv("STATE_DB", "./cookie/state.db"), legacy_dir="./cookie")
+
+# Cookie有效性缓存，有效期内的账号跳过检查直接签到，由签到结果兜底
+VALIDITY_CACHE = CookieValidityCache(STATE, env_int("COOKIE_VALID_TTL", 24) * 3600)
+
+# 单次运行内的验证码服务注册表，缓存健康检查结果，连续失败的服务熔断后直接跳过
+SOLVER_REGISTRY = SolverRegistry(
+    failure_threshold=env_int("CAPTCHA_BREAKER_THRESHOLD", 3),
+    reset_timeout=env_int("CAPTCHA_BREAKER_RESET", 600)
+)
+
+# CloudFreed 并发调度，CAPTCHA_CONCURRENCY 为 0 时按解题耗时自动探测服务容量
+LOGIN_SCHEDULER = LoginScheduler(
+    capacity=env_int("CAPTCHA_CONCURRENCY", 0),
+    max_capacity=max(1, env_int("CAPTCHA_MAX_CONCURRENCY", 8))
+)
+
+# 各阶段耗时记录，配置 TRACE_DIR 时每次运行写入一个 JSON Lines 文件
+TRACER = RunTracer(os.getenv("TRACE_DIR", ""))
 
+# 可选的 Prometheus textfile 指标，配置 PROMETHEUS_TEXTFILE 时运行结束后写入
+METRICS_EXPORTER = None
+if os.getenv("PROMETHEUS_TEXTFILE", ""):
+    METRICS_EXPORTER = PrometheusTextfileExporter(os.getenv("PROMETHEUS_TEXTFILE"))
+    TRACER.subscribe(METRICS_EXPORTER.observe)
+
+# 跨进程账号租约，同一账号不会被两个进程同时刷新 Cookie 和签到
+LEASES = AccountLeases(os.getenv("LEASE_DIR", "./cookie/leases"), env_int("LEASE_TTL", 300))
+
+# 签到成功后等待统计收益的账号，所有站点签到完成后统一统计
+DEFERRED_STATS = []
+
+# 一次运行内签到和收益统计共用的事件循环，守护进程模式下各轮也共用，异步会话一直保持连接
+EVENT_LOOP = None
+
+# 多机分片：SHARD_COUNT 大于 1 时只处理属于 SHARD_INDEX 的账号
+SHARD_PLAN = ShardPlan(env_int("SHARD_INDEX", 0), env_int("SHARD_COUNT", 1))
+# 配置共享目录时各分片的结果合并为一条通知，由最后完成的分片发送
+SHARD_BOARD = ShardSummaryBoard(os.getenv("SHARD_SUMMARY_DIR")) if os.getenv("SHARD_SUMMARY_DIR", "") else None
+
+def get_stats_days():
+    """收益统计的天数范围"""
+    return max(1, env_int("STATS_DAYS", 30))
+
+def get_stats_max_pages():
+    """收益统计最多翻页数"""
+    return max(1, env_int("STATS_MAX_PAGES", 20))
+
+def get_stats_prefetch():
+    """收益统计同时预取的页数"""
+    return max(1, env_int("STATS_PREFETCH", 3))
+
+def get_async_max_clients():
+    """每个站点异步会话的最大并发请求数，不少于零点集中签到、流水线检查加签到、收益预取可能同时发出的请求数"""
+    sizes = [max(1, env_int("STATS_CONCURRENCY", 3)) * get_stats_prefetch()]
+    if env_bool("SIGN_MIDNIGHT"):
+        sizes.append(max(1, env_int("SIGN_BURST_CONCURRENCY", 50)))
+    for site_config in SITES_CONFIG.values():
+        concurrency = get_site_concurrency(site_config)
+        sizes.append(get_stage_workers("check", concurrency) + get_stage_workers("sign", concurrency))
+    return max(10, *sizes)
+
+# curl_cffi 异步会话默认最多同时 10 个请求，零点集中签到时会分批发出，按并发配置放大
+SESSION_POOL.max_clients = get_async_max_clients()
+
+# ---------------- 通知状态管理 ----------------
 def should_send_notification(site_name):
     """检查是否应该发送通知（每天只发送一次）"""
-    status = load_notification_status()
     today = datetime.now().strftime('%Y-%m-%d')
-    
-    site_status = status.get(site_name, {})
-    last_sent = site_status.get('last_sent_date')
-    
-    return last_sent != today
+    return STATE.get_notification_date(site_name) != today
 
 def mark_notification_sent(site_name):
     """标记通知已发送"""
-    status = load_notification_status()
     today = datetime.now().strftime('%Y-%m-%d')
-    
-    if site_name not in status:
-        status[site_name] = {}
-    
-    status[site_name]['last_sent_date'] = today
-    save_notification_status(status)
+    STATE.set_notification_date(site_name, today)
 
 # ---------------- 环境检测函数 ----------------
 def detect_environment():
@@ -128,185 +225,350 @@ def detect_environment():
     else:
         return "unknown"
 
-# ---------------- Cookie 文件操作 ----------------
-def get_cookie_file_path(site_name, account_index=None):
-    if account_index is not None:
-        return f"./cookie/{site_name.upper()}_COOKIE_{account_index}.txt"
-    return f"./cookie/{site_name.upper()}_COOKIE.txt"
-
-def load_cookies_from_file(site_name, account_index=None):
-    """从文件加载Cookie"""
+# ---------------- Cookie 存取 ----------------
+def load_saved_cookie(site_name, account_index=None):
+    """读取账号保存的Cookie"""
     try:
-        cookie_file = get_cookie_file_path(site_name, account_index)
-        if os.path.exists(cookie_file):
-            with open(cookie_file, "r", encoding='utf-8') as f:
-                content = f.read().strip()
-                # 处理可能的编码问题
-                if content:
-                    return content
-    except UnicodeDecodeError:
-        # 如果UTF-8解码失败，尝试其他编码
-        try:
-            with open(cookie_file, "r", encoding='gbk') as f:
-                content = f.read().strip()
-                if content:
-                    return content
-        except:
-            pass
+        return STATE.get_cookie(site_name, account_index)
     except Exception as e:
-        print(f"从文件读取Cookie失败: {e}")
+        print(f"读取已保存的Cookie失败: {e}")
     return ""
 
-def save_cookie_to_file(site_name, cookie_str, account_index=None):
-    """将Cookie保存到文件"""
+def save_cookie(site_name, cookie_str, account_index=None):
+    """保存账号的Cookie"""
     try:
-        cookie_file = get_cookie_file_path(site_name, account_index)
-        os.makedirs(os.path.dirname(cookie_file), exist_ok=True)
-        
         # 确保cookie_str是字符串，处理可能的编码问题
         if isinstance(cookie_str, bytes):
             cookie_str = cookie_str.decode('utf-8', errors='ignore')
         
-        with open(cookie_file, "w", encoding='utf-8') as f:
-            f.write(cookie_str)
-        print(f"Cookie 已成功保存到文件: {cookie_file}")
+        STATE.set_cookie(site_name, account_index, cookie_str)
+        print(f"Cookie 已保存: {site_name} 账号{account_index if account_index else ''}")
         return True
     except Exception as e:
-        print(f"保存Cookie到文件失败: {e}")
+        print(f"保存Cookie失败: {e}")
         return False
 
-def check_cookie_validity(site_config, cookie_str):
-    """检查Cookie是否有效"""
+def _probe_headers(site_config, cookie_str):
+    """Cookie有效性检查使用的请求头"""
+    return {
+        "Cookie": cookie_str,
+        "Origin": site_config["origin"],
+        "Referer": site_config["board_url"],
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    }
+
+def _is_cookie_response_valid(response):
+    """根据检查接口的响应判断Cookie是否有效"""
+    # 正确处理响应编码，特别是中文字符
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    
+    # 确保响应文本正确解码，处理所有可能的编码问题
     try:
-        headers = {
-            "Cookie": cookie_str,
-            "Origin": site_config["origin"],
-            "Referer": site_config["board_url"],
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        
-        # 尝试访问用户信息页面
-        response = requests.get(
-            f"{site_config['stats_api']}1",
-            headers=headers,
-            impersonate="chrome110"
-        )
-        
-        # 正确处理响应编码，特别是中文字符
-        if response.encoding is None:
-            response.encoding = 'utf-8'
-        
-        # 确保响应文本正确解码，处理所有可能的编码问题
+        response_text = response.text
+    except UnicodeDecodeError as decode_error:
+        # 如果默认编码失败，尝试其他常见编码
         try:
+            response.encoding = 'gbk'
             response_text = response.text
-        except UnicodeDecodeError as decode_error:
-            # 如果默认编码失败，尝试其他常见编码
+        except UnicodeDecodeError:
             try:
-                response.encoding = 'gbk'
+                response.encoding = 'gb2312'
                 response_text = response.text
             except UnicodeDecodeError:
-                try:
-                    response.encoding = 'gb2312'
-                    response_text = response.text
-                except UnicodeDecodeError:
-                    # 如果所有编码都失败，使用原始字节内容
-                    response_text = response.content.decode('utf-8', errors='ignore')
+                # 如果所有编码都失败，使用原始字节内容
+                response_text = response.content.decode('utf-8', errors='ignore')
+    
+    # 检查响应状态和内容
+    if response.status_code != 200:
+        return False
         
-        # 检查响应状态和内容
-        if response.status_code != 200:
-            return False
-            
-        # 更宽松的Cookie有效性检查
-        # 只要返回200状态码且不是明显的错误页面，就认为Cookie有效
-        if response.status_code == 200:
-            # 检查是否是有效的JSON响应
-            try:
-                data = response.json()
-                if data.get("success") is not None:
-                    return True
-            except:
-                pass
-            
-            # 检查是否包含有效内容标识
-            valid_indicators = ["credit", "balance", "amount", "success", "data", "message"]
-            for indicator in valid_indicators:
-                if indicator in response_text.lower():
-                    return True
-            
-            # 如果包含常见的错误标识，则返回False
-            error_indicators = ["error", "invalid", "unauthorized", "forbidden", "login", "signin"]
-            for indicator in error_indicators:
-                if indicator in response_text.lower():
-                    return False
-            
-            # 默认认为有效（避免过于严格的检查导致频繁重新登录）
-            return True
-            
+    # 更宽松的Cookie有效性检查
+    # 只要返回200状态码且不是明显的错误页面，就认为Cookie有效
+    if response.status_code == 200:
+        # 检查是否是有效的JSON响应
+        try:
+            data = response.json()
+            if data.get("success") is not None:
+                return True
+        except:
+            pass
+        
+        # 检查是否包含有效内容标识
+        valid_indicators = ["credit", "balance", "amount", "success", "data", "message"]
+        for indicator in valid_indicators:
+            if indicator in response_text.lower():
+                return True
+        
+        # 如果包含常见的错误标识，则返回False
+        error_indicators = ["error", "invalid", "unauthorized", "forbidden", "login", "signin"]
+        for indicator in error_indicators:
+            if indicator in response_text.lower():
+                return False
+        
+        # 默认认为有效（避免过于严格的检查导致频繁重新登录）
+        return True
+        
+    return False
+
+# ---------------- 收益账本 ----------------
+def get_ledger_file_path(site_name, account_index=None):
+    if account_index is not None:
+        return f"./cookie/ledger/{site_name.upper()}_LEDGER_{account_index}.json"
+    return f"./cookie/ledger/{site_name.upper()}_LEDGER.json"
+
+def load_credit_ledger(site_name, account_index=None):
+    """加载账号的本地收益账本，STATS_LEDGER=false 时不使用账本"""
+    if not env_bool("STATS_LEDGER", True):
+        return None
+    return CreditLedger(get_ledger_file_path(site_name, account_index))
+
+def _remember_probe(site_config, cookie_str, response):
+    """判断Cookie有效性，并缓存结论和第一页收益数据"""
+    valid = _is_cookie_response_valid(response)
+    CREDIT_CACHE.put_probe(site_config["stats_api"], cookie_str, valid)
+    if valid:
+        try:
+            CREDIT_CACHE.put_page(site_config["stats_api"], cookie_str, 1, response.json())
+        except Exception:
+            pass
+    return valid
+
+def check_cookie_validity(site_config, cookie_str):
+    """检查Cookie是否有效，同一次运行内重复检查直接使用缓存结论"""
+    cached = CREDIT_CACHE.get_probe(site_config["stats_api"], cookie_str)
+    if cached is not None:
+        return cached
+    try:
+        with TRACER.span("probe") as span:
+            # 尝试访问用户信息页面
+            response = SESSION_POOL.request(
+                "GET",
+                f"{site_config['stats_api']}1",
+                headers=_probe_headers(site_config, cookie_str)
+            )
+            span.set_response(response)
+            valid = _remember_probe(site_config, cookie_str, response)
+            span.set(valid=valid)
+        return valid
+        
+    except RateLimitedError:
+        # 被限流不代表 Cookie 失效，交给调用方处理，避免无谓地重新登录
+        raise
+    except Exception as e:
+        print(f"检查Cookie有效性时出错: {e}")
         return False
+
+async def async_check_cookie_validity(site_config, cookie_str):
+    """检查Cookie是否有效（异步版本）"""
+    cached = CREDIT_CACHE.get_probe(site_config["stats_api"], cookie_str)
+    if cached is not None:
+        return cached
+    try:
+        with TRACER.span("probe") as span:
+            response = await SESSION_POOL.async_request(
+                "GET",
+                f"{site_config['stats_api']}1",
+                headers=_probe_headers(site_config, cookie_str)
+            )
+            span.set_response(response)
+            valid = _remember_probe(site_config, cookie_str, response)
+            span.set(valid=valid)
+        return valid
         
+    except RateLimitedError:
+        # 被限流不代表 Cookie 失效，交给调用方退避重试，避免无谓地重新登录
+        raise
     except Exception as e:
         print(f"检查Cookie有效性时出错: {e}")
         return False
 
 # ---------------- 登录操作 ----------------
-def auto_login_with_captcha(site_config, username, password):
-    """自动登录并解决验证码"""
+def create_captcha_poller(provider, max_wait):
+    """创建验证码结果的自适应轮询，CAPTCHA_ADAPTIVE=false 时使用固定间隔"""
+    if not env_bool("CAPTCHA_ADAPTIVE", True):
+        return None
+    return AdaptivePoller(provider, max_wait=max_wait)
+
+def create_cloudfreed_solver():
+    """根据环境变量创建 CloudFreed 验证码解决器，配置缺失或服务不可用时返回 None"""
+    # 获取CloudFreed配置
+    cloudfreed_api_key = os.getenv("CLOUDFLYER_CLIENTT_KEY", "")
+    cloudfreed_base_url = os.getenv("CLOUDFLYER_API_URL", "http://127.0.0.1:3000")
+    
+    if not cloudfreed_api_key:
+        print("错误：未配置 CLOUDFLYER_CLIENTT_KEY 环境变量")
+        print("请按照以下步骤配置：")
+        print("1. 部署CloudFreed服务：docker run -itd --name cloudflyer -p 3000:3000 --restart unless-stopped jackzzs/cloudflyer -K 你的客户端密钥 -H 0.0.0.0")
+        print("2. 设置环境变量 CLOUDFREED_API_KEY=你的客户端密钥")
+        print("3. 如果服务不在本地，设置 CLOUDFLYER_API_URL=http://服务IP:3000")
+        return None
+        
+    return SOLVER_REGISTRY.get(
+        "CloudFreed", lambda: _build_cloudfreed_solver(cloudfreed_base_url, cloudfreed_api_key)
+    )
+
+def _build_cloudfreed_solver(cloudfreed_base_url, cloudfreed_api_key):
+    """创建 CloudFreed 解决器并检查服务可用性，不可用时返回 None"""
+    # 初始化验证码解决器
+    print("正在使用 TurnstileSolver 解决验证码...")
+    solver = TurnstileSolver(
+        api_base_url=cloudfreed_base_url,
+        client_key=cloudfreed_api_key,
+        poller=create_captcha_poller("cloudfreed", 20 * 6),
+        scheduler=LOGIN_SCHEDULER,
+        tracer=TRACER
+    )
+
+    # 检查服务可用性
     try:
-        # 获取CloudFreed配置
-        cloudfreed_api_key = os.getenv("CLOUDFLYER_CLIENTT_KEY", "")
-        cloudfreed_base_url = os.getenv("CLOUDFLYER_API_URL", "http://127.0.0.1:3000")
+        if not solver.health_check():
+            print("警告：CloudFreed 服务不可用，自动登录功能将无法使用")
+            print("请检查：")
+            print("1. CloudFreed服务是否正常运行")
+            print("2. 服务地址是否正确（CLOUDFLYER_API_URL环境变量）")
+            print("3. 网络连接是否正常")
+            return None
+    except Exception as e:
+        print(f"CloudFreed 服务检查失败: {e}")
+        print("错误：CloudFreed 服务不可用，自动登录功能将无法使用")
+        return None
+    return solver
+
+def create_yescaptcha_solver():
+    """根据环境变量创建 YesCaptcha 验证码解决器，未配置时返回 None"""
+    client_key = os.getenv("YESCAPTCHA_CLIENT_KEY", "")
+    if not client_key:
+        return None
+    return SOLVER_REGISTRY.get("YesCaptcha", lambda: YesCaptchaSolver(
+        api_base_url=os.getenv("YESCAPTCHA_API_URL", "https://api.yescaptcha.com"),
+        client_key=client_key,
+        poller=create_captcha_poller("yescaptcha", 20 * 3),
+        tracer=TRACER
+    ))
+
+def get_hedge_delay(poller):
+    """启动备用验证码服务前的等待秒数：CloudFreed 历史耗时的 CAPTCHA_HEDGE_PERCENTILE 百分位"""
+    delay = poller.percentile(env_int("CAPTCHA_HEDGE_PERCENTILE", 90)) if poller else None
+    if delay is None:
+        delay = env_int("CAPTCHA_HEDGE_DELAY", 30)
+    return delay
+
+def create_turnstile_solver():
+    """
+    创建登录使用的验证码解决器
+    
+    同时配置 CloudFreed 和 YesCaptcha 时返回对冲求解器，CloudFreed 超时未返回令牌时同时使用 YesCaptcha；
+    只有其中一个可用时单独使用；都不可用时返回 None
+    """
+    backup = create_yescaptcha_solver()
+    primary = create_cloudfreed_solver()
+    if primary is None:
+        if backup is None:
+            return None
+        print("改用 YesCaptcha 解决验证码")
+        return HedgedSolver(backup, primary_name="YesCaptcha")
         
-        if not cloudfreed_api_key:
-            print("错误：未配置 CLOUDFLYER_CLIENTT_KEY 环境变量")
-            print("请按照以下步骤配置：")
-            print("1. 部署CloudFreed服务：docker run -itd --name cloudflyer -p 3000:3000 --restart unless-stopped jackzzs/cloudflyer -K 你的客户端密钥 -H 0.0.0.0")
-            print("2. 设置环境变量 CLOUDFREED_API_KEY=你的客户端密钥")
-            print("3. 如果服务不在本地，设置 CLOUDFLYER_API_URL=http://服务IP:3000")
+    if backup is None or not env_bool("CAPTCHA_HEDGE", True):
+        return primary
+    delay = get_hedge_delay(primary.poller)
+    print(f"已配置 YesCaptcha，CloudFreed 超过 {delay:.0f} 秒未返回令牌时同时使用 YesCaptcha")
+    return HedgedSolver(primary, backup, hedge_delay=delay, max_parallel=max(1, env_int("CAPTCHA_MAX_CONCURRENCY", 8)))
+
+def auto_login_with_captcha(site_config, username, password, priority=LoginScheduler.EXPIRED_COOKIE):
+    """自动登录并解决验证码，priority 为验证码服务繁忙时的排队优先级"""
+    with TRACER.span("login", priority=priority) as span:
+        cookie_string = _auto_login_with_captcha(site_config, username, password, priority)
+        span.set(ok=bool(cookie_string))
+        return cookie_string
+
+def _auto_login_with_captcha(site_config, username, password, priority):
+    try:
+        solver = create_turnstile_solver()
+        if solver is None:
             return None
-            
-        # 初始化验证码解决器
-        print("正在使用 TurnstileSolver 解决验证码...")
-        solver = TurnstileSolver(
-            api_base_url=cloudfreed_base_url,
-            client_key=cloudfreed_api_key
-        )
 
-        # 检查服务可用性
+        # 登录页面和会话不依赖验证码令牌，在解题期间并行准备，拿到令牌后立即提交登录
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        # 复制当前上下文，登录页面的 span 同样带上站点和账号
+        session_future = executor.submit(
+            contextvars.copy_context().run, _open_login_session_or_cancel, site_config, cancel_event
+        )
         try:
-            if not solver.health_check():
-                print("警告：CloudFreed 服务不可用，自动登录功能将无法使用")
-                print("请检查：")
-                print("1. CloudFreed服务是否正常运行")
-                print("2. 服务地址是否正确（CLOUDFLYER_API_URL环境变量）")
-                print("3. 网络连接是否正常")
+            try:
+                # 解决Turnstile验证码
+                print("正在解决CloudFlare Turnstile验证码...")
+                token = solver.solve(
+                    site_config["login_url"],
+                    site_config["sitekey"],
+                    verbose=True,
+                    cancel_event=cancel_event,
+                    priority=priority
+                )
+            except Exception:
+                if cancel_event.is_set():
+                    print("登录页面获取失败，已放弃验证码求解")
+                    return None
+                raise
+            finally:
+                executor.shutdown(wait=False)
+
+            if not token:
+                print("验证码解决失败")
                 return None
-        except Exception as e:
-            print(f"CloudFreed 服务检查失败: {e}")
-            print("错误：CloudFreed 服务不可用，自动登录功能将无法使用")
-            return None
 
-        # 解决Turnstile验证码
-        print("正在解决CloudFlare Turnstile验证码...")
-        token = solver.solve(
-            site_config["login_url"],
-            site_config["sitekey"],
-            verbose=True
-        )
-        
-        if not token:
-            print("验证码解决失败")
-            return None
+            session = session_future.result()
+            if session is None:
+                return None
+            return submit_login(site_config, session, username, password, token)
+        finally:
+            close_login_session(session_future)
+            
+    except Exception as e:
+        print(f"自动登录过程中出错: {e}")
+        return None
 
-        # 为每个登录尝试创建新的独立会话
-        session = requests.Session(impersonate="chrome110")
+def open_login_session(site_config):
+    """创建登录会话并获取登录页面，失败返回 None"""
+    # 为每个登录尝试创建新的独立会话；会话会在线程间先后使用，共用一个连接
+    session = requests.Session(impersonate="chrome110", use_thread_local_curl=False)
 
-        # 获取登录页面内容
+    # 获取登录页面内容
+    with TRACER.span("login_page", site=site_config["name"].lower()) as span:
         login_page_response = session.get(site_config["login_url"])
-        
-        if login_page_response.status_code != 200:
-            print(f"获取登录页面失败: {login_page_response.status_code}")
-            return None
-        
+        span.set_response(login_page_response)
+    
+    if login_page_response.status_code != 200:
+        print(f"获取登录页面失败: {login_page_response.status_code}")
+        session.close()
+        return None
+    return session
+
+def close_login_session(session_future):
+    """关闭预热的登录会话，会话仍在打开时等其完成后再关闭"""
+    def close(future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        session = future.result()
+        if session is not None:
+            session.close()
+    session_future.add_done_callback(close)
+
+def _open_login_session_or_cancel(site_config, cancel_event):
+    """预热登录会话，失败时通知正在进行的验证码求解放弃"""
+    try:
+        session = open_login_session(site_config)
+    except Exception as e:
+        print(f"获取登录页面出错: {e}")
+        session = None
+    if session is None:
+        cancel_event.set()
+    return session
+
+def submit_login(site_config, session, username, password, token):
+    """在已获取登录页面的会话中提交登录，成功返回Cookie"""
+    try:
         # 执行登录
         login_data = {
             "username": username,
@@ -330,11 +592,13 @@ def auto_login_with_captcha(site_config, username, password):
             'Content-Type': "application/json"
         }
         
-        login_response = session.post(
-            site_config["login_api"],
-            json=login_data,
-            headers=login_headers
-        )
+        with TRACER.span("login_submit", site=site_config["name"].lower()) as span:
+            login_response = session.post(
+                site_config["login_api"],
+                json=login_data,
+                headers=login_headers
+            )
+            span.set_response(login_response)
         
         cookie_string = ''
 
@@ -345,8 +609,13 @@ def auto_login_with_captcha(site_config, username, password):
                 cookies = session.cookies.get_dict()
                 cookie_string = '; '.join([f"{k}={v}" for k, v in cookies.items()])
                 print(f"获取到的Cookie: {cookie_string}")
-                # 验证登录是否成功
-                if check_cookie_validity(site_config, cookie_string):
+                # 验证登录是否成功，验证请求被限流时直接使用新 Cookie
+                try:
+                    verified = check_cookie_validity(site_config, cookie_string)
+                except RateLimitedError as e:
+                    print(f"验证新 Cookie 时被限流: {e}")
+                    verified = False
+                if verified:
                     print(f"自动登录成功，已获取新Cookie")
                     return cookie_string
                 else:
@@ -372,7 +641,7 @@ def auto_login_with_captcha(site_config, username, password):
 def get_valid_cookie(site_config, username, password, account_index=None):
     """获取有效的Cookie，如果失效则自动登录"""
     # 首先尝试从文件读取（按账号索引读取）
-    cookie_str = load_cookies_from_file(site_config["name"].lower(), account_index)
+    cookie_str = load_saved_cookie(site_config["name"].lower(), account_index)
     
     # 检查Cookie是否有效
     if cookie_str and check_cookie_validity(site_config, cookie_str):
@@ -386,137 +655,223 @@ def get_valid_cookie(site_config, username, password, account_index=None):
         print("用户名或密码未配置，无法自动登录")
         return None
     
-    new_cookie = auto_login_with_captcha(site_config, username, password)
+    # 没有 Cookie 的账号优先排队解题
+    priority = LoginScheduler.EXPIRED_COOKIE if cookie_str else LoginScheduler.MISSING_COOKIE
+    new_cookie = auto_login_with_captcha(site_config, username, password, priority)
     
     if new_cookie:
         # 保存新Cookie到文件（按账号索引保存）
-        save_cookie_to_file(site_config["name"].lower(), new_cookie, account_index)
+        save_cookie(site_config["name"].lower(), new_cookie, account_index)
         return new_cookie
     else:
         print("自动登录失败")
         return None
 
 # ---------------- 签到逻辑 ----------------
-def sign(cookie, site_config, ns_random):
-    if not cookie:
-        return "invalid", "无有效Cookie"
-        
-    headers = {
+def _sign_headers(site_config, cookie):
+    """签到请求头"""
+    return {
         'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36 Edg/125.0.0.0",
         'origin': site_config["origin"],
         'referer': site_config["board_url"],
         'Content-Type': 'application/json',
         'Cookie': cookie
     }
+
+def _parse_sign_response(response):
+    """解析签到接口响应"""
+    data = response.json()
+    msg = data.get("message", "")
+    if "鸡腿" in msg or data.get("success"):
+        return "success", msg
+    elif "已完成签到" in msg:
+        return "already", msg
+    elif data.get("status") == 404:
+        return "invalid", msg
+    return "fail", msg
+
+async def async_sign(cookie, site_config, ns_random):
+    """
+    签到
+
+    异常:
+        RateLimitedError: 签到请求被限流，调用方按其 Retry-After 退避
+    """
+    if not cookie:
+        return "invalid", "无有效Cookie"
+        
     try:
         url = f"{site_config['sign_api']}?random={ns_random}"
-        response = requests.post(url, headers=headers, impersonate="chrome110")
-        data = response.json()
-        msg = data.get("message", "")
-        if "鸡腿" in msg or data.get("success"):
-            return "success", msg
-        elif "已完成签到" in msg:
-            return "already", msg
-        elif data.get("status") == 404:
-            return "invalid", msg
-        return "fail", msg
+        with TRACER.span("sign") as span:
+            response = await SESSION_POOL.async_request("POST", url, headers=_sign_headers(site_config, cookie))
+            span.set_response(response)
+            result, msg = _parse_sign_response(response)
+            span.set(result=result)
+        return result, msg
+    except RateLimitedError:
+        raise
     except Exception as e:
         return "error", str(e)
 
 # ---------------- 查询签到收益统计函数 ----------------
-def get_signin_stats(cookie, site_config, days=30):
-    """查询前days天内的签到收益统计"""
-    if not cookie:
-        return None, "无有效Cookie"
-    
-    if days <= 0:
-        days = 1
-    
-    headers = {
+def _stats_headers(site_config, cookie):
+    """收益查询请求头"""
+    return {
         'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36 Edg/125.0.0.0",
         'origin': site_config["origin"],
         'referer': site_config["board_url"],
         'Cookie': cookie
     }
+
+def _parse_record_time(timestamp, tz):
+    """将接口返回的UTC时间转换为指定时区时间"""
+    return parse_record_time(timestamp).astimezone(tz)
+
+def _collect_page_records(data, query_start_time, tz, ledger=None):
+    """
+    提取单页中需要的新记录
+    
+    返回 (records, stop_reason)，stop_reason 为 None 时继续翻页：
+    error 接口返回失败，end 已无更多记录，cutoff 已早于查询起点，known 遇到账本中已有的记录
+    """
+    if not data.get("success"):
+        return [], "error"
+        
+    records = data.get("data") or []
+    if not records:
+        return [], "end"
+        
+    collected = []
+    for record in records:
+        if ledger is not None and ledger.contains(record):
+            return collected, "known"
+        if _parse_record_time(record[3], tz) < query_start_time:
+            return collected, "cutoff"
+        collected.append(record)
+    return collected, None
+
+async def async_fetch_credit_page(site_config, cookie, page):
+    """获取收益页面 JSON，优先使用本次运行内的缓存"""
+    cached = CREDIT_CACHE.get_page(site_config["stats_api"], cookie, page)
+    if cached is not None:
+        return cached
+    with TRACER.span("stats_page", page=page) as span:
+        response = await SESSION_POOL.async_request(
+            "GET", f"{site_config['stats_api']}{page}", headers=_stats_headers(site_config, cookie)
+        )
+        span.set_response(response)
+        data = response.json()
+    CREDIT_CACHE.put_page(site_config["stats_api"], cookie, page, data)
+    return data
+
+async def _async_fetch_credit_pages(site_config, cookie, query_start_time, tz, stop_ledger, max_pages, prefetch):
+    """
+    按页顺序拉取收益记录，后续页面提前并发请求
+    
+    第一页单独请求（账本命中时通常只需一页），之后最多同时预取 prefetch 页；
+    某页触发停止条件后，已发出的后续页面结果直接丢弃
+    """
+    all_records = []
+    pending = {}
+    next_page = 1
+    window = 1
+    try:
+        for page in range(1, max_pages + 1):
+            while next_page <= max_pages and next_page < page + window:
+                pending[next_page] = asyncio.ensure_future(async_fetch_credit_page(site_config, cookie, next_page))
+                next_page += 1
+            records, stop = _collect_page_records(await pending.pop(page), query_start_time, tz, stop_ledger)
+            all_records.extend(records)
+            if stop:
+                return all_records, stop
+            window = prefetch
+        return all_records, "limit"
+    finally:
+        for task in pending.values():
+            task.cancel()
+        await asyncio.gather(*pending.values(), return_exceptions=True)
+
+def _finish_signin_stats(all_records, stop_reason, days, query_start_time, tz, ledger):
+    """合并账本并计算统计，没有账本时直接使用本次拉取的记录"""
+    if ledger is None:
+        return _build_signin_stats(all_records, days, query_start_time, tz)
+    if stop_reason == "error":
+        # 翻页中途出错时本次记录不完整，不更新账本，统计用已拉到的新记录加账本中已有的记录
+        fresh = [row for row in all_records if not ledger.contains(row)]
+        return _build_signin_stats(fresh + ledger.rows_since(query_start_time), days, query_start_time, tz)
+    ledger.update(all_records, stop_reason, query_start_time)
+    ledger.save()
+    return _build_signin_stats(ledger.rows_since(query_start_time), days, query_start_time, tz)
+
+def _build_signin_stats(all_records, days, query_start_time, tz):
+    """根据收益记录计算签到统计"""
+    signin_records = []
+    for record in all_records:
+        amount, balance, description, timestamp = record
+        record_time_shanghai = _parse_record_time(timestamp, tz)
+        
+        if (record_time_shanghai >= query_start_time and
+                "签到收益" in description and "鸡腿" in description):
+            signin_records.append({
+                'amount': amount,
+                'date': record_time_shanghai.strftime('%Y-%m-%d'),
+                'description': description
+            })
+    
+    period_desc = f"近{days}天"
+    if days == 1:
+        period_desc = "今天"
+    
+    if not signin_records:
+        return {
+            'total_amount': 0,
+            'average': 0,
+            'days_count': 0,
+            'records': [],
+            'period': period_desc,
+        }, f"查询成功，但没有找到{period_desc}的签到记录"
+    
+    total_amount = sum(record['amount'] for record in signin_records)
+    days_count = len(signin_records)
+    average = round(total_amount / days_count, 2) if days_count > 0 else 0
+    
+    stats = {
+        'total_amount': total_amount,
+        'average': average,
+        'days_count': days_count,
+        'records': signin_records,
+        'period': period_desc
+    }
+    
+    return stats, "查询成功"
+
+async def async_get_signin_stats(cookie, site_config, days=30, ledger=None, max_pages=None, prefetch=None):
+    """
+    查询前days天内的签到收益统计
+    
+    传入 ledger 时只拉取账本中还没有的新记录，统计基于本地账本计算；
+    max_pages/prefetch 默认读取 STATS_MAX_PAGES/STATS_PREFETCH
+    """
+    if not cookie:
+        return None, "无有效Cookie"
+    
+    if days <= 0:
+        days = 1
     
     try:
         shanghai_tz = ZoneInfo("Asia/Shanghai")
         now_shanghai = datetime.now(shanghai_tz)
         query_start_time = now_shanghai - timedelta(days=days)
         
-        all_records = []
-        page = 1
-        
-        while page <= 20:
-            url = f"{site_config['stats_api']}{page}"
-            response = requests.get(url, headers=headers, impersonate="chrome110")
-            data = response.json()
-            
-            if not data.get("success") or not data.get("data"):
-                break
-                
-            records = data.get("data", [])
-            if not records:
-                break
-                
-            last_record_time = datetime.fromisoformat(
-                records[-1][3].replace('Z', '+00:00'))
-            last_record_time_shanghai = last_record_time.astimezone(shanghai_tz)
-            if last_record_time_shanghai < query_start_time:
-                for record in records:
-                    record_time = datetime.fromisoformat(
-                        record[3].replace('Z', '+00:00'))
-                    record_time_shanghai = record_time.astimezone(shanghai_tz)
-                    if record_time_shanghai >= query_start_time:
-                        all_records.append(record)
-                break
-            else:
-                all_records.extend(records)
-                
-            page += 1
-            time.sleep(0.5)
-        
-        signin_records = []
-        for record in all_records:
-            amount, balance, description, timestamp = record
-            record_time = datetime.fromisoformat(
-                timestamp.replace('Z', '+00:00'))
-            record_time_shanghai = record_time.astimezone(shanghai_tz)
-            
-            if (record_time_shanghai >= query_start_time and
-                    "签到收益" in description and "鸡腿" in description):
-                signin_records.append({
-                    'amount': amount,
-                    'date': record_time_shanghai.strftime('%Y-%m-%d'),
-                    'description': description
-                })
-        
-        period_desc = f"近{days}天"
-        if days == 1:
-            period_desc = "今天"
-        
-        if not signin_records:
-            return {
-                'total_amount': 0,
-                'average': 0,
-                'days_count': 0,
-                'records': [],
-                'period': period_desc,
-            }, f"查询成功，但没有找到{period_desc}的签到记录"
+        # 账本已覆盖查询范围时，遇到已有记录即可停止翻页
+        stop_ledger = ledger if ledger is not None and ledger.covers(query_start_time) else None
         
-        total_amount = sum(record['amount'] for record in signin_records)
-        days_count = len(signin_records)
-        average = round(total_amount / days_count, 2) if days_count > 0 else 0
-        
-        stats = {
-            'total_amount': total_amount,
-            'average': average,
-            'days_count': days_count,
-            'records': signin_records,
-            'period': period_desc
-        }
+        all_records, stop_reason = await _async_fetch_credit_pages(
+            site_config, cookie, query_start_time, shanghai_tz, stop_ledger,
+            max_pages or get_stats_max_pages(), prefetch or get_stats_prefetch()
+        )
         
-        return stats, "查询成功"
+        return _finish_signin_stats(all_records, stop_reason, days, query_start_time, shanghai_tz, ledger)
         
     except Exception as e:
         return None, f"查询异常: {str(e)}"
@@ -552,15 +907,24 @@ def parse_accounts_from_env(site_config):
     
     return usernames, passwords
 
-# ---------------- 处理单个站点 ----------------
-def process_site(site_name, site_config, ns_random):
-    """站点签到逻辑"""
-    print(f"\n{'='*50}")
-    print(f"开始处理 {site_config['name']} 站点")
-    print(f"{'='*50}")
-    
-    site_results = []
+# ---------------- 账号列表 ----------------
+def account_key(source, identity):
+    """
+    账号的稳定标识，不随账号在配置中的顺序变化
+
+    账号密码按用户名区分；Cookie 账号取 Cookie 的摘要，避免在状态库中重复保存明文
+    """
+    if source == 'password':
+        return f"user:{identity}"
+    return "cookie:" + hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+
+def build_site_accounts(site_name, site_config):
+    """
+    整理站点需要处理的账号列表
     
+    优先使用 Cookie 环境变量，没有时再读取用户名/密码配置；
+    两者都没有时返回 None
+    """
     print(f"先检查是否有Cookie配置")
     # 优先读取环境变量 Cookie
     all_cookies = os.getenv(site_config["cookie_var"], "").strip()
@@ -568,140 +932,1108 @@ def process_site(site_name, site_config, ns_random):
     
     if cookies_list:
         print(f"检测到 {len(cookies_list)} 个 Cookie 环境变量，优先使用 Cookie 登录")
-        for i, cookie_str in enumerate(cookies_list, start=1):
-            display_user = f"账号{i} (Cookie)"
-            print(f"\n==== {site_config['name']} {display_user} 开始签到 ====")
+        return [{
+            'index': i,
+            'key': account_key('cookie', cookie_str),
+            'display': f"账号{i} (Cookie)",
+            'source': 'cookie',
+            'cookie': cookie_str,
+            'username': None,
+            'password': None
+        } for i, cookie_str in enumerate(cookies_list, start=1)]
 
+    # 如果没有 Cookie，再读取用户名/密码配置
+    usernames, passwords = parse_accounts_from_env(site_config)
+    if not usernames:
+        print(f"未检测到 {site_config['name']} 的账号配置，也没有 Cookie，跳过。")
+        return None
+        
+    print(f"共检测到 {len(usernames)} 个账号，使用账号密码登录")
+    return [{
+        'index': i,
+        'key': account_key('password', username),
+        'display': f"{username} (账号{i})",
+        'source': 'password',
+        'cookie': None,
+        'username': username,
+        'password': password
+    } for i, (username, password) in enumerate(zip(usernames, passwords), start=1)]
+
+def account_result(display_user, status, message, stats=None, sign_result=None):
+    """构造单个账号的汇总结果，sign_result 为签到接口的原始结论（success/already）"""
+    return {
+        'account': display_user,
+        'status': status,
+        'message': message,
+        'stats': stats,
+        'sign_result': sign_result
+    }
+
+def _sign_failed_result(display_user, msg):
+    print(f"{display_user} 签到失败: {msg}")
+    return account_result(display_user, 'failed', msg)
+
+def _throttled_result(display_user, error):
+    """被限流的失败结果，带 throttled 标记和服务端要求的 Retry-After，调用方据此退避重试"""
+    result = _sign_failed_result(display_user, f"被限流: {error}")
+    result.update(throttled=True, retry_after=error.retry_after)
+    return result
+
+def throttle_delay(display_user, attempt, reason, retry_after=None):
+    """
+    被限流后第 attempt 次重试前的等待秒数：指数退避加随机抖动，不少于服务端的 Retry-After
+
+    超过 RATE_LIMIT_RETRIES 次时返回 None，不再重试
+    """
+    retries = max(0, env_int("RATE_LIMIT_RETRIES", 5))
+    if attempt > retries:
+        print(f"{display_user} 多次被限流，放弃: {reason}")
+        return None
+    delay = backoff_delay(attempt, retry_after)
+    print(f"{display_user} 被限流: {reason}，{delay:.1f} 秒后重试（{attempt}/{retries}）")
+    return delay
+
+def _report_stats(display_user, stats, stats_msg):
+    if stats:
+        print_signin_stats(stats, display_user)
+    else:
+        print(f"统计查询失败: {stats_msg}")
+
+# ---------------- 处理单个账号 ----------------
+def validity_key(site_name, account_index):
+    """Cookie有效性缓存中的账号标识"""
+    return f"{site_name}_{account_index}"
+
+async def async_login_cookie(site_name, site_config, account):
+    """自动登录获取新Cookie，成功后记录有效性"""
+    if account.get('batch_login_failed'):
+        # 本次运行的批量登录已为该账号尝试过验证码，不再重复消耗
+        print(f"{account['display']} 批量登录已失败，不再重复登录")
+        return None
+    # 登录流程包含验证码轮询，放到线程中执行，避免阻塞其他账号
+    new_cookie = await asyncio.to_thread(
+        get_valid_cookie, site_config, account['username'], account['password'], account['index']
+    )
+    if new_cookie:
+        VALIDITY_CACHE.record(validity_key(site_name, account['index']), new_cookie, True, "login")
+    return new_cookie
+
+async def async_prepare_login_cookie(site_name, site_config, account, optimistic=False):
+    """
+    账号密码模式下获取可用Cookie
+    
+    返回 (cookie, trusted)，trusted 为 True 表示跳过了有效性检查（乐观模式或有效性缓存命中），
+    需要由签到结果兜底；获取失败时 cookie 为 None
+    """
+    cookie_str, trusted = await async_check_saved_cookie(site_name, site_config, account, optimistic)
+    if cookie_str:
+        return cookie_str, trusted
+    return await async_login_cookie(site_name, site_config, account), False
+
+async def async_check_saved_cookie(site_name, site_config, account, optimistic=False):
+    """
+    账号密码模式下检查已保存的Cookie
+    
+    返回值同 async_prepare_login_cookie；没有保存的 Cookie 或已失效时 cookie 为 None，需要登录
+    """
+    display_user = account['display']
+    key = validity_key(site_name, account['index'])
+    
+    # 优先使用已存在的 cookie 文件
+    cookie_str = load_saved_cookie(site_name, account['index'])
+    if cookie_str:
+        if optimistic:
+            print(f"{display_user} 从文件加载 Cookie 成功，直接签到")
+            return cookie_str, True
+        if VALIDITY_CACHE.is_fresh(key, cookie_str):
+            print(f"{display_user} Cookie 近期已确认有效，跳过有效性检查")
+            return cookie_str, True
+        print(f"{display_user} 加载已保存的 Cookie 成功，检查有效性...")
+        valid = await async_check_cookie_validity(site_config, cookie_str)
+        VALIDITY_CACHE.record(key, cookie_str, valid)
+        if valid:
+            return cookie_str, False
+        print(f"{display_user} Cookie 无效，尝试自动登录...")
+    else:
+        print(f"{display_user} 未找到已保存的 Cookie，需重新登录")
+    return None, False
+
+async def async_recover_sign(site_name, site_config, account, cookie_str, result, msg, ns_random):
+    """
+    跳过检查直接签到失败后的兜底流程
+    
+    签到返回 error 时先检查 Cookie，有效则重试一次；Cookie 失效时账号密码模式自动登录后再签到。
+    返回 (cookie, result, msg)，无法恢复时 cookie 为 None、msg 为失败原因
+    """
+    display_user = account['display']
+    print(f"{display_user} 直接签到未成功: {msg}")
+    
+    if result == "error":
+        print(f"{display_user} 检查 Cookie 有效性...")
+        if await async_check_cookie_validity(site_config, cookie_str):
+            # Cookie 有效，签到失败属于偶发错误，重试一次
+            result, msg = await async_sign(cookie_str, site_config, ns_random)
+            return cookie_str, result, msg
+    else:
+        # 签到接口已判定失效，记入本次运行的检查结论，后续流程无需再检查
+        CREDIT_CACHE.put_probe(site_config["stats_api"], cookie_str, False)
+    
+    if account['source'] == 'cookie':
+        print(f"{display_user} Cookie 无效，跳过")
+        return None, "invalid", "无效 Cookie"
+    
+    print(f"{display_user} Cookie 已失效，尝试自动登录...")
+    VALIDITY_CACHE.forget(validity_key(site_name, account['index']))
+    new_cookie = await async_login_cookie(site_name, site_config, account)
+    if not new_cookie:
+        print(f"{display_user} 登录失败，跳过")
+        return None, "invalid", "Cookie失效且自动登录失败"
+    result, msg = await async_sign(new_cookie, site_config, ns_random)
+    return new_cookie, result, msg
+
+async def async_process_account(site_name, site_config, account, ns_random, semaphore):
+    """处理单个账号的签到，返回汇总结果"""
+    # 按账号把签到时间分散到 SIGN_SPREAD 秒内，避免大量账号同一时刻请求签到接口
+    delay = spread_offset(account['key'], env_int("SIGN_SPREAD", 0))
+    if delay:
+        await asyncio.sleep(delay)
+    async with semaphore:
+        set_trace_context(site=site_name, account=account['index'])
+        lease = await asyncio.to_thread(LEASES.acquire, site_name, account['key'])
+        try:
+            if lease.contended:
+                # 等待期间其他进程可能已完成签到或刷新了 Cookie
+                done = completed_account_result(site_name, account)
+                if done is not None:
+                    print(f"{account['display']} 已由其他进程完成签到，跳过")
+                    return done
+                reuse_refreshed_cookie(site_name, account, lease.waited_since)
+            with TRACER.span("account", source=account['source']) as span:
+                attempt = 0
+                while True:
+                    result = await _async_process_account(site_name, site_config, account, ns_random)
+                    if not result.get('throttled'):
+                        break
+                    attempt += 1
+                    delay = throttle_delay(account['display'], attempt, result['message'], result['retry_after'])
+                    if delay is None:
+                        break
+                    # 退避期间让出并发名额，租约继续持有
+                    semaphore.release()
+                    try:
+                        await asyncio.sleep(delay)
+                    finally:
+                        await semaphore.acquire()
+                span.set(result=result['status'], outcome=result['sign_result'] or result['status'])
+            # 每个账号结束后立即写入完成日志，进程中途被杀时下次运行可以从未完成的账号继续
+            record_account_result(site_name, account, result)
+            return result
+        finally:
+            lease.release()
+
+def reuse_refreshed_cookie(site_name, account, since):
+    """其他进程在等待期间刚保存的 Cookie 视为有效，不再检查或登录"""
+    if account['source'] != 'password':
+        return
+    updated_at = STATE.cookie_updated_at(site_name, account['index'])
+    cookie_str = load_saved_cookie(site_name, account['index'])
+    if cookie_str and updated_at >= int(since):
+        print(f"{account['display']} 使用其他进程刚刷新的 Cookie")
+        VALIDITY_CACHE.record(validity_key(site_name, account['index']), cookie_str, True, "login")
+
+async def _async_process_account(site_name, site_config, account, ns_random):
+    display_user = account['display']
+    print(f"\n==== {site_config['name']} {display_user} 开始签到 ====")
+    # 乐观模式：先用已有 Cookie 直接签到，失败时再检查/登录
+    optimistic = env_bool("SIGN_OPTIMISTIC")
+    
+    try:
+        trusted = False
+        if account['source'] == 'cookie':
+            cookie_str = account['cookie']
+            trusted = optimistic
             # 检查 Cookie 是否有效
-            if not check_cookie_validity(site_config, cookie_str):
+            if not optimistic and not await async_check_cookie_validity(site_config, cookie_str):
                 print(f"{display_user} Cookie 无效，跳过")
-                site_results.append({
-                    'account': display_user,
-                    'status': 'failed',
-                    'message': '无效 Cookie',
-                    'stats': None
-                })
-                continue
-            # 开始签到
-            result, msg = sign(cookie_str, site_config, ns_random)
-
-            if result in ["success", "already"]:
-                print(f"{display_user} 签到成功: {msg}")
-                stats, stats_msg = get_signin_stats(cookie_str, site_config, 30)
-                if stats:
-                    print_signin_stats(stats, display_user)
+                return account_result(display_user, 'failed', '无效 Cookie')
+        else:
+            cookie_str, trusted = await async_prepare_login_cookie(
+                site_name, site_config, account, optimistic
+            )
+            if not cookie_str:
+                print(f"{display_user} 登录失败，跳过")
+                return account_result(display_user, 'failed', 'Cookie失效且自动登录失败')
+
+        # 开始签到
+        result, msg = await async_sign(cookie_str, site_config, ns_random)
+        
+        if trusted and result in ["invalid", "error"]:
+            cookie_str, result, msg = await async_recover_sign(
+                site_name, site_config, account, cookie_str, result, msg, ns_random
+            )
+            if not cookie_str:
+                return account_result(display_user, 'failed', msg)
+        
+        if result not in ["success", "already"]:
+            return _sign_failed_result(display_user, msg)
+        return _finish_signed(site_name, site_config, account, cookie_str, result, msg)
+    except RateLimitedError as e:
+        return _throttled_result(display_user, e)
+    except Exception as e:
+        return _sign_failed_result(display_user, str(e))
+
+def _finish_signed(site_name, site_config, account, cookie_str, result, msg):
+    """签到成功后刷新有效性缓存，收益统计登记到签到完成后的统计阶段，返回汇总结果"""
+    display_user = account['display']
+    print(f"{display_user} 签到成功: {msg}")
+    if account['source'] == 'password':
+        # 签到成功同样说明 Cookie 有效，刷新缓存时间
+        VALIDITY_CACHE.record(validity_key(site_name, account['index']), cookie_str, True, "sign")
+    if result == "success":
+        # 新的签到收益会出现在第一页，不能再用签到前缓存的页面
+        CREDIT_CACHE.invalidate_pages(site_config["stats_api"], cookie_str)
+    summary = account_result(display_user, 'success', msg, None, result)
+    # 汇总结果在统计完成后补上 stats，站点结果列表中引用的是同一个对象
+    DEFERRED_STATS.append((site_name, site_config, account, cookie_str, summary))
+    return summary
+
+# ---------------- 收益统计 ----------------
+async def async_collect_stats(jobs):
+    """
+    统一查询签到成功账号的收益统计
+
+    使用独立的并发数 STATS_CONCURRENCY，总耗时超过 STATS_BUDGET 秒时放弃未完成的账号，
+    汇总中这些账号不带统计
+    """
+    semaphore = asyncio.Semaphore(max(1, env_int("STATS_CONCURRENCY", 3)))
+    budget = env_int("STATS_BUDGET", 300)
+    started = time.time()
+
+    async def collect(site_name, site_config, account, cookie_str, summary):
+        async with semaphore:
+            set_trace_context(site=site_name, account=account['index'])
+            stats, stats_msg = await async_get_signin_stats(
+                cookie_str, site_config, get_stats_days(), load_credit_ledger(site_name, account['index'])
+            )
+            _report_stats(account['display'], stats, stats_msg)
+            summary['stats'] = stats
+            if not stats:
+                summary['stats_error'] = stats_msg
+
+    print(f"\n所有站点签到完成，开始查询 {len(jobs)} 个账号的收益统计")
+    tasks = [asyncio.create_task(collect(*job)) for job in jobs]
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=budget if budget > 0 else None)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        timed_out = 0
+        for job, task in zip(jobs, tasks):
+            if task in pending:
+                job[4]['stats_error'] = f"收益统计超过 {budget} 秒未完成"
+                timed_out += 1
+        print(f"收益统计完成 {len(jobs) - timed_out}/{len(jobs)} 个账号，耗时 {time.time() - started:.1f} 秒"
+              + (f"，{timed_out} 个账号超出时间预算，汇总中不含统计" if timed_out else ""))
+    finally:
+        if EVENT_LOOP is None:
+            await SESSION_POOL.aclose_loop()
+
+def collect_deferred_stats():
+    """查询已登记账号的收益统计"""
+    jobs = list(DEFERRED_STATS)
+    DEFERRED_STATS.clear()
+    if jobs:
+        run_coroutine(async_collect_stats(jobs))
+
+def _stats_brief(r):
+    """汇总通知中账号的收益统计摘要"""
+    if r['status'] != 'success':
+        return ""
+    stats = r.get('stats')
+    if stats:
+        return f"（{stats['period']}签到 {stats['days_count']} 天，共 {stats['total_amount']} 个鸡腿）"
+    if r.get('stats_error'):
+        return f"（收益统计未完成: {r['stats_error']}）"
+    return ""
+
+# ---------------- 批量登录 ----------------
+def batch_login_with_captcha(site_name, site_config, accounts):
+    """批量解决验证码并登录，成功的账号保存Cookie并记录有效性"""
+    solver = create_turnstile_solver()
+    if solver is None:
+        return
+        
+    by_index = {account['index']: account for account in accounts}
+    tasks = [{
+        "key": account['index'],
+        "url": site_config["login_url"],
+        "sitekey": site_config["sitekey"],
+        "priority": account.get('login_priority', LoginScheduler.EXPIRED_COOKIE),
+        "trace": {"account": account['index']}
+    } for account in accounts]
+    
+    def open_account_session(index):
+        set_trace_context(account=index)
+        return open_login_session(site_config)
+
+    # 解题期间并行打开各账号的登录会话，令牌有效期较短，每拿到一个立即提交登录
+    executor = ThreadPoolExecutor(max_workers=min(8, len(accounts)))
+    sessions = {
+        index: executor.submit(contextvars.copy_context().run, open_account_session, index)
+        for index in by_index
+    }
+    try:
+        for index, token, error in solver.solve_many(tasks):
+            account = by_index[index]
+            # 之后的登录提交和 Cookie 验证记在该账号下
+            set_trace_context(account=index)
+            session_future = sessions.pop(index)
+            new_cookie = None
+            try:
+                if error:
+                    print(f"{account['display']} 验证码解决失败: {error}")
                 else:
-                    print(f"统计查询失败: {stats_msg}")
-
-                site_results.append({
-                    'account': display_user,
-                    'status': 'success',
-                    'message': msg,
-                    'stats': stats
-                })
+                    try:
+                        with TRACER.span("login", account=index, batch=True) as span:
+                            session = session_future.result()
+                            if session is not None:
+                                new_cookie = submit_login(
+                                    site_config, session, account['username'], account['password'], token
+                                )
+                            span.set(ok=bool(new_cookie))
+                    except Exception as e:
+                        print(f"{account['display']} 登录过程中出错: {e}")
+            finally:
+                close_login_session(session_future)
+        
+            if new_cookie:
+                save_cookie(site_name, new_cookie, index)
+                VALIDITY_CACHE.record(validity_key(site_name, index), new_cookie, True, "login")
             else:
-                print(f"{display_user} 签到失败: {msg}")
-                site_results.append({
-                    'account': display_user,
-                    'status': 'failed',
-                    'message': msg,
-                    'stats': None
-                })
-    else:
-        # 如果没有 Cookie，再读取用户名/密码配置
-        usernames, passwords = parse_accounts_from_env(site_config)
-        if not usernames:
-            print(f"未检测到 {site_config['name']} 的账号配置，也没有 Cookie，跳过。")
+                print(f"{account['display']} 批量登录失败")
+                account['batch_login_failed'] = True
+    finally:
+        # 解题中途出错时，未用到的会话同样关闭
+        executor.shutdown(wait=False, cancel_futures=True)
+        for session_future in sessions.values():
+            close_login_session(session_future)
+
+async def async_batch_login(site_name, site_config, accounts, semaphore):
+    """
+    签到前统一登录 Cookie 缺失或失效的账号
+    
+    需要登录的账号不少于两个时，通过 solve_many 一次性提交全部验证码任务，
+    总耗时接近一次验证码的时间，而不是逐个账号等待
+    """
+    optimistic = env_bool("SIGN_OPTIMISTIC")
+    
+    async def needs_login(account):
+        set_trace_context(account=account['index'])
+        # 其他进程正在处理的账号不参与批量登录，之后单独处理时等待其完成并复用 Cookie
+        lease = LEASES.try_acquire(site_name, account['key'])
+        if lease is None:
+            return False
+        leases.append(lease)
+        cookie_str = load_saved_cookie(site_name, account['index'])
+        if not cookie_str:
+            account['login_priority'] = LoginScheduler.MISSING_COOKIE
+            return True
+        key = validity_key(site_name, account['index'])
+        if optimistic or VALIDITY_CACHE.is_fresh(key, cookie_str):
+            return False
+        async with semaphore:
+            try:
+                valid = await async_check_cookie_validity(site_config, cookie_str)
+            except RateLimitedError:
+                # 检查被限流时不参与批量登录，之后单独处理
+                return False
+        VALIDITY_CACHE.record(key, cookie_str, valid)
+        return not valid
+    
+    candidates = [account for account in accounts if account['source'] == 'password']
+    if len(candidates) < 2:
+        return
+    # 批量登录期间持有各账号的租约，避免其他进程同时为同一账号解题
+    leases = []
+    try:
+        flags = await asyncio.gather(*(needs_login(account) for account in candidates))
+        pending = [account for account, flag in zip(candidates, flags) if flag]
+        if len(pending) < 2:
             return
-            
-        print(f"共检测到 {len(usernames)} 个账号，使用账号密码登录")
 
-        for i, (username, password) in enumerate(zip(usernames, passwords), start=1):
-            display_user = f"{username} (账号{i})"
+        print(f"\n{site_config['name']} 共 {len(pending)} 个账号需要登录，批量解决验证码...")
+        await asyncio.to_thread(batch_login_with_captcha, site_name, site_config, pending)
+    finally:
+        for lease in leases:
+            lease.release()
+
+# ---------------- 分阶段流水线 ----------------
+# 登录阶段每批最多合并的账号数量
+LOGIN_BATCH_SIZE = 50
+
+def build_account_pipeline(site_name, site_config, ns_random, concurrency):
+    """
+    构建账号处理流水线：检查 Cookie → 登录（验证码）→ 签到，收益统计在签到完成后统一进行
+
+    Cookie 有效的账号检查后直接进入签到阶段，不会被其他账号的验证码登录拖住；
+    登录阶段把同时排队的账号合并为一批，通过 solve_many 一起解题；
+    检查或签到被限流（429、Cloudflare 质询）的账号退避后回到原阶段重新排队
+    """
+    optimistic = env_bool("SIGN_OPTIMISTIC")
+
+    def requeue(item, stage, error):
+        """被限流的账号按退避和 Retry-After 等待后回到 stage 重新排队，超过重试次数时失败"""
+        account = item['account']
+        attempt = item['throttled'] = item.get('throttled', 0) + 1
+        delay = throttle_delay(account['display'], attempt, error, error.retry_after)
+        if delay is None:
+            item['result'] = account_result(account['display'], 'failed', f"被限流: {error}")
+            return None
+        TRACER.record("requeue", time.time(), 0, site=site_name, account=account['index'], stage=stage)
+        return stage, delay
+
+    async def check(item):
+        account = item['account']
+        display_user = account['display']
+        set_trace_context(site=site_name, account=account['index'])
+        if item.get('lease') is None:
+            item['started'] = time.time()
+            item['lease'] = await asyncio.to_thread(LEASES.acquire, site_name, account['key'])
+            if item['lease'].contended:
+                # 等待期间其他进程可能已完成签到或刷新了 Cookie
+                done = completed_account_result(site_name, account)
+                if done is not None:
+                    print(f"{display_user} 已由其他进程完成签到，跳过")
+                    item.update(result=done, journaled=True)
+                    return None
+                reuse_refreshed_cookie(site_name, account, item['lease'].waited_since)
             print(f"\n==== {site_config['name']} {display_user} 开始签到 ====")
+        try:
+            return await check_cookie(item)
+        except RateLimitedError as e:
+            return requeue(item, "check", e)
 
-            # 优先使用已存在的 cookie 文件
-            cookie_str = load_cookies_from_file(site_name, i)
-            if cookie_str:
-                print(f"{display_user} 从文件加载 Cookie 成功，检查有效性...")
-                if not check_cookie_validity(site_config, cookie_str):
-                    print(f"{display_user} Cookie 无效，尝试自动登录...")
-                    new_cookie = get_valid_cookie(site_config, username, password, i)
-                    if not new_cookie:
-                        print(f"{display_user} 登录失败，跳过")
-                        site_results.append({
-                            'account': display_user,
-                            'status': 'failed',
-                            'message': 'Cookie失效且自动登录失败',
-                            'stats': None
-                        })
-                        continue
-                    cookie_str = new_cookie
-            else:
-                print(f"{display_user} 未找到 Cookie 文件，需重新登录")
-                new_cookie = get_valid_cookie(site_config, username, password, i)
-                if not new_cookie:
-                    print(f"{display_user} 登录失败，跳过")
-                    site_results.append({
-                        'account': display_user,
-                        'status': 'failed',
-                        'message': 'Cookie失效且自动登录失败',
-                        'stats': None
-                    })
+    async def check_cookie(item):
+        account = item['account']
+        display_user = account['display']
+        if account['source'] == 'cookie':
+            item.update(cookie=account['cookie'], trusted=optimistic)
+            # 乐观模式下先直接签到，失败时再检查
+            if not optimistic and not await async_check_cookie_validity(site_config, account['cookie']):
+                print(f"{display_user} Cookie 无效，跳过")
+                item['result'] = account_result(display_user, 'failed', '无效 Cookie')
+                return None
+            return "sign"
+        cookie_str, trusted = await async_check_saved_cookie(site_name, site_config, account, optimistic)
+        if cookie_str:
+            item.update(cookie=cookie_str, trusted=trusted)
+            return "sign"
+        return "login"
+
+    async def login(items):
+        accounts = [item['account'] for item in items]
+        if len(items) >= 2:
+            print(f"\n{site_config['name']} 共 {len(items)} 个账号需要登录，批量解决验证码...")
+            # 批量登录中各账号的 span 由 batch_login_with_captcha 分别带上账号
+            set_trace_context(site=site_name, account=None)
+            await asyncio.to_thread(batch_login_with_captcha, site_name, site_config, accounts)
+        routes = []
+        for item, account in zip(items, accounts):
+            set_trace_context(site=site_name, account=account['index'])
+            cookie_str = load_saved_cookie(site_name, account['index'])
+            key = validity_key(site_name, account['index'])
+            if len(items) < 2 or not (cookie_str and VALIDITY_CACHE.is_fresh(key, cookie_str)):
+                # 单个账号或批量登录未能完成（如没有可用的批量解题服务）时逐个登录
+                try:
+                    cookie_str = await async_login_cookie(site_name, site_config, account)
+                except RateLimitedError as e:
+                    # 登录前的 Cookie 检查被限流，退避后再登录，不急于解题
+                    routes.append(requeue(item, "login", e))
                     continue
-                cookie_str = new_cookie
-                
-            # 开始签到
-            result, msg = sign(cookie_str, site_config, ns_random)
-
-            if result in ["success", "already"]:
-                print(f"{display_user} 签到成功: {msg}")
-                stats, stats_msg = get_signin_stats(cookie_str, site_config, 30)
-                if stats:
-                    print_signin_stats(stats, display_user)
-                else:
-                    print(f"统计查询失败: {stats_msg}")
-
-                site_results.append({
-                    'account': display_user,
-                    'status': 'success',
-                    'message': msg,
-                    'stats': stats
-                })
-            else:
-                print(f"{display_user} 签到失败: {msg}")
-                site_results.append({
-                    'account': display_user,
-                    'status': 'failed',
-                    'message': msg,
-                    'stats': None
-                })
+            if not cookie_str:
+                print(f"{account['display']} 登录失败，跳过")
+                item['result'] = account_result(account['display'], 'failed', 'Cookie失效且自动登录失败')
+                routes.append(None)
+                continue
+            item.update(cookie=cookie_str, trusted=False)
+            routes.append("sign")
+        return routes
 
-    # 汇总通知
-    if hadsend and should_send_notification(site_name):
+    async def sign_stage(item):
+        account = item['account']
+        display_user = account['display']
+        set_trace_context(site=site_name, account=account['index'])
+        cookie_str = item['cookie']
+        try:
+            result, msg = await async_sign(cookie_str, site_config, ns_random)
+            if item['trusted'] and result in ["invalid", "error"]:
+                # 跳过检查的 Cookie 签到失败时就地兜底，流水线只向后流转
+                cookie_str, result, msg = await async_recover_sign(
+                    site_name, site_config, account, cookie_str, result, msg, ns_random
+                )
+                if not cookie_str:
+                    item['result'] = account_result(display_user, 'failed', msg)
+                    return None
+                # 兜底后的 Cookie 已经确认过，重新排队时不再兜底
+                item.update(cookie=cookie_str, trusted=False)
+        except RateLimitedError as e:
+            return requeue(item, "sign", e)
+        if result not in ["success", "already"]:
+            item['result'] = _sign_failed_result(display_user, msg)
+            return None
+        # 收益统计不在签到关键路径上，登记后在所有站点签到完成后统一查询
+        item['result'] = _finish_signed(site_name, site_config, account, cookie_str, result, msg)
+        return None
+
+    def on_error(item, error):
+        item['result'] = _sign_failed_result(item['account']['display'], str(error))
+
+    def on_done(item):
+        account, result = item['account'], item['result']
+        started = item.get('started', time.time())
+        TRACER.record(
+            "account", started, time.time() - started, site=site_name, account=account['index'],
+            source=account['source'], result=result['status'], outcome=result['sign_result'] or result['status']
+        )
+        # 每个账号结束后立即写入完成日志，进程中途被杀时下次运行可以从未完成的账号继续
+        if not item.get('journaled'):
+            record_account_result(site_name, account, result)
+        if item.get('lease') is not None:
+            item['lease'].release()
+
+    login_batch = LOGIN_BATCH_SIZE if env_bool("CAPTCHA_BATCH", True) else 1
+    login_workers = get_stage_workers("login", 2)
+    return Pipeline([
+        Stage("check", check, get_stage_workers("check", concurrency)),
+        # 登录队列至少容纳一整批，否则每批的账号数被队列容量限制
+        Stage("login", login, login_workers, queue_size=max(login_batch, login_workers * 2),
+              batch=login_batch, linger=0.5 if login_batch > 1 else 0),
+        Stage("sign", sign_stage, get_stage_workers("sign", concurrency)),
+    ], on_done, on_error)
+
+def report_pipeline(site_name, pipeline):
+    """打印流水线各阶段统计并写入运行记录"""
+    print(f"\n流水线统计（耗时 {pipeline.elapsed:.2f} 秒）:")
+    for line in pipeline.describe():
+        print(line)
+    finished_at = time.time()
+    for stage, stats in pipeline.stats().items():
+        TRACER.record("pipeline_stage", finished_at - pipeline.elapsed, pipeline.elapsed,
+                      site=site_name, stage=stage, **stats)
+
+async def async_process_accounts(site_name, site_config, accounts, ns_random, concurrency):
+    """通过分阶段流水线处理站点下的全部账号，结果顺序与账号顺序一致"""
+    pipeline = build_account_pipeline(site_name, site_config, ns_random, concurrency)
+    items = [{'account': account, 'result': None} for account in accounts]
+    # 按账号把开始时间分散到 SIGN_SPREAD 秒内，避免大量账号同一时刻请求签到接口
+    window = env_int("SIGN_SPREAD", 0)
+    try:
+        await pipeline.run(items, delay=lambda item: spread_offset(item['account']['key'], window))
+    finally:
+        VALIDITY_CACHE.save()
+        # 异步会话绑定在本次事件循环上，结束时一并关闭；共用事件循环时留给后续阶段
+        if EVENT_LOOP is None:
+            await SESSION_POOL.aclose_loop()
+    report_pipeline(site_name, pipeline)
+    return [item['result'] for item in items]
+
+def run_coroutine(coro):
+    """运行协程，有共用事件循环时在其中运行"""
+    if EVENT_LOOP is None:
+        return asyncio.run(coro)
+    return EVENT_LOOP.run_until_complete(coro)
+
+@contextlib.contextmanager
+def shared_event_loop():
+    """
+    本次运行的各阶段（签到、收益统计）共用一个事件循环，异步会话的连接在阶段之间保持，结束时关闭
+
+    守护进程模式下已有常驻事件循环，直接沿用
+    """
+    global EVENT_LOOP
+    if EVENT_LOOP is not None:
+        yield
+        return
+    EVENT_LOOP = asyncio.new_event_loop()
+    asyncio.set_event_loop(EVENT_LOOP)
+    try:
+        yield
+    finally:
+        loop, EVENT_LOOP = EVENT_LOOP, None
+        try:
+            loop.run_until_complete(SESSION_POOL.aclose_loop())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+# ---------------- 汇总通知 ----------------
+def send_site_summary(site_name, site_config, site_results, shard_label=None):
+    """发送站点签到汇总通知（每天一次），分片单独通知时标题带上分片序号"""
+    notify_key = site_name if shard_label is None else f"{site_name}-shard{SHARD_PLAN.index}"
+    if hadsend and should_send_notification(notify_key):
         success_count = len([r for r in site_results if r['status'] == 'success'])
         failed_count = len([r for r in site_results if r['status'] != 'success'])
-        msg = f"{site_config['name']} 签到汇总：成功 {success_count} 个，失败 {failed_count} 个\n"
+        name = site_config['name'] if shard_label is None else f"{site_config['name']} {shard_label}"
+        msg = f"{name} 签到汇总：成功 {success_count} 个，失败 {failed_count} 个\n"
         for r in site_results:
-            msg += f"\n{r['account']}: {r['message']}"
-        send(f"{site_config['name']} 签到结果", msg)
-        mark_notification_sent(site_name)
+            msg += f"\n{r['account']}: {r['message']}{_stats_brief(r)}"
+        captcha_status = SOLVER_REGISTRY.summary()
+        if LOGIN_SCHEDULER.stats()["admitted"]:
+            captcha_status.append(LOGIN_SCHEDULER.describe())
+        if captcha_status:
+            msg += "\n\n验证码服务状态:\n" + "\n".join(captcha_status)
+        with TRACER.span("notify"):
+            send(f"{name} 签到结果", msg)
+        mark_notification_sent(notify_key)
 
-# ---------------- 主流程 ----------------
-if __name__ == "__main__":
-    ns_random = os.getenv("NS_RANDOM", "true")
+def send_shard_summary(site_name, site_config, accounts, site_results):
+    """
+    分片模式下的汇总通知
 
-    env_type = detect_environment()
-    print(f"当前运行环境: {env_type}")
-    print("NS_DF 多账户签到脚本启动")
+    配置了 SHARD_SUMMARY_DIR 时写入本分片结果，所有分片都完成后由最后完成的分片发送合并通知；
+    未配置或写入失败时各分片单独发送带分片序号的通知
+    """
+    if SHARD_BOARD is not None:
+        run_date = journal_date()
+        try:
+            SHARD_BOARD.publish(site_name, run_date, SHARD_PLAN, [
+                dict(result, index=account['index']) for account, result in zip(accounts, site_results)
+            ])
+            merged = SHARD_BOARD.collect(site_name, run_date, SHARD_PLAN.count)
+            if merged is None:
+                missing = [i + 1 for i in SHARD_BOARD.missing(site_name, run_date, SHARD_PLAN.count)]
+                print(f"{SHARD_PLAN.label} 结果已写入，等待分片 {missing} 完成后发送合并通知")
+                return
+            if hadsend and SHARD_BOARD.claim(site_name, run_date):
+                print(f"所有 {SHARD_PLAN.count} 个分片已完成，发送合并通知")
+                send_site_summary(site_name, site_config, merged)
+            return
+        except OSError as e:
+            print(f"写入分片汇总失败: {e}，改为单独发送本分片通知")
+    send_site_summary(site_name, site_config, site_results, SHARD_PLAN.label)
+
+# ---------------- 完成日志 ----------------
+def journal_date():
+    """完成日志按论坛签到日（上海时间）划分"""
+    return datetime.now(ZoneInfo("Asia/Shanghai")).strftime('%Y-%m-%d')
+
+def record_account_result(site_name, account, result):
+    """把单个账号本次运行的结果追加到完成日志，立即提交"""
+    STATE.record_result(
+        TRACER.run_id, journal_date(), site_name, account['index'], result['account'],
+        result['status'], result.get('sign_result'), result['message'],
+        account_key=account['key'], immediate=True
+    )
+
+def _completed_result(account, entry):
+    finished = datetime.fromtimestamp(entry['finished_at'], ZoneInfo("Asia/Shanghai")).strftime('%H:%M')
+    return account_result(account['display'], 'success', f"今日已于 {finished} 完成签到，跳过", sign_result='already')
+
+def completed_account_result(site_name, account):
+    """单个账号当天的完成记录，没有时返回 None"""
+    if not env_bool("SIGN_JOURNAL", True):
+        return None
+    entry = STATE.completed_accounts(journal_date(), site_name).get(account['key'])
+    return _completed_result(account, entry) if entry else None
+
+def split_completed_accounts(site_name, accounts):
+    """
+    按当天的完成日志拆分账号
+
+    返回 (待处理账号, {账号序号: 已完成账号的汇总结果})；
+    已签到成功或当天已签到过的账号不再发起任何请求
+    """
+    if not env_bool("SIGN_JOURNAL", True):
+        return accounts, {}
+    completed = STATE.completed_accounts(journal_date(), site_name)
+    pending, skipped = [], {}
+    for account in accounts:
+        entry = completed.get(account['key'])
+        if entry is None:
+            pending.append(account)
+            continue
+        skipped[account['index']] = _completed_result(account, entry)
+    if skipped:
+        print(f"完成日志中今日已有 {len(skipped)} 个账号签到完成，跳过；剩余 {len(pending)} 个账号")
+    return pending, skipped
+
+# ---------------- 处理单个站点 ----------------
+def process_site(site_name, site_config, ns_random):
+    """站点签到逻辑：签到、收益统计、汇总通知"""
+    CREDIT_CACHE.clear()
+    with shared_event_loop():
+        signed = sign_site(site_name, site_config, ns_random)
+        if signed is None:
+            return None
+        accounts, site_results = signed
+        collect_deferred_stats()
+
+    # 汇总通知
+    send_summary(site_name, site_config, accounts, site_results)
+    return site_results
+
+def sign_site(site_name, site_config, ns_random):
+    """
+    站点签到，不查询收益统计也不发送通知
+
+    返回 (账号列表, 账号结果列表)，没有配置账号时返回 None
+    """
+    print(f"\n{'='*50}")
+    print(f"开始处理 {site_config['name']} 站点")
+    print(f"{'='*50}")
     
-    # 处理所有配置的站点
+    accounts = select_site_accounts(site_name, site_config)
+    if accounts is None:
+        return None
+    set_trace_context(site=site_name)
+    pending, skipped = split_completed_accounts(site_name, accounts)
+
+    processed = {}
+    if pending:
+        # 未开启异步模式时并发数为 1，流水线各阶段每次只处理一个账号
+        concurrency = 1
+        if env_bool("SIGN_ASYNC"):
+            concurrency = get_site_concurrency(site_config)
+            print(f"使用异步模式处理 {len(pending)} 个账号，并发数: {concurrency}")
+        if env_int("SIGN_SPREAD", 0) > 0:
+            print(f"各账号签到时间分散在 {env_int('SIGN_SPREAD', 0)} 秒内")
+        pending_results = run_coroutine(
+            async_process_accounts(site_name, site_config, pending, ns_random, concurrency)
+        )
+        processed = {account['index']: result for account, result in zip(pending, pending_results)}
+    site_results = [skipped.get(a['index']) or processed[a['index']] for a in accounts]
+    return accounts, site_results
+
+def select_site_accounts(site_name, site_config):
+    """站点需要处理的账号，分片模式下只保留当前分片的账号"""
+    accounts = build_site_accounts(site_name, site_config)
+    if accounts is not None and SHARD_PLAN.enabled:
+        total = len(accounts)
+        accounts = SHARD_PLAN.select(accounts)
+        print(f"{SHARD_PLAN.label}: 本分片处理 {len(accounts)}/{total} 个账号")
+    return accounts
+
+def send_summary(site_name, site_config, accounts, site_results):
+    """发送站点汇总通知，分片模式下按分片方式汇总"""
+    if SHARD_PLAN.enabled:
+        send_shard_summary(site_name, site_config, accounts, site_results)
+    else:
+        send_site_summary(site_name, site_config, site_results)
+
+# ---------------- 零点签到 ----------------
+async def _prepare_midnight_account(site_name, site_config, account, semaphore):
+    """零点前确认账号 Cookie 可用（失效时登录），返回 Cookie，无法获取时返回 None"""
+    async with semaphore:
+        set_trace_context(site=site_name, account=account['index'])
+        try:
+            if account['source'] == 'cookie':
+                valid = await async_check_cookie_validity(site_config, account['cookie'])
+                return account['cookie'] if valid else None
+            cookie_str, _ = await async_prepare_login_cookie(site_name, site_config, account)
+            return cookie_str
+        except Exception as e:
+            print(f"{account['display']} 准备 Cookie 出错: {e}")
+            return None
+
+async def _warm_request(entry):
+    """直接向站点发一次收益第一页请求，不经过本次运行的检查缓存，确保请求真正发出"""
+    site_config = entry['site_config']
+    set_trace_context(site=entry['site_name'], account=entry['account']['index'])
+    with TRACER.span("keepalive") as span:
+        response = await SESSION_POOL.async_request(
+            "GET", f"{site_config['stats_api']}1", headers=_probe_headers(site_config, entry['cookie'])
+        )
+        span.set_response(response)
+
+async def _keep_connections_warm(ready, reset_at, interval=20):
+    """零点前每隔一段时间向各站点发一次轻量请求，保持连接不被服务端空闲关闭，最后一次在零点前 2 秒"""
+    by_site = {}
+    for entry in ready:
+        by_site.setdefault(entry['site_name'], entry)
+    while True:
+        remaining = reset_at - time.time()
+        if remaining <= 2:
+            return
+        await asyncio.sleep(min(interval, remaining - 2))
+        await asyncio.gather(*(_warm_request(entry) for entry in by_site.values()), return_exceptions=True)
+
+async def _midnight_sign(entry, reset_at, ns_random, semaphore, retry_window=3.0):
+    """
+    零点签到单个账号，记录发出和完成时相对零点的偏移
+
+    零点刚过时服务端时钟可能略慢，仍返回“已完成签到”时短暂重试
+    """
+    site_config = entry['site_config']
+    attempt = 0
+    while True:
+        error = None
+        async with semaphore:
+            set_trace_context(site=entry['site_name'], account=entry['account']['index'])
+            fired = time.time()
+            try:
+                result, msg = await async_sign(entry['cookie'], site_config, ns_random)
+            except RateLimitedError as e:
+                error = e
+                result, msg = "throttled", str(e)
+        if result == "already" and time.time() - reset_at < retry_window:
+            await asyncio.sleep(0.2)
+        elif error is not None:
+            # 被限流时按退避和 Retry-After 等待后重试，等待期间不占用集中签到的并发名额
+            attempt += 1
+            delay = throttle_delay(entry['account']['display'], attempt, msg, error.retry_after)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        else:
+            break
+    entry.update(result=result, msg=msg, error=error, fired=fired - reset_at, done=time.time() - reset_at)
+
+async def async_run_midnight(plans, reset_at, ns_random):
+    """
+    零点签到流程：零点前准备 Cookie 并预热连接，零点后集中签到，再统计收益
+
+    返回 {站点: 账号结果列表}
+    """
+    ready, deferred = [], []
+    for site_name, site_config, accounts in plans:
+        set_trace_context(site=site_name)
+        semaphore = asyncio.Semaphore(get_site_concurrency(site_config))
+        if env_bool("CAPTCHA_BATCH", True):
+            await async_batch_login(site_name, site_config, accounts, semaphore)
+        # 其他进程正在处理的账号不参与集中签到，零点后按普通流程等待其完成
+        leases = {account['index']: LEASES.try_acquire(site_name, account['key']) for account in accounts}
+        owned = [account for account in accounts if leases[account['index']] is not None]
+        cookies = await asyncio.gather(*(
+            _prepare_midnight_account(site_name, site_config, account, semaphore) for account in owned
+        ))
+        for account, cookie_str in zip(owned, cookies):
+            lease = leases[account['index']]
+            if cookie_str:
+                ready.append({'site_name': site_name, 'site_config': site_config, 'account': account,
+                              'cookie': cookie_str, 'lease': lease})
+            else:
+                lease.release()
+                deferred.append((site_name, account))
+        deferred.extend((site_name, account) for account in accounts if leases[account['index']] is None)
+    VALIDITY_CACHE.save()
+
+    lead = reset_at - time.time()
+    print(f"\n零点签到准备完成: {len(ready)} 个账号就绪，{len(deferred)} 个账号零点后按普通流程处理，"
+          f"距离零点 {max(lead, 0):.1f} 秒")
+    await _keep_connections_warm(ready, reset_at)
+    target = reset_at + env_int("SIGN_MIDNIGHT_DELAY_MS", 0) / 1000
+    await sleep_until(target)
+
+    burst = asyncio.Semaphore(max(1, env_int("SIGN_BURST_CONCURRENCY", 50)))
+    await asyncio.gather(*(_midnight_sign(entry, reset_at, ns_random, burst) for entry in ready))
+    for entry in ready:
+        print(f"{entry['account']['display']}: 发出 {entry['fired'] * 1000:+.0f}ms，"
+              f"完成 {entry['done'] * 1000:+.0f}ms，结果 {entry['result']}")
+    if ready:
+        offsets = sorted(entry['done'] for entry in ready)
+        print(f"零点签到完成 {len(ready)} 个账号，完成偏移 最早 {offsets[0] * 1000:+.0f}ms，"
+              f"中位 {offsets[len(offsets) // 2] * 1000:+.0f}ms，最晚 {offsets[-1] * 1000:+.0f}ms")
+
+    # 零点后统计收益；集中签到失败的账号释放租约后与未就绪的账号一起走普通流程
+    results = {}
+    semaphores = {site_name: asyncio.Semaphore(get_site_concurrency(site_config)) for site_name, site_config, _ in plans}
+
+    async def settle(entry):
+        """记录集中签到的结果，签到失败需要走普通流程时返回 None"""
+        site_name, account = entry['site_name'], entry['account']
+        if entry['result'] == "throttled":
+            # 已按 RATE_LIMIT_RETRIES 退避重试过，不再走普通流程重复重试
+            result = _throttled_result(account['display'], entry['error'])
+            record_account_result(site_name, account, result)
+            return result
+        if entry['result'] not in ["success", "already"]:
+            return None
+        async with semaphores[site_name]:
+            set_trace_context(site=site_name, account=account['index'])
+            result = _finish_signed(
+                site_name, entry['site_config'], account, entry['cookie'], entry['result'],
+                f"{entry['msg']}（零点后 {entry['done']:.3f} 秒完成）"
+            )
+            record_account_result(site_name, account, result)
+            return result
+
+    async def finish(entry):
+        try:
+            result = await settle(entry)
+        finally:
+            entry['lease'].release()
+        if result is None:
+            # 普通流程会重新获取租约，先释放再进入
+            result = await async_process_account(
+                entry['site_name'], entry['site_config'], entry['account'], ns_random, semaphores[entry['site_name']]
+            )
+        return result
+
+    site_configs = {site_name: site_config for site_name, site_config, _ in plans}
+    finished = await asyncio.gather(
+        *(finish(entry) for entry in ready),
+        *(async_process_account(site_name, site_configs[site_name], account, ns_random, semaphores[site_name])
+          for site_name, account in deferred)
+    )
+    keys = [(e['site_name'], e['account']['index']) for e in ready] + [(n, a['index']) for n, a in deferred]
+    for (site_name, index), result in zip(keys, finished):
+        results.setdefault(site_name, {})[index] = result
+    VALIDITY_CACHE.save()
+    if EVENT_LOOP is None:
+        await SESSION_POOL.aclose_loop()
+    return results
+
+def run_midnight(ns_random):
+    """
+    零点签到模式
+
+    在零点前 SIGN_MIDNIGHT_WINDOW 分钟内启动时生效，否则返回 False，由调用方按普通流程签到
+    """
+    reset_at = next_reset()
+    lead = reset_at - time.time()
+    if lead > env_int("SIGN_MIDNIGHT_WINDOW", 15) * 60:
+        print(f"距离零点还有 {lead / 60:.0f} 分钟，超过 SIGN_MIDNIGHT_WINDOW，按普通流程签到")
+        return False
+    print(f"零点签到模式：距离零点 {lead:.1f} 秒，开始准备 Cookie 和连接")
+    CREDIT_CACHE.clear()
+    plans = []
+    for site_name, site_config in SITES_CONFIG.items():
+        print(f"\n{'='*50}")
+        print(f"准备 {site_config['name']} 站点")
+        print(f"{'='*50}")
+        accounts = select_site_accounts(site_name, site_config)
+        if accounts:
+            plans.append((site_name, site_config, accounts))
+    results = run_coroutine(async_run_midnight(plans, reset_at, ns_random))
+    collect_deferred_stats()
+    for site_name, site_config, accounts in plans:
+        site_results = [results[site_name][account['index']] for account in accounts]
+        try:
+            send_summary(site_name, site_config, accounts, site_results)
+        except Exception as e:
+            print(f"发送 {site_config['name']} 汇总通知时发生异常: {e}")
+    return True
+
+# ---------------- 连接复用统计 ----------------
+def print_connection_stats():
+    """打印各站点连接新建/复用次数"""
+    for origin, stats in SESSION_POOL.connection_stats().items():
+        print(f"{origin} 连接统计: 新建 {stats['new']} 次，复用 {stats['reused']} 次，HTTP/2 请求 {stats['http2']} 次")
+
+def print_rate_limit_stats():
+    """打印被限流或限速等待过的站点"""
+    for origin, stats in SESSION_POOL.limiter.summary().items():
+        if not stats['throttled'] and not stats['waited']:
+            continue
+        rate = "不限速" if stats['rate'] == float("inf") else f"{stats['rate']:.2f} 次/秒"
+        print(f"{origin} 限流统计: 被限流 {stats['throttled']} 次，累计限速等待 {stats['waited']:.1f} 秒，当前速率 {rate}")
+
+def print_trace_summary():
+    """打印各阶段耗时汇总"""
+    for phase, stats in TRACER.summary().items():
+        print(f"阶段 {phase}: {stats['count']} 次，p50 {stats['p50'] * 1000:.0f}ms，"
+              f"p95 {stats['p95'] * 1000:.0f}ms，最长 {stats['max'] * 1000:.0f}ms")
+    if TRACER.path:
+        print(f"运行记录已保存到 {TRACER.path}")
+    TRACER.close()
+
+# ---------------- 主流程 ----------------
+# ---------------- 运行入口 ----------------
+def run_all_sites(ns_random):
+    """处理所有配置的站点，各站点的签到和收益统计在同一个事件循环中运行"""
+    with shared_event_loop():
+        _run_all_sites(ns_random)
+
+def _run_all_sites(ns_random):
+    if env_bool("SIGN_MIDNIGHT") and run_midnight(ns_random):
+        return
+    # 先完成所有站点的签到，收益统计和汇总通知放到最后
+    CREDIT_CACHE.clear()
+    DEFERRED_STATS.clear()
+    signed = []
     for site_name, site_config in SITES_CONFIG.items():
         try:
-            process_site(site_name, site_config, ns_random)
+            result = sign_site(site_name, site_config, ns_random)
+            if result is not None:
+                signed.append((site_name, site_config) + result)
         except Exception as e:
             print(f"处理 {site_config['name']} 站点时发生异常: {e}")
-    
+    try:
+        collect_deferred_stats()
+    except Exception as e:
+        print(f"查询收益统计时发生异常: {e}")
+    for site_name, site_config, accounts, site_results in signed:
+        try:
+            send_summary(site_name, site_config, accounts, site_results)
+        except Exception as e:
+            print(f"发送 {site_config['name']} 汇总通知时发生异常: {e}")
+
+def report_run(run_started):
+    """打印本轮运行统计并写入指标"""
     print(f"\n{'='*50}")
     print("所有站点处理完成")
-    print(f"{'='*50}")
\ No newline at end of file
+    print(f"{'='*50}")
+    print_connection_stats()
+    print_rate_limit_stats()
+    for line in SOLVER_REGISTRY.summary():
+        print(f"验证码服务 {line}")
+    if LOGIN_SCHEDULER.stats()["admitted"]:
+        print(LOGIN_SCHEDULER.describe())
+    print_trace_summary()
+    STATE.flush()
+    if METRICS_EXPORTER is not None:
+        METRICS_EXPORTER.write(time.time() - run_started)
+
+def run_daemon():
+    """
+    守护进程模式
+
+    按 DAEMON_TIMES 每天定时签到，会话连接、事件循环、状态库连接和 Cookie 有效性缓存在各轮之间保留，
+    .env 修改后自动重新加载（账号、并发等每轮读取的配置立即生效）
+    """
+    global EVENT_LOOP
+    EVENT_LOOP = asyncio.new_event_loop()
+    asyncio.set_event_loop(EVENT_LOOP)
+
+    def run():
+        # 每轮单独统计耗时、指标和验证码调度
+        TRACER.rotate()
+        if METRICS_EXPORTER is not None:
+            METRICS_EXPORTER.reset()
+        LOGIN_SCHEDULER.reset_stats()
+        SOLVER_REGISTRY.reset()
+        run_started = time.time()
+        print(f"\n{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} 开始本轮签到")
+        run_all_sites(os.getenv("NS_RANDOM", "true"))
+        report_run(run_started)
+
+    daemon = SignDaemon(
+        run,
+        lambda: DailySchedule.parse(os.getenv("DAEMON_TIMES", "00:05")),
+        EnvFileWatcher(find_dotenv()),
+        run_on_start=env_bool("DAEMON_RUN_ON_START", True)
+    )
+    try:
+        daemon.run_forever()
+    finally:
+        EVENT_LOOP.run_until_complete(SESSION_POOL.aclose_loop())
+        EVENT_LOOP.close()
+        SESSION_POOL.close()
+        STATE.close()
+
+if __name__ == "__main__":
+    env_type = detect_environment()
+    print(f"当前运行环境: {env_type}")
+    print("NS_DF 多账户签到脚本启动")
+    if not SHARD_PLAN.valid:
+        raise SystemExit(f"分片配置无效: SHARD_INDEX={SHARD_PLAN.index}，SHARD_COUNT={SHARD_PLAN.count}，"
+                         f"SHARD_INDEX 应在 0 到 SHARD_COUNT-1 之间")
+
+    if env_bool("SIGN_DAEMON"):
+        print("以守护进程模式运行")
+        run_daemon()
+    else:
+        run_started = time.time()
+        run_all_sites(os.getenv("NS_RANDOM", "true"))
+        report_run(run_started)
+        STATE.close()
@@ -0,0 +1,282 @@
+import argparse
+import contextlib
+import importlib.util
+import inspect
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from stub_server import StubServer
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auto-sign.py")
+
+# 阶段名称 -> 需要计时的函数名
+PHASES = {
+    "probe": ["check_cookie_validity", "async_check_cookie_validity"],
+    "login": ["auto_login_with_captcha", "batch_login_with_captcha"],
+    "sign": ["async_sign"],
+    "stats": ["async_get_signin_stats"],
+    "stats_page": ["async_fetch_credit_page"],
+    "notify": ["send"],
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class PhaseTimer:
+    """记录各阶段每次调用的耗时"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(phase, []).append(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples.clear()
+
+    def wrap(self, phase: str, func: Callable) -> Callable:
+        """包装函数，调用时记录耗时"""
+        timer = self
+
+        if inspect.iscoroutinefunction(func):
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timer.add(phase, time.perf_counter() - started)
+            return timed_async
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.add(phase, time.perf_counter() - started)
+        return timed
+
+    def instrument(self, module: Any) -> None:
+        """为签到脚本中各阶段的函数加上计时"""
+        for phase, names in PHASES.items():
+            for name in names:
+                func = getattr(module, name, None)
+                if callable(func):
+                    setattr(module, name, self.wrap(phase, func))
+
+        # 验证码求解在解决器内部，单独包装解决器的 solve 和 solve_many
+        timer = self
+        create_solver = module.create_turnstile_solver
+
+        def create_timed_solver():
+            solver = create_solver()
+            if solver is None:
+                return None
+            return TimedSolver(solver, timer)
+        module.create_turnstile_solver = create_timed_solver
+
+
+class TimedSolver:
+    """记录验证码求解耗时的解决器包装"""
+
+    def __init__(self, solver: Any, timer: PhaseTimer):
+        self.solver = solver
+        self.timer = timer
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.solver, name)
+
+    def solve(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.solver.solve(*args, **kwargs)
+        finally:
+            self.timer.add("captcha", time.perf_counter() - started)
+
+    def solve_many(self, tasks, verbose=False):
+        # 批量解题时每个任务的耗时从提交开始计算到产出令牌为止
+        started = time.perf_counter()
+        for item in self.solver.solve_many(tasks, verbose=verbose):
+            self.timer.add("captcha", time.perf_counter() - started)
+            yield item
+
+
+def load_sign_module() -> Any:
+    """加载 auto-sign.py（文件名含连字符，无法直接 import）"""
+    spec = importlib.util.spec_from_file_location("auto_sign", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def configure_env(args: argparse.Namespace, server: StubServer) -> None:
+    """根据基准参数设置签到脚本读取的环境变量，已有的调优参数（如 SIGN_CONCURRENCY）保持不变"""
+    site = args.site
+    other = "deepflood" if site == "nodeseek" else "nodeseek"
+    prefix = {"nodeseek": "NS", "deepflood": "DF"}
+    users = [f"bench{i}" for i in range(1, args.accounts + 1)]
+
+    # 显式设为空值，避免 .env 中的真实账号参与测试
+    for name in ("COOKIE", "USER", "PASS"):
+        os.environ[f"{prefix[other]}_{name}"] = ""
+    if args.mode == "cookie":
+        os.environ[f"{prefix[site]}_COOKIE"] = "&".join(f"session={StubServer.SESSION_PREFIX}{u}" for u in users)
+        os.environ[f"{prefix[site]}_USER"] = ""
+        os.environ[f"{prefix[site]}_PASS"] = ""
+    else:
+        os.environ[f"{prefix[site]}_COOKIE"] = ""
+        os.environ[f"{prefix[site]}_USER"] = "&".join(users)
+        os.environ[f"{prefix[site]}_PASS"] = "&".join("password" for _ in users)
+
+    os.environ["CLOUDFLYER_API_URL"] = server.captcha_url("cloudfreed")
+    os.environ["CLOUDFLYER_CLIENTT_KEY"] = "bench"
+    if args.yescaptcha:
+        os.environ["YESCAPTCHA_CLIENT_KEY"] = "bench"
+        os.environ["YESCAPTCHA_API_URL"] = server.captcha_url("yescaptcha")
+    else:
+        os.environ["YESCAPTCHA_CLIENT_KEY"] = ""
+    if args.sign_async:
+        os.environ["SIGN_ASYNC"] = "true"
+    # 完成日志会让同一天的后续运行直接跳过全部账号，默认关闭以测量完整的签到流程
+    os.environ.setdefault("SIGN_JOURNAL", "false")
+
+
+def summarize(run: int, elapsed: float, results: List[dict], server: StubServer, timer: PhaseTimer) -> Dict[str, Any]:
+    """整理一次运行的统计数据"""
+    statuses: Dict[str, int] = {}
+    for result in results or []:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    phases = {
+        phase: {
+            "count": len(samples),
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "total": sum(samples)
+        }
+        for phase, samples in timer.samples.items()
+    }
+    counts = server.endpoint_counts()
+    return {
+        "run": run,
+        "wall_time": elapsed,
+        "requests": sum(counts.values()),
+        "endpoints": counts,
+        "statuses": statuses,
+        "phases": phases
+    }
+
+
+def print_report(summary: Dict[str, Any]) -> None:
+    """打印一次运行的统计"""
+    statuses = "，".join(f"{k} {v}" for k, v in sorted(summary["statuses"].items())) or "无"
+    print(f"\n第 {summary['run']} 次运行: 耗时 {summary['wall_time']:.2f} 秒，"
+          f"请求 {summary['requests']} 次，结果: {statuses}")
+    print(f"  {'阶段':<12}{'次数':>6}{'p50(ms)':>12}{'p95(ms)':>12}{'合计(s)':>10}")
+    for phase in list(PHASES) + ["captcha"]:
+        stats = summary["phases"].get(phase)
+        if not stats:
+            continue
+        print(f"  {phase:<12}{stats['count']:>6}{stats['p50'] * 1000:>12.1f}"
+              f"{stats['p95'] * 1000:>12.1f}{stats['total']:>10.2f}")
+    endpoints = "，".join(f"{k} {v}" for k, v in sorted(summary["endpoints"].items()))
+    print(f"  请求明细: {endpoints}")
+
+
+def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """启动模拟服务，按参数运行 process_site 若干次并返回每次的统计"""
+    server = StubServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        ledger_size=args.ledger_size,
+        solve_time=args.solve_time,
+        captcha_slots=args.captcha_slots,
+        captcha_error_rate=args.captcha_error_rate,
+        seed=args.seed
+    ).start()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nsdf-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    summaries = []
+    try:
+        # 脚本的 Cookie、账本等状态文件写在工作目录下的 ./cookie 中
+        os.chdir(workdir)
+        configure_env(args, server)
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            module = load_sign_module()
+        # 通知不真正发出，只计时
+        module.send = lambda title, content: None
+        module.hadsend = True
+        timer = PhaseTimer()
+        timer.instrument(module)
+        site_config = server.site_config(args.site, module.SITES_CONFIG[args.site])
+        module.SITES_CONFIG[args.site] = site_config
+
+        print(f"基准测试: {args.site}，{args.accounts} 个账号（{args.mode}），工作目录 {workdir}")
+        for run in range(1, args.runs + 1):
+            if args.new_day:
+                server.new_day()
+            server.reset_counts()
+            timer.reset()
+            started = time.perf_counter()
+            if args.verbose:
+                results = module.process_site(args.site, site_config, "true")
+            else:
+                with contextlib.redirect_stdout(log):
+                    results = module.process_site(args.site, site_config, "true")
+            summary = summarize(run, time.perf_counter() - started, results, server, timer)
+            print_report(summary)
+            summaries.append(summary)
+        module.SESSION_POOL.close()
+    finally:
+        os.chdir(cwd)
+        server.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+        print(f"\n统计结果已保存到 {args.output}")
+    return summaries
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="使用本地模拟服务对签到流程做离线性能基准")
+    parser.add_argument("--site", choices=["nodeseek", "deepflood"], default="nodeseek")
+    parser.add_argument("--accounts", type=int, default=5, help="账号数量")
+    parser.add_argument("--mode", choices=["cookie", "password"], default="password",
+                        help="cookie: 使用 Cookie 环境变量；password: 使用账号密码，首次运行需要登录")
+    parser.add_argument("--runs", type=int, default=2, help="运行次数，第一次为冷启动，之后复用 Cookie 和账本")
+    parser.add_argument("--new-day", action="store_true", help="每次运行前清除签到状态，使每次都能签到成功")
+    parser.add_argument("--async", dest="sign_async", action="store_true", help="开启 SIGN_ASYNC 并发处理账号")
+    parser.add_argument("--yescaptcha", action="store_true", help="同时配置模拟的 YesCaptcha 服务")
+    parser.add_argument("--latency", type=float, default=0.05, help="论坛接口平均延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机波动(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="论坛接口返回 500 的概率")
+    parser.add_argument("--ledger-size", type=int, default=200, help="每个账号的收益流水条数")
+    parser.add_argument("--solve-time", type=float, default=1.5, help="验证码解题耗时(秒)")
+    parser.add_argument("--captcha-slots", type=int, default=0, help="验证码服务同时解题数量，0 为不限制")
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0, help="验证码任务失败的概率")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    parser.add_argument("--workdir", help="状态文件目录，默认使用新的临时目录")
+    parser.add_argument("--output", help="把每次运行的统计保存为 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="显示签到脚本的输出")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run_benchmark(parse_args())
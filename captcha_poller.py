@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+def fixed_schedule(max_retries: int, retry_interval: float) -> Iterator[float]:
+    """固定间隔的轮询计划：立即查询一次，之后每隔 retry_interval 秒查询，共 max_retries 次"""
+    for attempt in range(max_retries):
+        yield 0 if attempt == 0 else retry_interval
+
+
+class AdaptivePoller:
+    """
+    自适应验证码结果轮询
+
+    按服务商记录历史解题耗时，第一次查询安排在预计完成时间附近，
+    之后以较短间隔查询并逐步退避；每次解题的耗时和查询次数都会保存到本地。
+    """
+
+    _file_lock = threading.Lock()
+
+    def __init__(
+        self,
+        provider: str,
+        path: str = "./cookie/captcha_stats.json",
+        max_wait: float = 120,
+        min_interval: float = 1,
+        max_interval: float = 6,
+        backoff: float = 1.5,
+        history_size: int = 50
+    ):
+        """
+        初始化自适应轮询
+
+        参数:
+            provider: 验证码服务商标识，如 cloudfreed、yescaptcha
+            path: 历史数据文件路径
+            max_wait: 单次解题最长等待时间(秒)
+            min_interval: 最短查询间隔(秒)
+            max_interval: 最长查询间隔(秒)，没有历史数据时也作为首次查询的等待时间
+            backoff: 每次未完成后查询间隔的放大倍数
+            history_size: 保留的历史记录条数
+        """
+        self.provider = provider
+        self.path = path
+        self.max_wait = max_wait
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.history_size = history_size
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"加载验证码耗时统计失败: {e}")
+        return {}
+
+    def history(self) -> List[dict]:
+        """返回该服务商最近的解题记录"""
+        return self._load().get(self.provider, {}).get("solves", [])
+
+    def latencies(self) -> List[float]:
+        """返回最近成功解题的耗时列表"""
+        return [item["latency"] for item in self.history() if item.get("ok")]
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回成功解题耗时的第 p 百分位数，没有历史数据时返回 None"""
+        values = sorted(self.latencies())
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+        return values[index]
+
+    def expected_latency(self) -> Optional[float]:
+        """预计解题耗时（历史中位数）"""
+        return self.percentile(50)
+
+    def schedule(self) -> Iterator[float]:
+        """
+        生成每次查询前需要等待的秒数
+
+        第一次等待到预计完成时间稍早一点，之后从最短间隔开始逐步退避，
+        累计等待不超过 max_wait。首次查询就完成时记录的耗时会偏大，
+        因此首次等待取预计耗时的 75%，让估计值逐步向真实耗时收敛
+        """
+        expected = self.expected_latency()
+        first = self.max_interval if expected is None else max(self.min_interval, expected * 0.75)
+        elapsed = first
+        yield first
+        interval = self.min_interval
+        while elapsed < self.max_wait:
+            yield interval
+            elapsed += interval
+            interval = min(interval * self.backoff, self.max_interval)
+
+    def record(self, latency: float, polls: int, ok: bool) -> None:
+        """
+        记录一次解题结果
+
+        参数:
+            latency: 从创建任务到拿到结果的耗时(秒)
+            polls: 查询结果的次数
+            ok: 是否成功拿到令牌
+        """
+        with self._file_lock:
+            data = self._load()
+            provider = data.setdefault(self.provider, {"solves": []})
+            provider["solves"].append({
+                "time": int(time.time()),
+                "latency": round(latency, 2),
+                "polls": polls,
+                "ok": ok
+            })
+            provider["solves"] = provider["solves"][-self.history_size:]
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"保存验证码耗时统计失败: {e}")
+        print(f"{self.provider} 验证码耗时 {latency:.1f} 秒，查询结果 {polls} 次")
@@ -0,0 +1,63 @@
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class CreditPageCache:
+    """
+    单次运行内的收益页面缓存
+
+    按站点和账号 Cookie 隔离，保存 Cookie 有效性检查的结论以及已解析的收益页面 JSON，
+    避免同一账号在一次运行中重复请求相同的页面。
+    """
+
+    def __init__(self):
+        self._pages: Dict[Tuple[str, str], Dict[int, dict]] = {}
+        self._probes: Dict[Tuple[str, str], bool] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(site_key: str, cookie: str) -> Tuple[str, str]:
+        return site_key, hashlib.sha1(cookie.encode('utf-8')).hexdigest()
+
+    def get_probe(self, site_key: str, cookie: str) -> Optional[bool]:
+        """返回已缓存的 Cookie 有效性结论，没有时返回 None"""
+        with self._lock:
+            return self._probes.get(self._key(site_key, cookie))
+
+    def put_probe(self, site_key: str, cookie: str, valid: bool) -> None:
+        """缓存 Cookie 有效性结论"""
+        with self._lock:
+            self._probes[self._key(site_key, cookie)] = valid
+
+    def get_page(self, site_key: str, cookie: str, page: int) -> Optional[dict]:
+        """返回已缓存的收益页面 JSON，没有时返回 None"""
+        with self._lock:
+            data = self._pages.get(self._key(site_key, cookie), {}).get(page)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def put_page(self, site_key: str, cookie: str, page: int, data: dict) -> None:
+        """缓存收益页面 JSON，只缓存接口返回成功的页面"""
+        if not isinstance(data, dict) or not data.get("success"):
+            return
+        with self._lock:
+            self._pages.setdefault(self._key(site_key, cookie), {})[page] = data
+
+    def invalidate_pages(self, site_key: str, cookie: str) -> None:
+        """丢弃账号的页面缓存（签到成功后流水已变化）"""
+        with self._lock:
+            self._pages.pop(self._key(site_key, cookie), None)
+
+    def clear(self) -> None:
+        """清空缓存，开始新一轮运行时调用"""
+        with self._lock:
+            self._pages.clear()
+            self._probes.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+# 账本中最早可信时间的下限，表示已同步到账号的第一条流水
+LEDGER_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_record_time(timestamp: str) -> datetime:
+    """将接口返回的 UTC 时间字符串转换为带时区的 datetime"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+
+class CreditLedger:
+    """
+    单个账号在单个站点上的本地收益流水
+
+    按接口顺序（新到旧）保存已见过的 [amount, balance, description, timestamp] 记录，
+    covered_since 表示从该时间点到最新一条记录之间的流水是连续完整的。
+    """
+
+    def __init__(self, path: str, keep_days: int = 400):
+        """
+        初始化收益流水账本
+
+        参数:
+            path: 账本文件路径
+            keep_days: 本地保留的流水天数
+        """
+        self.path = path
+        self.keep_days = keep_days
+        self.rows: List[list] = []
+        self.covered_since: Optional[datetime] = None
+        self._keys = set()
+        self.load()
+
+    @staticmethod
+    def _row_key(row) -> tuple:
+        amount, balance, description, timestamp = row
+        return (amount, balance, description, timestamp)
+
+    def load(self) -> None:
+        """从文件加载账本，文件损坏时视为空账本"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.rows = [list(row) for row in data.get("rows", [])]
+                covered = data.get("covered_since")
+                self.covered_since = datetime.fromisoformat(covered) if covered else None
+        except Exception as e:
+            print(f"加载收益账本失败: {e}")
+            self.rows = []
+            self.covered_since = None
+        self._keys = {self._row_key(row) for row in self.rows}
+
+    def save(self) -> None:
+        """写入账本文件（先写临时文件再替换，避免写入一半）"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "covered_since": self.covered_since.isoformat() if self.covered_since else None,
+                    "rows": self.rows
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"保存收益账本失败: {e}")
+
+    def contains(self, row) -> bool:
+        """记录是否已在账本中"""
+        return self._row_key(row) in self._keys
+
+    def covers(self, start_time: datetime) -> bool:
+        """账本是否已连续覆盖 start_time 之后的全部流水"""
+        return self.covered_since is not None and self.covered_since <= start_time
+
+    def update(self, new_rows: List[list], reason: str, start_time: datetime) -> None:
+        """
+        合并本次拉取到的新记录
+
+        参数:
+            new_rows: 本次拉取到的新记录（新到旧）
+            reason: 停止翻页的原因，known/cutoff/end/limit
+            start_time: 本次查询的起始时间
+        """
+        if reason == "limit" and self.rows:
+            # 达到翻页上限仍未衔接到已有记录，中间存在缺口，只保留本次结果
+            self._reset()
+        elif reason in ("cutoff", "end") and self.covers(start_time) and self.rows_since(start_time):
+            # 账本覆盖查询范围却没有遇到任何已有记录，说明账本与当前账号不符
+            self._reset()
+
+        fresh = [row for row in new_rows if not self.contains(row)]
+
+        self.rows = fresh + self.rows
+        self._keys.update(self._row_key(row) for row in fresh)
+
+        if reason == "end":
+            self.covered_since = LEDGER_EPOCH
+        elif reason == "cutoff":
+            if self.covered_since is None or start_time < self.covered_since:
+                self.covered_since = start_time
+        elif reason == "limit":
+            self.covered_since = parse_record_time(new_rows[-1][3]) if new_rows else None
+        elif reason == "known" and self.covered_since is None and new_rows:
+            self.covered_since = parse_record_time(new_rows[-1][3])
+
+        self._prune()
+
+    def _reset(self) -> None:
+        self.rows = []
+        self._keys = set()
+        self.covered_since = None
+
+    def _prune(self) -> None:
+        """丢弃超过保留天数的旧记录"""
+        keep_since = datetime.now(timezone.utc) - timedelta(days=self.keep_days)
+        kept = [row for row in self.rows if parse_record_time(row[3]) >= keep_since]
+        if len(kept) != len(self.rows):
+            self.rows = kept
+            self._keys = {self._row_key(row) for row in self.rows}
+            if self.covered_since is not None and self.covered_since < keep_since:
+                self.covered_since = keep_since
+
+    def rows_since(self, start_time: datetime) -> List[list]:
+        """返回 start_time 之后的记录"""
+        return [row for row in self.rows if parse_record_time(row[3]) >= start_time]
@@ -0,0 +1,200 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Protocol, Tuple
+
+from run_trace import set_trace_context
+
+
+class HedgedSolverError(Exception):
+    """对冲求解错误基类"""
+    pass
+
+
+class CaptchaSolver(Protocol):
+    """验证码解决器的通用接口，TurnstileSolver 和 YesCaptchaSolver 均满足"""
+
+    def solve(
+        self,
+        url: str,
+        sitekey: str,
+        verbose: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+        priority: int = 1,
+        on_admitted: Optional[Callable[[], None]] = None
+    ) -> str:
+        ...
+
+
+class HedgedSolver:
+    """
+    对冲验证码求解
+
+    先用主服务解题，主服务排队结束、开始解题后超过 hedge_delay 秒仍未拿到令牌时，用备用服务为同一页面再创建一个任务，
+    先返回的令牌生效，另一个任务随即放弃；主服务提前失败时立即改用备用服务。
+    在主服务调度队列中等待名额的时间不计入 hedge_delay，排队不会被当成解题慢而额外付费。
+    """
+
+    def __init__(
+        self,
+        primary: CaptchaSolver,
+        backup: Optional[CaptchaSolver] = None,
+        hedge_delay: float = 30,
+        primary_name: str = "CloudFreed",
+        backup_name: str = "YesCaptcha",
+        max_parallel: int = 8
+    ):
+        """
+        初始化对冲求解
+
+        参数:
+            primary: 主验证码服务
+            backup: 备用验证码服务，为 None 时只使用主服务
+            hedge_delay: 启动备用服务前等待主服务的秒数
+            primary_name: 主服务名称（用于日志）
+            backup_name: 备用服务名称（用于日志）
+            max_parallel: solve_many 同时对冲求解的任务数上限
+        """
+        self.primary = primary
+        self.backup = backup
+        self.hedge_delay = hedge_delay
+        self.primary_name = primary_name
+        self.backup_name = backup_name
+        self.max_parallel = max(1, max_parallel)
+
+    def solve(
+        self,
+        url: str,
+        sitekey: str,
+        verbose: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+        priority: int = 1
+    ) -> str:
+        """
+        解决 Turnstile 验证并返回先拿到的令牌
+
+        参数:
+            url: 目标网站 URL
+            sitekey: Turnstile sitekey
+            verbose: 是否打印详细日志
+            cancel_event: 取消事件，被设置后放弃全部任务
+            priority: 排队优先级，数值小的优先
+
+        返回:
+            验证令牌字符串
+
+        异常:
+            HedgedSolverError: 所有服务都未能返回令牌
+        """
+        if self.backup is None:
+            return self.primary.solve(
+                url=url, sitekey=sitekey, verbose=verbose, cancel_event=cancel_event, priority=priority
+            )
+
+        results: "queue.Queue[Tuple[str, Optional[str], Optional[Exception]]]" = queue.Queue()
+        cancels = {self.primary_name: threading.Event(), self.backup_name: threading.Event()}
+        started = time.time()
+        admitted = threading.Event()
+
+        def run(name: str, solver: CaptchaSolver) -> None:
+            try:
+                token = solver.solve(
+                    url=url, sitekey=sitekey, verbose=verbose, cancel_event=cancels[name], priority=priority,
+                    on_admitted=admitted.set if name == self.primary_name else None
+                )
+                results.put((name, token, None))
+            except Exception as e:
+                results.put((name, None, e))
+
+        def start(name: str, solver: CaptchaSolver) -> None:
+            # 复制调用方上下文，解题线程中的运行记录仍能带上站点和账号
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run, args=(run, name, solver), name=f"captcha-{name}", daemon=True
+            ).start()
+
+        def next_result(timeout: Optional[float]):
+            """等待下一个结果，外部取消时抛出异常，超时返回 None"""
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise HedgedSolverError("验证任务已取消")
+                remaining = 0.5 if deadline is None else min(0.5, deadline - time.time())
+                if remaining <= 0:
+                    return None
+                try:
+                    return results.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+        start(self.primary_name, self.primary)
+        running = 1
+        backup_started = False
+        errors: Dict[str, Exception] = {}
+        try:
+            # 主服务排队期间不计时，开始解题后才等待 hedge_delay
+            result = None
+            while result is None and not admitted.is_set():
+                result = next_result(0.5)
+            if result is None:
+                result = next_result(self.hedge_delay)
+            if result is None:
+                print(f"{self.primary_name} {self.hedge_delay:.0f} 秒内未返回令牌，同时使用 {self.backup_name} 解题...")
+                start(self.backup_name, self.backup)
+                backup_started = True
+                running += 1
+                result = next_result(None)
+
+            while True:
+                name, token, error = result
+                if token:
+                    print(f"{name} 先返回令牌，耗时 {time.time() - started:.1f} 秒")
+                    return token
+                errors[name] = error or HedgedSolverError("未返回令牌")
+                running -= 1
+                print(f"{name} 解题失败: {errors[name]}")
+                if not backup_started:
+                    print(f"改用 {self.backup_name} 解题...")
+                    start(self.backup_name, self.backup)
+                    backup_started = True
+                    running += 1
+                if running == 0:
+                    detail = "；".join(f"{k}: {v}" for k, v in errors.items())
+                    raise HedgedSolverError(f"所有验证码服务均失败（{detail}）")
+                result = next_result(None)
+        finally:
+            # 放弃仍在进行的任务
+            for event in cancels.values():
+                event.set()
+
+    def solve_many(
+        self,
+        tasks: Iterable[Dict[str, Any]],
+        verbose: bool = False
+    ) -> Iterator[Tuple[Any, Optional[str], Optional[Exception]]]:
+        """
+        并行解决多个验证任务，与 TurnstileSolver.solve_many 产出相同格式的 (key, token, error)
+
+        每个任务各自对冲，完成一个产出一个；同时进行的任务不超过 max_parallel 个，其余等待
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return
+
+        def solve_task(task: Dict[str, Any]) -> str:
+            # 任务附带的运行记录属性（如 account）带到解题线程中的 span 上
+            set_trace_context(**task.get("trace", {}))
+            return self.solve(task["url"], task["sitekey"], verbose, None, task.get("priority", 1))
+
+        with ThreadPoolExecutor(max_workers=min(len(tasks), self.max_parallel)) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, solve_task, task): task.get("key", index)
+                for index, task in enumerate(tasks)
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
@@ -0,0 +1,176 @@
+import collections
+import heapq
+import itertools
+import statistics
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class LoginScheduler:
+    """
+    验证码服务并发调度
+
+    自建的 cloudflyer 服务浏览器实例有限，同时提交过多任务会让所有任务变慢甚至超时。
+    调度器限制同时进行的解题数量，其余任务按优先级排队（数值小的优先），并统计排队长度和等待时间。
+
+    未指定容量时自动探测：解题成功且耗时没有明显变长时逐步放大并发上限，
+    耗时明显超过最近若干次解题耗时的中位数时减一，解题失败时减半。
+    """
+
+    # 排队优先级：没有 Cookie 的账号优先，其次是 Cookie 已失效的账号
+    MISSING_COOKIE = 0
+    EXPIRED_COOKIE = 1
+
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        initial_capacity: int = 2,
+        max_capacity: int = 8,
+        slowdown: float = 1.5,
+        window: int = 20
+    ):
+        """
+        初始化调度器
+
+        参数:
+            capacity: 固定并发上限，为 None 或小于等于 0 时自动探测
+            initial_capacity: 自动探测时的初始并发上限
+            max_capacity: 自动探测时的最大并发上限
+            slowdown: 耗时超过最近解题耗时中位数的多少倍视为服务过载
+            window: 计算中位数时参考最近多少次成功解题的耗时
+        """
+        self.auto = not capacity or capacity <= 0
+        self.limit = initial_capacity if self.auto else capacity
+        self.max_capacity = max_capacity if self.auto else capacity
+        self.slowdown = slowdown
+        self.in_flight = 0
+        self.max_depth = 0
+        self.max_in_flight = 0
+        self._latencies = collections.deque(maxlen=max(1, window))
+        self._waits: List[float] = []
+        self._queue: List[list] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队的任务数"""
+        with self._cond:
+            return len(self._queue)
+
+    def enqueue(self, priority: int = EXPIRED_COOKIE) -> list:
+        """任务排队，返回排队凭据"""
+        ticket = [priority, next(self._seq), time.time()]
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self.max_depth = max(self.max_depth, len(self._queue))
+        return ticket
+
+    def try_admit(self, ticket: list) -> bool:
+        """有空闲名额且轮到该任务时占用名额并返回 True，否则立即返回 False"""
+        with self._cond:
+            return self._admit_locked(ticket)
+
+    def _admit_locked(self, ticket: list) -> bool:
+        if self.in_flight >= self.limit or not self._queue or self._queue[0] is not ticket:
+            return False
+        heapq.heappop(self._queue)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        wait = time.time() - ticket[2]
+        self._waits.append(wait)
+        if wait >= 1:
+            print(f"验证码服务繁忙，排队 {wait:.1f} 秒后开始解题")
+        # 名额可能不止一个，唤醒下一个排队的任务
+        self._cond.notify_all()
+        return True
+
+    def admit(self, ticket: list, cancel_event: Optional[threading.Event] = None) -> bool:
+        """等待轮到该任务并占用名额，被取消时退出队列并返回 False"""
+        with self._cond:
+            while not self._admit_locked(ticket):
+                if cancel_event is not None and cancel_event.is_set():
+                    self._withdraw_locked(ticket)
+                    return False
+                self._cond.wait(0.5)
+        return True
+
+    def acquire(self, priority: int = EXPIRED_COOKIE, cancel_event: Optional[threading.Event] = None) -> bool:
+        """排队并等待名额，被取消时返回 False"""
+        return self.admit(self.enqueue(priority), cancel_event)
+
+    def withdraw(self, ticket: list) -> None:
+        """放弃仍在排队的任务"""
+        with self._cond:
+            self._withdraw_locked(ticket)
+
+    def _withdraw_locked(self, ticket: list) -> None:
+        if any(item is ticket for item in self._queue):
+            self._queue = [item for item in self._queue if item is not ticket]
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def release(self, ok: Optional[bool] = None, latency: Optional[float] = None) -> None:
+        """
+        归还名额
+
+        参数:
+            ok: 解题是否成功，为 None 时（如被取消）不参与容量探测
+            latency: 从创建任务到拿到结果的耗时(秒)
+        """
+        with self._cond:
+            saturated = self.in_flight >= self.limit
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.auto and ok is not None:
+                self._adjust(ok, latency, saturated)
+            self._cond.notify_all()
+
+    def _adjust(self, ok: bool, latency: Optional[float], saturated: bool) -> None:
+        """根据解题结果调整自动探测的并发上限"""
+        if not ok:
+            self.limit = max(1, self.limit // 2)
+            return
+        if latency is None:
+            return
+        # 以最近耗时的中位数为基准，个别特别快的解题不会把基准拉低
+        baseline = statistics.median(self._latencies) if self._latencies else None
+        self._latencies.append(latency)
+        if baseline is not None and latency > baseline * self.slowdown:
+            self.limit = max(1, self.limit - 1)
+        elif saturated and self.limit < self.max_capacity:
+            # 只有名额用满时才说明更高的并发值得尝试
+            self.limit += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """排队和并发统计"""
+        with self._cond:
+            waits = list(self._waits)
+            return {
+                "capacity": self.limit,
+                "auto": self.auto,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_depth,
+                "max_in_flight": self.max_in_flight,
+                "admitted": len(waits),
+                "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+                "max_wait": max(waits) if waits else 0.0
+            }
+
+    def reset_stats(self) -> None:
+        """清空排队统计，开始新一轮运行时调用；自动探测到的并发上限保留"""
+        with self._cond:
+            self._waits.clear()
+            self.max_depth = len(self._queue)
+            self.max_in_flight = self.in_flight
+
+    def describe(self) -> str:
+        """调度统计的文字描述"""
+        s = self.stats()
+        mode = "自动" if s["auto"] else "固定"
+        return (
+            f"验证码调度: 并发上限 {s['capacity']}（{mode}），最高同时 {s['max_in_flight']} 个，"
+            f"最长排队 {s['max_queue_depth']} 个，共 {s['admitted']} 个任务，"
+            f"平均等待 {s['avg_wait']:.1f} 秒，最长等待 {s['max_wait']:.1f} 秒"
+        )
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 运行记录中的 HTTP 阶段 -> SITES_CONFIG 中对应的接口
+PHASE_ENDPOINTS = {
+    "probe": "stats_api",
+    "keepalive": "stats_api",
+    "stats_page": "stats_api",
+    "sign": "sign_api",
+    "login_page": "login_url",
+    "login_submit": "login_api",
+}
+
+CAPTCHA_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120)
+HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels.items():
+        text = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{key}="{text}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(round(float(value), 6))
+
+
+class PrometheusTextfileExporter:
+    """
+    Prometheus textfile 指标导出
+
+    订阅运行记录(RunTracer)中的 span，汇总本次运行的签到结果、Cookie 刷新、验证码耗时、
+    各接口请求数和耗时、收益分页数，运行结束时写入 node_exporter textfile collector 目录下的 .prom 文件。
+    每次运行整体覆盖文件，指标反映最近一次运行。
+    """
+
+    def __init__(self, path: str, prefix: str = "nsdf"):
+        """
+        初始化导出器
+
+        参数:
+            path: .prom 文件路径，需位于 node_exporter 的 --collector.textfile.directory 目录下
+            prefix: 指标名前缀
+        """
+        self.path = path
+        self.prefix = prefix
+        self._accounts: Dict[Tuple[str, str], int] = {}
+        self._refreshes: Dict[Tuple[str, str], int] = {}
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._stats_pages: Dict[str, int] = {}
+        self._captcha: Dict[Tuple[str, str], Histogram] = {}
+        self._http: Dict[Tuple[str, str], Histogram] = {}
+        self._stages: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._requeues: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """清空统计，开始新一轮运行时调用"""
+        with self._lock:
+            for counter in (self._accounts, self._refreshes, self._requests, self._stats_pages, self._captcha,
+                            self._http, self._stages, self._requeues):
+                counter.clear()
+
+    @staticmethod
+    def _increment(counter: Dict, key: Any) -> None:
+        counter[key] = counter.get(key, 0) + 1
+
+    def observe(self, entry: Dict[str, Any]) -> None:
+        """处理一条运行记录，作为 RunTracer.subscribe 的回调"""
+        phase = entry.get("phase")
+        site = str(entry.get("site", ""))
+        seconds = entry.get("duration_ms", 0) / 1000
+        with self._lock:
+            if phase == "account":
+                self._increment(self._accounts, (site, entry.get("outcome") or entry.get("result", "unknown")))
+            elif phase == "login":
+                self._increment(self._refreshes, (site, "success" if entry.get("ok") else "failed"))
+            elif phase == "captcha":
+                # 对冲求解中落后而被取消的任务 ok 为 None，单独标记，不算作失败
+                ok = entry.get("ok")
+                result = "cancelled" if ok is None else "success" if ok else "failed"
+                key = (str(entry.get("provider", "")), result)
+                self._captcha.setdefault(key, Histogram(CAPTCHA_BUCKETS)).observe(seconds)
+            elif phase == "pipeline_stage":
+                self._stages[(site, str(entry.get("stage", "")))] = {
+                    name: entry.get(name, 0) for name in ("workers", "processed", "max_queue_depth", "busy")
+                }
+            elif phase == "requeue":
+                self._increment(self._requeues, (site, str(entry.get("stage", ""))))
+
+            endpoint = PHASE_ENDPOINTS.get(phase)
+            if endpoint is None:
+                return
+            if "status" in entry:
+                status = str(entry["status"])
+            elif entry.get("error") == "CancelledError":
+                status = "cancelled"
+            else:
+                status = "error"
+            self._increment(self._requests, (site, endpoint, status))
+            if "status" in entry:
+                self._http.setdefault((site, endpoint), Histogram(HTTP_BUCKETS)).observe(seconds)
+            if phase == "stats_page" and "status" in entry:
+                self._increment(self._stats_pages, site)
+
+    def render(self, run_duration: float, finished_at: Optional[float] = None) -> str:
+        """生成 textfile 内容"""
+        p = self.prefix
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+
+        def sample(name: str, labels: Dict[str, Any], value: float) -> None:
+            lines.append(f"{p}_{name}{_labels(labels)} {_number(value)}")
+
+        def histogram(name: str, labels: Dict[str, Any], hist: Histogram) -> None:
+            for bound, count in zip(hist.buckets, hist.counts):
+                sample(f"{name}_bucket", {**labels, "le": _number(bound)}, count)
+            sample(f"{name}_bucket", {**labels, "le": "+Inf"}, hist.count)
+            sample(f"{name}_sum", labels, hist.sum)
+            sample(f"{name}_count", labels, hist.count)
+
+        with self._lock:
+            family("run_duration_seconds", "gauge", "Duration of the last sign run")
+            sample("run_duration_seconds", {}, run_duration)
+            family("run_finished_timestamp_seconds", "gauge", "Unix time the last sign run finished")
+            sample("run_finished_timestamp_seconds", {}, finished_at or time.time())
+
+            family("accounts", "gauge", "Accounts processed in the last run by outcome")
+            for (site, outcome), value in sorted(self._accounts.items()):
+                sample("accounts", {"site": site, "outcome": outcome}, value)
+
+            family("cookie_refreshes", "gauge", "Cookie refreshes (logins) in the last run")
+            for (site, result), value in sorted(self._refreshes.items()):
+                sample("cookie_refreshes", {"site": site, "result": result}, value)
+
+            family("captcha_solve_seconds", "histogram", "Captcha solve latency in the last run")
+            for (provider, result), hist in sorted(self._captcha.items()):
+                histogram("captcha_solve_seconds", {"provider": provider, "result": result}, hist)
+
+            family("http_requests", "gauge", "HTTP requests in the last run by endpoint and status")
+            for (site, endpoint, status), value in sorted(self._requests.items()):
+                sample("http_requests", {"site": site, "endpoint": endpoint, "status": status}, value)
+
+            family("http_request_duration_seconds", "histogram", "HTTP request latency in the last run")
+            for (site, endpoint), hist in sorted(self._http.items()):
+                histogram("http_request_duration_seconds", {"site": site, "endpoint": endpoint}, hist)
+
+            for name, help_text in (
+                ("workers", "Workers per pipeline stage in the last run"),
+                ("processed", "Accounts handled per pipeline stage in the last run"),
+                ("max_queue_depth", "Maximum queue depth per pipeline stage in the last run"),
+                ("busy", "Seconds spent handling accounts per pipeline stage in the last run"),
+            ):
+                metric = f"pipeline_stage_{name}" if name != "busy" else "pipeline_stage_busy_seconds"
+                family(metric, "gauge", help_text)
+                for (site, stage), values in sorted(self._stages.items()):
+                    sample(metric, {"site": site, "stage": stage}, values[name])
+
+            family("account_requeues", "gauge", "Accounts requeued with backoff after 429 or challenge in the last run")
+            for (site, stage), value in sorted(self._requeues.items()):
+                sample("account_requeues", {"site": site, "stage": stage}, value)
+
+            family("stats_pages_fetched", "gauge", "Credit pages fetched in the last run")
+            for site, value in sorted(self._stats_pages.items()):
+                sample("stats_pages_fetched", {"site": site}, value)
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, run_duration: float) -> None:
+        """原子写入 textfile，node_exporter 不会读到写了一半的文件"""
+        content = self.render(run_duration)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, self.path)
+            print(f"Prometheus 指标已写入 {self.path}")
+        except Exception as e:
+            print(f"写入 Prometheus 指标失败: {e}")
@@ -0,0 +1,243 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class Stage:
+    """
+    流水线中的一个阶段
+
+    每个阶段有自己的有界队列和若干工作协程。处理函数返回下一阶段的名称，返回 None 表示该项已处理完毕。
+    设置 batch 时工作协程取到一项后再等待 linger 秒，把队列中已有的项一起交给处理函数，
+    处理函数接收列表并返回与之等长的下一阶段名称列表。
+    处理函数也可以返回 (阶段名称, 延迟秒数)，该项等待延迟后再进入该阶段，用于退避后重新排队（可以回到当前阶段）。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = 1,
+        queue_size: Optional[int] = None,
+        batch: int = 1,
+        linger: float = 0.0
+    ):
+        """
+        初始化
+
+        参数:
+            name: 阶段名称
+            handler: 处理函数
+            workers: 工作协程数量
+            queue_size: 队列容量，默认为工作协程数量的 2 倍，队列满时上一阶段等待
+            batch: 每次交给处理函数的最大项数，1 表示逐项处理
+            linger: 批量处理时取到第一项后等待更多项的时间(秒)
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or self.workers * 2
+        self.batch = max(1, batch)
+        self.linger = linger
+        self.queue: Optional[asyncio.Queue] = None
+        self.processed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.busy_total = 0.0
+        self.calls = 0
+        self.requeued = 0
+
+    def reset(self) -> None:
+        self.queue = asyncio.Queue(self.queue_size)
+        self.processed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.busy_total = 0.0
+        self.calls = 0
+        self.requeued = 0
+
+    def stats(self, elapsed: float) -> Dict[str, Any]:
+        """阶段统计：处理数量、延迟重新排队次数、最长排队、平均排队耗时、每次调用处理函数的平均耗时、吞吐量"""
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "requeued": self.requeued,
+            "max_queue_depth": self.max_depth,
+            "avg_wait": self.wait_total / self.processed if self.processed else 0.0,
+            "avg_busy": self.busy_total / self.calls if self.calls else 0.0,
+            "busy": self.busy_total,
+            "throughput": self.processed / elapsed if elapsed > 0 else 0.0
+        }
+
+
+class Pipeline:
+    """
+    由有界队列连接的多阶段流水线
+
+    各阶段独立并发，某一阶段慢（如验证码登录）时只阻塞经过该阶段的项，
+    不影响直接进入后续阶段的项；下游队列满时上游自然等待，避免积压。
+    阶段之间只能向后流转，不能形成环，否则有界队列可能互相等待；
+    带延迟的重新排队由独立的任务放回队列，不占用工作协程，不受此限制。
+    """
+
+    def __init__(self, stages: List[Stage], on_done: Optional[Callable[[Any], None]] = None,
+                 on_error: Optional[Callable[[Any, Exception], None]] = None):
+        """
+        初始化
+
+        参数:
+            stages: 各阶段，第一个阶段为入口
+            on_done: 每一项处理完毕时的回调
+            on_error: 处理函数抛出异常时的回调，之后该项视为处理完毕
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.entry = stages[0].name
+        self.on_done = on_done
+        self.on_error = on_error
+        self.elapsed = 0.0
+        self._remaining = 0
+        self._finished: Optional[asyncio.Event] = None
+        self._delayed = set()
+
+    async def _put(self, stage_name: str, item: Any) -> None:
+        stage = self.stages[stage_name]
+        await stage.queue.put((item, time.perf_counter()))
+        stage.max_depth = max(stage.max_depth, stage.queue.qsize())
+
+    def _put_later(self, stage_name: str, item: Any, delay: float) -> None:
+        """延迟后放回队列，工作协程不等待，继续处理其他项"""
+        async def put():
+            await asyncio.sleep(delay)
+            await self._put(stage_name, item)
+
+        self.stages[stage_name].requeued += 1
+        task = asyncio.create_task(put())
+        self._delayed.add(task)
+        task.add_done_callback(self._delayed.discard)
+
+    def _error(self, item: Any, error: Exception) -> None:
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(item, error)
+        except Exception as e:
+            print(f"流水线错误回调出错: {e}")
+
+    def _done(self, item: Any) -> None:
+        """该项处理完毕，回调出错时同样计为完成，避免 run 一直等待"""
+        try:
+            if self.on_done is not None:
+                self.on_done(item)
+        except Exception as e:
+            self._error(item, e)
+        finally:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._finished.set()
+
+    async def _route(self, item: Any, route: Any) -> None:
+        """按处理函数返回的路由把该项交给下一阶段或标记完成"""
+        delay = 0
+        if isinstance(route, tuple):
+            route, delay = route
+        if route is None:
+            self._done(item)
+        elif route not in self.stages:
+            raise ValueError(f"未知的流水线阶段: {route}")
+        elif delay > 0:
+            self._put_later(route, item, delay)
+        else:
+            await self._put(route, item)
+
+    async def _take(self, stage: Stage) -> List[tuple]:
+        entries = [await stage.queue.get()]
+        if stage.batch > 1:
+            if stage.linger > 0:
+                await asyncio.sleep(stage.linger)
+            while len(entries) < stage.batch and not stage.queue.empty():
+                entries.append(stage.queue.get_nowait())
+        return entries
+
+    async def _worker(self, stage: Stage) -> None:
+        while True:
+            entries = await self._take(stage)
+            started = time.perf_counter()
+            items = [item for item, _ in entries]
+            for _, enqueued in entries:
+                stage.wait_total += started - enqueued
+            try:
+                if stage.batch > 1:
+                    routes = list(await stage.handler(items))
+                else:
+                    routes = [await stage.handler(items[0])]
+            except Exception as e:
+                routes = [None] * len(items)
+                for item in items:
+                    self._error(item, e)
+            if len(routes) != len(items):
+                error = RuntimeError(f"阶段 {stage.name} 返回 {len(routes)} 个路由，应为 {len(items)} 个")
+                routes = [None] * len(items)
+                for item in items:
+                    self._error(item, error)
+            stage.busy_total += time.perf_counter() - started
+            stage.calls += 1
+            stage.processed += len(items)
+            for item, route in zip(items, routes):
+                try:
+                    await self._route(item, route)
+                except Exception as e:
+                    # 路由失败的项视为出错并结束，工作协程继续处理其他项
+                    self._error(item, e)
+                    self._done(item)
+
+    async def run(self, items: List[Any], delay: Optional[Callable[[Any], float]] = None) -> None:
+        """
+        处理全部项，全部完成后返回
+
+        参数:
+            delay: 返回每一项进入入口阶段前的等待时间(秒)，用于分散请求时间
+        """
+        if not items:
+            return
+        for stage in self.stages.values():
+            stage.reset()
+        self._remaining = len(items)
+        self._finished = asyncio.Event()
+        started = time.perf_counter()
+        workers = [
+            asyncio.create_task(self._worker(stage))
+            for stage in self.stages.values() for _ in range(stage.workers)
+        ]
+
+        async def feed(item):
+            wait = delay(item) if delay is not None else 0
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._put(self.entry, item)
+
+        feeders = [asyncio.create_task(feed(item)) for item in items]
+        try:
+            await self._finished.wait()
+        finally:
+            delayed = list(self._delayed)
+            for task in workers + feeders + delayed:
+                task.cancel()
+            await asyncio.gather(*workers, *feeders, *delayed, return_exceptions=True)
+            self.elapsed = time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段统计"""
+        return {name: stage.stats(self.elapsed) for name, stage in self.stages.items()}
+
+    def describe(self) -> List[str]:
+        """各阶段统计的文字描述"""
+        lines = []
+        for name, s in self.stats().items():
+            busy_label = "平均每批处理" if self.stages[name].batch > 1 else "平均处理"
+            lines.append(
+                f"阶段 {name}: 工作协程 {s['workers']}，处理 {s['processed']} 个，"
+                + (f"退避重排 {s['requeued']} 次，" if s['requeued'] else "")
+                + f"最长排队 {s['max_queue_depth']} 个，"
+                f"平均排队 {s['avg_wait']:.2f} 秒，{busy_label} {s['avg_busy']:.2f} 秒，吞吐 {s['throughput']:.2f} 个/秒"
+            )
+        return lines
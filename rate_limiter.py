@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+# Cloudflare 质询页面的特征
+CHALLENGE_MARKERS = ("cf-chl", "challenge-platform", "just a moment", "attention required", "cf_chl_opt")
+
+
+class RateLimitedError(Exception):
+    """站点返回 429 或 Cloudflare 质询"""
+
+    def __init__(self, origin: str, kind: str, status: int, retry_after: Optional[float] = None):
+        self.origin = origin
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+        label = "请求过于频繁(429)" if kind == "rate_limited" else f"Cloudflare 质询({status})"
+        wait = f"，Retry-After {retry_after:.0f} 秒" if retry_after else ""
+        super().__init__(f"{origin} {label}{wait}")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和 HTTP 日期"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_response(response: Any) -> Optional[str]:
+    """
+    判断响应是否为限流或质询
+
+    返回:
+        "rate_limited"、"challenge" 或 None
+    """
+    status = response.status_code
+    if status == 429:
+        return "rate_limited"
+    if status not in (403, 503):
+        return None
+    headers = response.headers or {}
+    if headers.get("cf-mitigated", "").lower() == "challenge":
+        return "challenge"
+    if "cloudflare" not in headers.get("server", "").lower():
+        return None
+    try:
+        head = (response.content or b"")[:4096].decode("utf-8", errors="ignore").lower()
+    except Exception:
+        return None
+    if any(marker in head for marker in CHALLENGE_MARKERS):
+        return "challenge"
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None, base: float = 2.0, cap: float = 60.0) -> float:
+    """第 attempt 次重试前的等待时间：指数退避加随机抖动，不少于 Retry-After"""
+    delay = min(cap, base * 2 ** max(0, attempt - 1)) * random.uniform(0.5, 1.5)
+    return max(delay, retry_after or 0.0)
+
+
+class TokenBucket:
+    """
+    自适应令牌桶
+
+    未配置速率时不限速，只记录最近的请求速率；被限流时速率降为最近速率的一半（乘性减），
+    并按 Retry-After 暂停，之后每次正常响应逐步提高速率（加性增），直到配置的上限。
+    """
+
+    def __init__(self, rate: float = 0.0, burst: int = 10, min_rate: float = 0.5):
+        """
+        初始化
+
+        参数:
+            rate: 每秒请求数上限，0 表示不限速
+            burst: 令牌桶容量，允许的瞬时并发请求数
+            min_rate: 自适应降速的下限
+        """
+        self.max_rate = rate if rate > 0 else float("inf")
+        self.rate = self.max_rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.waited = 0.0
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._recent.append(now)
+            while self._recent and now - self._recent[0] > 5:
+                self._recent.popleft()
+            wait = max(0.0, self.blocked_until - now)
+            if self.rate != float("inf"):
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            self.waited += wait
+            return wait
+
+    def acquire(self) -> None:
+        """同步获取令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self) -> None:
+        """异步获取令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """被限流：降低速率，并暂停到 Retry-After 之后"""
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            observed = len(self._recent) / 5 if self._recent else self.min_rate
+            current = self.rate if self.rate != float("inf") else observed
+            self.rate = max(self.min_rate, current / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def reward(self) -> None:
+        """正常响应：逐步恢复速率"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + max(0.1, self.rate * 0.05))
+
+
+class OriginRateLimiter:
+    """按站点 origin 共享的限流器"""
+
+    def __init__(self, rate: float = 0.0, burst: int = 10, min_rate: float = 0.5):
+        """
+        初始化
+
+        参数:
+            rate: 每个 origin 每秒请求数上限，0 表示不限速（被限流后自动降速）
+            burst: 每个 origin 的令牌桶容量
+            min_rate: 自适应降速的下限
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, origin: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(origin)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst, self.min_rate)
+                self._buckets[origin] = bucket
+            return bucket
+
+    def acquire(self, origin: str) -> None:
+        self.bucket(origin).acquire()
+
+    async def async_acquire(self, origin: str) -> None:
+        await self.bucket(origin).async_acquire()
+
+    def observe(self, origin: str, response: Any) -> None:
+        """
+        根据响应调整速率
+
+        异常:
+            RateLimitedError: 响应为 429 或 Cloudflare 质询
+        """
+        kind = classify_response(response)
+        bucket = self.bucket(origin)
+        if kind is None:
+            bucket.reward()
+            return
+        retry_after = parse_retry_after((response.headers or {}).get("retry-after"))
+        bucket.penalize(retry_after)
+        raise RateLimitedError(origin, kind, response.status_code, retry_after)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各 origin 的当前速率、被限流次数和累计等待时间"""
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            origin: {
+                "rate": bucket.rate,
+                "throttled": bucket.throttled,
+                "waited": bucket.waited
+            }
+            for origin, bucket in buckets.items()
+        }
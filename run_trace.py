@@ -0,0 +1,166 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# 当前 asyncio 任务或线程共用的 span 属性（如 site、account），各任务互不影响
+_trace_context: contextvars.ContextVar = contextvars.ContextVar("trace_context", default={})
+
+
+def set_trace_context(**attrs: Any) -> None:
+    """设置当前上下文中后续 span 共用的属性"""
+    _trace_context.set({**_trace_context.get(), **attrs})
+
+
+def trace_context() -> Dict[str, Any]:
+    """当前上下文中的 span 属性"""
+    return dict(_trace_context.get())
+
+
+class Span:
+    """一次计时区间，可在结束前补充属性"""
+
+    def __init__(self, phase: str, attrs: Dict[str, Any]):
+        self.phase = phase
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+    def set(self, **attrs: Any) -> None:
+        """补充属性"""
+        self.attrs.update(attrs)
+
+    def set_response(self, response: Any) -> None:
+        """记录 HTTP 状态码和响应字节数"""
+        self.attrs["status"] = response.status_code
+        try:
+            self.attrs["bytes"] = len(response.content or b"")
+        except Exception:
+            pass
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+
+class RunTracer:
+    """
+    单次运行的阶段计时
+
+    各阶段的耗时以 JSON Lines 格式写入 trace 目录，每次运行一个文件，每行一个 span：
+    {"run", "phase", "start", "duration_ms", "site", "account", "status", "bytes", "error", ...}
+    未配置目录时不写文件，只保留内存中的汇总。
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        初始化
+
+        参数:
+            directory: trace 文件目录，为空时不写文件
+        """
+        self.directory = directory
+        self._durations: Dict[str, List[float]] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._new_run()
+
+    def _new_run(self) -> None:
+        self.run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.path = os.path.join(self.directory, f"trace-{self.run_id}.jsonl") if self.directory else None
+        self._durations = {}
+
+    def rotate(self) -> None:
+        """开始新一轮运行：关闭当前文件，生成新的 run_id 并清空汇总，回调保留"""
+        self.close()
+        with self._lock:
+            self._new_run()
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """注册 span 结束时的回调，参数与 trace 文件中的一行相同"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    @contextmanager
+    def span(self, phase: str, **attrs: Any) -> Iterator[Span]:
+        """
+        记录一个阶段的耗时
+
+        参数:
+            phase: 阶段名称，如 probe、captcha、login、sign、stats_page、notify
+            attrs: 附加属性，与当前上下文的属性合并
+        """
+        span = Span(phase, {**_trace_context.get(), **attrs})
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs.setdefault("error", str(e) or type(e).__name__)
+            # 限流等异常携带了响应状态码，照常记录
+            if isinstance(getattr(e, "status", None), int):
+                span.attrs.setdefault("status", e.status)
+            raise
+        finally:
+            self._finish(span.phase, span.started_at, span.elapsed(), span.attrs)
+
+    def record(self, phase: str, started_at: float, duration: float, **attrs: Any) -> None:
+        """记录已经结束的阶段（无法用 with 包裹时使用）"""
+        self._finish(phase, started_at, duration, {**_trace_context.get(), **attrs})
+
+    def _finish(self, phase: str, started_at: float, duration: float, attrs: Dict[str, Any]) -> None:
+        entry = {
+            "run": self.run_id,
+            "phase": phase,
+            "start": round(started_at, 3),
+            "duration_ms": round(duration * 1000, 1)
+        }
+        entry.update(attrs)
+        with self._lock:
+            self._durations.setdefault(phase, []).append(duration)
+            if self.path:
+                self._write(entry)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(entry)
+            except Exception as e:
+                print(f"处理运行记录失败: {e}")
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+        except Exception as e:
+            print(f"写入运行记录失败: {e}")
+            self.path = None
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各阶段的次数、合计、p50、p95 和最大耗时(秒)"""
+        with self._lock:
+            durations = {phase: sorted(values) for phase, values in self._durations.items()}
+        result = {}
+        for phase, values in durations.items():
+            def pick(p):
+                return values[min(len(values) - 1, int(p / 100 * len(values)))]
+            result[phase] = {
+                "count": len(values),
+                "total": sum(values),
+                "p50": pick(50),
+                "p95": pick(95),
+                "max": values[-1]
+            }
+        return result
+
+    def close(self) -> None:
+        """关闭 trace 文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,154 @@
+from curl_cffi import requests
+from curl_cffi.const import CurlHttpVersion
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from rate_limiter import OriginRateLimiter
+
+
+def url_origin(url: str) -> str:
+    """提取 URL 的 origin（scheme://host[:port]）"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class SessionPool:
+    """
+    按站点 origin 复用的 HTTP 会话池
+
+    同一 origin 的请求共用一个会话，保持长连接并优先使用 HTTP/2，
+    避免每个请求重新进行 TLS 握手。账号 Cookie 通过请求头传入，
+    会话本身不保存 Cookie，切换账号时无需重建连接。
+    """
+
+    def __init__(
+        self,
+        impersonate: str = "chrome110",
+        http_version: CurlHttpVersion = CurlHttpVersion.V2TLS,
+        timeout: int = 30,
+        max_clients: int = 10,
+        limiter: Optional[OriginRateLimiter] = None
+    ):
+        """
+        初始化会话池
+
+        参数:
+            impersonate: 模拟的浏览器指纹
+            http_version: 期望的 HTTP 版本，默认 HTTP/2（TLS 协商失败时回退 HTTP/1.1）
+            timeout: 请求超时时间(秒)
+            max_clients: 每个异步会话（即每个 origin）同时进行的最大请求数，超出的请求排队等待
+            limiter: 按 origin 的限流器，为 None 时不限流
+        """
+        self.impersonate = impersonate
+        self.http_version = http_version
+        self.timeout = timeout
+        self.max_clients = max_clients
+        self.limiter = limiter
+        self._sessions: Dict[str, requests.Session] = {}
+        self._async_sessions: Dict[Tuple[str, int], requests.AsyncSession] = {}
+        self._lock = threading.Lock()
+        # 连接统计：{origin: {"new": 0, "reused": 0, "http2": 0}}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._seen_connections = set()
+
+    def _session_kwargs(self):
+        return {
+            "impersonate": self.impersonate,
+            "http_version": self.http_version,
+            "timeout": self.timeout,
+            # 会话只用于复用连接，不保存响应写入的 Cookie；并发请求共用会话，清空共享 Cookie 并不可靠
+            "discard_cookies": True
+        }
+
+    def get_session(self, origin: str) -> requests.Session:
+        """获取 origin 对应的同步会话，不存在时创建"""
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session(**self._session_kwargs())
+                self._sessions[origin] = session
+            return session
+
+    def get_async_session(self, origin: str) -> requests.AsyncSession:
+        """获取 origin 在当前事件循环中的异步会话，不存在时创建"""
+        key = (origin, id(asyncio.get_running_loop()))
+        session = self._async_sessions.get(key)
+        if session is None:
+            session = requests.AsyncSession(max_clients=self.max_clients, **self._session_kwargs())
+            self._async_sessions[key] = session
+        return session
+
+    def _record(self, origin: str, response) -> None:
+        """根据本地端口判断连接是新建还是复用"""
+        connection = (origin, response.local_ip, response.local_port)
+        with self._lock:
+            stats = self._stats.setdefault(origin, {"new": 0, "reused": 0, "http2": 0})
+            if connection in self._seen_connections:
+                stats["reused"] += 1
+            else:
+                self._seen_connections.add(connection)
+                stats["new"] += 1
+            if response.http_version == CurlHttpVersion.V2_0:
+                stats["http2"] += 1
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        通过对应 origin 的会话发送同步请求
+
+        异常:
+            RateLimitedError: 启用限流器且响应为 429 或 Cloudflare 质询
+        """
+        origin = url_origin(url)
+        session = self.get_session(origin)
+        if self.limiter is not None:
+            self.limiter.acquire(origin)
+        response = session.request(method, url, **kwargs)
+        self._record(origin, response)
+        if self.limiter is not None:
+            self.limiter.observe(origin, response)
+        return response
+
+    async def async_request(self, method: str, url: str, **kwargs):
+        """
+        通过对应 origin 的会话发送异步请求
+
+        异常:
+            RateLimitedError: 启用限流器且响应为 429 或 Cloudflare 质询
+        """
+        origin = url_origin(url)
+        session = self.get_async_session(origin)
+        if self.limiter is not None:
+            await self.limiter.async_acquire(origin)
+        response = await session.request(method, url, **kwargs)
+        self._record(origin, response)
+        if self.limiter is not None:
+            self.limiter.observe(origin, response)
+        return response
+
+    def connection_stats(self) -> Dict[str, Dict[str, int]]:
+        """返回各 origin 的连接统计副本"""
+        with self._lock:
+            return {origin: dict(stats) for origin, stats in self._stats.items()}
+
+    async def aclose_loop(self) -> None:
+        """关闭当前事件循环创建的异步会话"""
+        loop_id = id(asyncio.get_running_loop())
+        for key in [k for k in self._async_sessions if k[1] == loop_id]:
+            session = self._async_sessions.pop(key)
+            try:
+                await session.close()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """关闭全部同步会话"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+
+class ShardPlan:
+    """
+    账号分片
+
+    多台机器各自运行一个分片，按账号稳定标识（用户名或 Cookie 摘要）的哈希决定账号归属，
+    与账号在配置中的位置无关，追加新账号不会改变已有账号所在的分片。
+    """
+
+    def __init__(self, index: int = 0, count: int = 1):
+        """
+        初始化
+
+        参数:
+            index: 当前分片序号，从 0 开始
+            count: 分片总数，1 表示不分片
+        """
+        self.index = index
+        self.count = count
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 1
+
+    @property
+    def valid(self) -> bool:
+        return self.count >= 1 and 0 <= self.index < self.count
+
+    @property
+    def label(self) -> str:
+        return f"分片 {self.index + 1}/{self.count}"
+
+    def shard_of(self, key: str) -> int:
+        """账号所属的分片序号"""
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % self.count
+
+    def select(self, accounts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """筛选属于当前分片的账号，账号需带有稳定标识 key"""
+        if not self.enabled:
+            return accounts
+        return [account for account in accounts if self.shard_of(account['key']) == self.index]
+
+
+class ShardSummaryBoard:
+    """
+    分片汇总目录
+
+    各分片运行结束后把本分片的账号结果写入共享目录（如 NFS、同步盘），
+    最后一个写入的分片发现所有分片都已完成时合并结果，并抢占发送标记，保证同一天只发一条合并通知。
+    """
+
+    def __init__(self, directory: str):
+        """
+        初始化
+
+        参数:
+            directory: 各分片共享的汇总目录
+        """
+        self.directory = directory
+
+    def _path(self, site: str, run_date: str, name: str) -> str:
+        return os.path.join(self.directory, f"summary-{site}-{run_date}-{name}")
+
+    def publish(self, site: str, run_date: str, plan: ShardPlan, results: List[Dict[str, Any]]) -> None:
+        """
+        写入本分片的结果，重复运行时覆盖
+
+        参数:
+            results: 账号结果列表，每项需带有原始账号序号 index，用于合并后排序
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(site, run_date, f"shard{plan.index}of{plan.count}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"shard": plan.index, "count": plan.count, "finished_at": int(time.time()),
+                       "results": results}, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    def collect(self, site: str, run_date: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """所有分片都已写入时返回按账号序号排序的合并结果，否则返回 None"""
+        merged = []
+        for index in range(count):
+            path = self._path(site, run_date, f"shard{index}of{count}.json")
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    merged.extend(json.load(f)["results"])
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError, KeyError) as e:
+                print(f"读取分片汇总 {path} 失败: {e}")
+                return None
+        return sorted(merged, key=lambda r: r.get("index", 0))
+
+    def missing(self, site: str, run_date: str, count: int) -> List[int]:
+        """尚未写入结果的分片序号"""
+        return [
+            index for index in range(count)
+            if not os.path.exists(self._path(site, run_date, f"shard{index}of{count}.json"))
+        ]
+
+    def claim(self, site: str, run_date: str) -> bool:
+        """抢占当天合并通知的发送权，只有一个分片能成功"""
+        try:
+            fd = os.open(self._path(site, run_date, "sent"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(int(time.time())))
+        return True
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from dotenv import dotenv_values
+
+
+def spread_offset(key: str, window: float) -> float:
+    """
+    账号在签到窗口内的固定偏移(秒)
+
+    按账号稳定标识的哈希均匀分布在 [0, window) 内，同一账号每次运行的偏移相同
+    """
+    if window <= 0:
+        return 0.0
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * window
+
+
+def next_reset(tz: str = "Asia/Shanghai", now: Optional[float] = None) -> float:
+    """下一次签到日切换（时区内零点）的时间戳"""
+    zone = ZoneInfo(tz)
+    current = datetime.fromtimestamp(now if now is not None else time.time(), zone)
+    tomorrow = current.date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=zone).timestamp()
+
+
+async def sleep_until(timestamp: float, spin: float = 0.05) -> None:
+    """
+    精确等待到指定时间戳
+
+    先用 asyncio.sleep 等到目标前 spin 秒，最后一段让出事件循环自旋等待，误差在毫秒以内
+    """
+    remaining = timestamp - time.time()
+    if remaining > spin:
+        await asyncio.sleep(remaining - spin)
+    while time.time() < timestamp:
+        await asyncio.sleep(0)
+
+
+class DailySchedule:
+    """每天固定时刻的运行计划"""
+
+    def __init__(self, times: List[Tuple[int, int]], tz: str = "Asia/Shanghai"):
+        """
+        初始化
+
+        参数:
+            times: 每天运行的 (时, 分) 列表
+            tz: 时刻所在时区，默认与论坛签到日一致
+        """
+        self.times = sorted(set(times))
+        self.tz = ZoneInfo(tz)
+
+    @classmethod
+    def parse(cls, text: str, tz: str = "Asia/Shanghai") -> "DailySchedule":
+        """
+        解析逗号分隔的 HH:MM 列表，如 "00:05,12:30"
+
+        异常:
+            ValueError: 格式错误或没有任何时刻
+        """
+        times = []
+        for item in text.replace("，", ",").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            hour, _, minute = item.partition(":")
+            hour, minute = int(hour), int(minute or 0)
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError(f"无效的时刻: {item}")
+            times.append((hour, minute))
+        if not times:
+            raise ValueError("没有配置运行时刻")
+        return cls(times, tz)
+
+    def next_after(self, now: Optional[datetime] = None) -> datetime:
+        """now 之后最近的一次运行时间"""
+        now = (now or datetime.now(self.tz)).astimezone(self.tz)
+        for days in (0, 1):
+            day = now.date() + timedelta(days=days)
+            for hour, minute in self.times:
+                at = datetime(day.year, day.month, day.day, hour, minute, tzinfo=self.tz)
+                if at > now:
+                    return at
+        raise RuntimeError("unreachable")
+
+
+class EnvFileWatcher:
+    """
+    .env 文件变更检测
+
+    文件修改后重新读取并写入环境变量（覆盖已有值），从文件中删除的变量同时从环境变量中移除
+    """
+
+    def __init__(self, path: str):
+        """
+        初始化
+
+        参数:
+            path: .env 文件路径，为空时不检测
+        """
+        self.path = path
+        self._mtime = self._stat()
+        self._keys = set(dotenv_values(path)) if path and self._mtime else set()
+
+    def _stat(self) -> float:
+        try:
+            return os.stat(self.path).st_mtime if self.path else 0.0
+        except OSError:
+            return 0.0
+
+    def check(self) -> bool:
+        """文件有变化时重新加载，返回是否重新加载"""
+        mtime = self._stat()
+        if not mtime or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            values = dotenv_values(self.path)
+        except Exception as e:
+            print(f"重新读取 {self.path} 失败: {e}")
+            return False
+        for key in self._keys - set(values):
+            os.environ.pop(key, None)
+        for key, value in values.items():
+            if value is not None:
+                os.environ[key] = value
+        self._keys = set(values)
+        print(f"检测到 {self.path} 已修改，配置已重新加载")
+        return True
+
+
+class SignDaemon:
+    """
+    常驻进程的签到调度
+
+    按 DailySchedule 定时调用签到函数，进程内的会话、Cookie 和有效性缓存在多次运行之间保留；
+    等待期间定期检查 .env 变更，收到 SIGTERM/SIGINT 后在当前运行结束时退出。
+    """
+
+    def __init__(
+        self,
+        run: Callable[[], None],
+        schedule: Callable[[], DailySchedule],
+        watcher: Optional[EnvFileWatcher] = None,
+        run_on_start: bool = True,
+        check_interval: float = 30
+    ):
+        """
+        初始化
+
+        参数:
+            run: 执行一轮签到的函数
+            schedule: 返回当前运行计划的函数，配置重新加载后会重新调用
+            watcher: .env 变更检测，为 None 时不检测
+            run_on_start: 启动后是否立即运行一轮
+            check_interval: 等待期间检查 .env 的间隔(秒)
+        """
+        self.run = run
+        self.schedule = schedule
+        self.watcher = watcher
+        self.run_on_start = run_on_start
+        self.check_interval = check_interval
+        self._stop = threading.Event()
+
+    def stop(self, *_) -> None:
+        """请求退出，正在进行的运行会先完成"""
+        if not self._stop.is_set():
+            print("收到退出信号，当前运行结束后退出")
+        self._stop.set()
+
+    def _run_once(self) -> None:
+        try:
+            self.run()
+        except Exception as e:
+            print(f"本轮签到发生异常: {e}")
+
+    def _load_schedule(self, previous: Optional[DailySchedule]) -> DailySchedule:
+        try:
+            return self.schedule()
+        except ValueError as e:
+            if previous is None:
+                raise
+            print(f"运行时刻配置无效: {e}，沿用之前的配置")
+            return previous
+
+    def _wait_until(self, at: datetime) -> str:
+        """
+        等待到指定时间，期间检查配置变更
+
+        返回:
+            "due" 到达时间，"reload" 配置已重新加载需重新计算时间，"stop" 收到退出信号
+        """
+        while not self._stop.is_set():
+            remaining = (at - datetime.now(at.tzinfo)).total_seconds()
+            if remaining <= 0:
+                return "due"
+            self._stop.wait(min(self.check_interval, remaining))
+            if self.watcher is not None and self.watcher.check() and datetime.now(at.tzinfo) < at:
+                return "reload"
+        return "stop"
+
+    def run_forever(self) -> None:
+        """运行直到收到退出信号"""
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                signal.signal(sig, self.stop)
+            except ValueError:
+                # 非主线程无法设置信号处理
+                pass
+        schedule = self._load_schedule(None)
+        if self.run_on_start:
+            self._run_once()
+        while not self._stop.is_set():
+            at = schedule.next_after()
+            print(f"下次签到时间: {at.strftime('%Y-%m-%d %H:%M')}")
+            state = self._wait_until(at)
+            if state == "stop":
+                break
+            if state == "due":
+                self._run_once()
+            schedule = self._load_schedule(schedule)
+        print("签到守护进程已退出")
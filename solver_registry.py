@@ -0,0 +1,209 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class CircuitOpenError(Exception):
+    """验证码服务处于熔断状态"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    验证码服务熔断器
+
+    连续失败达到阈值后进入熔断(open)状态，期间直接拒绝请求；
+    熔断超过 reset_timeout 秒后进入半开(half_open)状态，允许一次试探，
+    试探成功恢复(closed)，失败则重新熔断。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 600):
+        """
+        初始化熔断器
+
+        参数:
+            name: 服务名称
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多少秒允许试探
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.last_error = ""
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前是否允许使用该服务"""
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            return self.state != self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self, error: Any = "") -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self, error: Any = "") -> None:
+        """立即熔断（例如健康检查失败）"""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._open()
+
+    def _open(self) -> None:
+        if self.state != self.OPEN:
+            print(f"{self.name} 验证码服务已熔断: {self.last_error}")
+        self.state = self.OPEN
+        self.opened_at = time.time()
+
+    def describe(self) -> str:
+        """熔断器状态的文字描述"""
+        states = {self.CLOSED: "正常", self.OPEN: "熔断", self.HALF_OPEN: "试探中"}
+        text = f"{self.name}: {states[self.state]}，成功 {self.successes} 次，失败 {self.failures} 次"
+        if self.state != self.CLOSED and self.last_error:
+            text += f"（{self.last_error}）"
+        return text
+
+
+class GuardedSolver:
+    """受熔断器保护的验证码解决器，记录每次解题结果，熔断期间直接失败"""
+
+    def __init__(self, solver: Any, breaker: CircuitBreaker):
+        self.solver = solver
+        self.breaker = breaker
+
+    @property
+    def poller(self):
+        return getattr(self.solver, "poller", None)
+
+    def solve(
+        self,
+        url: str,
+        sitekey: str,
+        verbose: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+        priority: int = 1,
+        on_admitted: Optional[Callable[[], None]] = None
+    ) -> str:
+        """解决 Turnstile 验证并返回令牌，熔断期间抛出 CircuitOpenError"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} 处于熔断状态")
+        try:
+            token = self.solver.solve(
+                url=url, sitekey=sitekey, verbose=verbose, cancel_event=cancel_event, priority=priority,
+                on_admitted=on_admitted
+            )
+        except Exception as e:
+            # 被对冲求解主动取消的任务不计为服务失败
+            if cancel_event is None or not cancel_event.is_set():
+                self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return token
+
+    def solve_many(
+        self,
+        tasks: Iterable[Dict[str, Any]],
+        verbose: bool = False
+    ) -> Iterator[Tuple[Any, Optional[str], Optional[Exception]]]:
+        """批量解题，产出 (key, token, error)，熔断期间所有任务直接失败"""
+        tasks = list(tasks)
+        if not self.breaker.allow():
+            for index, task in enumerate(tasks):
+                yield task.get("key", index), None, CircuitOpenError(f"{self.breaker.name} 处于熔断状态")
+            return
+        for key, token, error in self.solver.solve_many(tasks, verbose=verbose):
+            if token:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(error)
+            yield key, token, error
+
+
+class SolverRegistry:
+    """
+    单次运行内的验证码服务注册表
+
+    每个服务只创建一次解决器并缓存健康检查结果，服务不可用或连续失败后熔断，
+    后续账号直接跳过该服务，不再等待超时。
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 600):
+        """
+        初始化注册表
+
+        参数:
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多少秒允许试探
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._solvers: Dict[str, GuardedSolver] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """获取服务对应的熔断器"""
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(provider, self.failure_threshold, self.reset_timeout)
+            return self._breakers[provider]
+
+    def get(self, provider: str, factory: Callable[[], Any]) -> Optional[GuardedSolver]:
+        """
+        获取服务的解决器
+
+        参数:
+            provider: 服务名称
+            factory: 创建解决器的函数（可包含健康检查），服务不可用时返回 None
+
+        返回:
+            受熔断器保护的解决器，服务熔断或不可用时返回 None
+        """
+        breaker = self.breaker(provider)
+        with self._lock:
+            if not breaker.allow():
+                print(f"{provider} 验证码服务熔断中，跳过")
+                return None
+            if breaker.state == CircuitBreaker.HALF_OPEN:
+                # 试探时重新创建并检查服务
+                self._solvers.pop(provider, None)
+            guarded = self._solvers.get(provider)
+            if guarded is None:
+                solver = factory()
+                if solver is None:
+                    breaker.trip("服务不可用")
+                    return None
+                guarded = GuardedSolver(solver, breaker)
+                self._solvers[provider] = guarded
+            return guarded
+
+    def summary(self) -> List[str]:
+        """各服务熔断器状态"""
+        with self._lock:
+            return [breaker.describe() for breaker in self._breakers.values()]
+
+    def reset(self) -> None:
+        """清空缓存和熔断状态，开始新一轮运行时调用"""
+        with self._lock:
+            self._breakers.clear()
+            self._solvers.clear()
@@ -0,0 +1,352 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS cookies (
+        site TEXT NOT NULL,
+        account_index INTEGER NOT NULL,
+        cookie TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (site, account_index)
+    )""",
+    """CREATE TABLE IF NOT EXISTS validity (
+        key TEXT PRIMARY KEY,
+        cookie TEXT NOT NULL,
+        valid INTEGER NOT NULL,
+        checked_at INTEGER NOT NULL,
+        source TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS notifications (
+        site TEXT PRIMARY KEY,
+        last_sent_date TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        run_date TEXT NOT NULL,
+        site TEXT NOT NULL,
+        account_index INTEGER NOT NULL,
+        account_key TEXT,
+        account TEXT,
+        status TEXT NOT NULL,
+        sign_result TEXT,
+        message TEXT,
+        finished_at INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS results_by_date ON results (run_date, site, account_index)",
+]
+
+# 后续版本新增的列，打开旧数据库时自动补上
+COLUMNS = {
+    "results": [("account_key", "TEXT")],
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS results_by_key ON results (run_date, site, account_key)",
+]
+
+LEGACY_COOKIE_FILE = re.compile(r"^([A-Za-z]+)_COOKIE(?:_(\d+))?\.txt$")
+
+
+def _read_legacy_text(path: str) -> str:
+    """读取旧版 Cookie 文件，UTF-8 失败时按 GBK 读取"""
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                return f.read().strip()
+        except UnicodeDecodeError:
+            continue
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', errors='ignore').strip()
+
+
+class StateStore:
+    """
+    单文件 SQLite 状态存储
+
+    保存各账号的 Cookie、Cookie 有效性、每日通知状态和每次运行的账号结果。
+    账号结果表只追加不修改，同时作为每日完成日志，用于中断后续跑时跳过当天已完成的账号。
+    每次运行只打开一次连接；运行结果等高频写入先缓存，攒够一批后在一个事务中提交，
+    Cookie 等登录成本高的数据立即提交。SQLite 的事务保证两个运行重叠时也不会写出半个文件。
+
+    首次打开时自动导入旧版 ./cookie 目录下的 *_COOKIE_*.txt、notification_status.json
+    和 validity_cache.json，旧文件保留不删除。
+    """
+
+    def __init__(self, path: str = "./cookie/state.db", legacy_dir: Optional[str] = None, batch_size: int = 50):
+        """
+        初始化状态存储
+
+        参数:
+            path: 数据库文件路径
+            legacy_dir: 旧版状态文件目录，默认为数据库所在目录
+            batch_size: 缓存多少条写入后提交一次
+        """
+        self.path = path
+        self.legacy_dir = legacy_dir if legacy_dir is not None else (os.path.dirname(path) or ".")
+        self.batch_size = batch_size
+        self._pending: List[Tuple[str, tuple]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    # ---------------- 连接与事务 ----------------
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            for table, columns in COLUMNS.items():
+                existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for name, kind in columns:
+                    if name not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+            for statement in INDEXES:
+                conn.execute(statement)
+            self._conn = conn
+            self._migrate()
+        return self._conn
+
+    def _transaction(self, statements: List[Tuple[str, tuple]]) -> None:
+        """在一个事务中执行多条写入，失败时整体回滚"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _write(self, sql: str, params: tuple, immediate: bool = False) -> None:
+        with self._lock:
+            self._pending.append((sql, params))
+            if immediate or len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        statements, self._pending = self._pending, []
+        try:
+            self._transaction(statements)
+        except Exception as e:
+            print(f"保存运行状态失败: {e}")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            # 先提交缓存的写入，保证读到本次运行写入的数据
+            self._flush_locked()
+            return self._connection().execute(sql, params).fetchall()
+
+    def flush(self) -> None:
+        """提交缓存的写入"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        """提交缓存的写入并关闭连接"""
+        with self._lock:
+            self._flush_locked()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------------- 旧版文件迁移 ----------------
+    def _migrate(self) -> None:
+        """导入旧版状态文件，只执行一次"""
+        conn = self._conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+            return
+        statements: List[Tuple[str, tuple]] = []
+        cookies = 0
+        try:
+            names = sorted(os.listdir(self.legacy_dir)) if os.path.isdir(self.legacy_dir) else []
+        except OSError:
+            names = []
+        for name in names:
+            match = LEGACY_COOKIE_FILE.match(name)
+            if not match:
+                continue
+            try:
+                cookie = _read_legacy_text(os.path.join(self.legacy_dir, name))
+            except OSError as e:
+                print(f"读取旧版Cookie文件 {name} 失败: {e}")
+                continue
+            if cookie:
+                statements.append((
+                    "INSERT OR IGNORE INTO cookies (site, account_index, cookie, updated_at) VALUES (?, ?, ?, ?)",
+                    (match.group(1).lower(), int(match.group(2) or 0), cookie,
+                     int(os.path.getmtime(os.path.join(self.legacy_dir, name))))
+                ))
+                cookies += 1
+
+        notifications = self._load_legacy_json("notification_status.json")
+        for site, status in notifications.items():
+            if isinstance(status, dict) and status.get("last_sent_date"):
+                statements.append((
+                    "INSERT OR IGNORE INTO notifications (site, last_sent_date) VALUES (?, ?)",
+                    (site, status["last_sent_date"])
+                ))
+
+        validity = self._load_legacy_json("validity_cache.json")
+        for key, entry in validity.items():
+            if isinstance(entry, dict) and entry.get("cookie"):
+                statements.append((
+                    "INSERT OR IGNORE INTO validity (key, cookie, valid, checked_at, source) VALUES (?, ?, ?, ?, ?)",
+                    (key, entry["cookie"], int(bool(entry.get("valid"))), int(entry.get("checked_at", 0)),
+                     entry.get("source"))
+                ))
+
+        # 迁移标记与数据在同一事务中写入，两个进程同时首次运行时只有一个会真正导入
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+                conn.execute("ROLLBACK")
+                return
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', ?)", (str(int(time.time())),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if statements:
+            print(f"已将旧版状态文件（{cookies} 个Cookie文件、通知状态、有效性缓存）导入 {self.path}，旧文件可手动删除")
+
+    def _load_legacy_json(self, name: str) -> Dict[str, Any]:
+        path = os.path.join(self.legacy_dir, name)
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"读取旧版状态文件 {name} 失败: {e}")
+        return {}
+
+    # ---------------- Cookie ----------------
+    def get_cookie(self, site: str, account_index: Optional[int] = None) -> str:
+        """读取账号保存的 Cookie，没有时返回空字符串"""
+        rows = self._query(
+            "SELECT cookie FROM cookies WHERE site = ? AND account_index = ?",
+            (site.lower(), account_index or 0)
+        )
+        return rows[0][0] if rows else ""
+
+    def set_cookie(self, site: str, account_index: Optional[int], cookie: str) -> None:
+        """保存账号的 Cookie，立即提交"""
+        self._write(
+            "INSERT INTO cookies (site, account_index, cookie, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (site, account_index) DO UPDATE SET cookie = excluded.cookie, updated_at = excluded.updated_at",
+            (site.lower(), account_index or 0, cookie, int(time.time())),
+            immediate=True
+        )
+
+    def cookie_updated_at(self, site: str, account_index: Optional[int] = None) -> int:
+        """Cookie 最近一次保存的时间戳，没有时返回 0"""
+        rows = self._query(
+            "SELECT updated_at FROM cookies WHERE site = ? AND account_index = ?",
+            (site.lower(), account_index or 0)
+        )
+        return rows[0][0] if rows else 0
+
+    # ---------------- Cookie 有效性 ----------------
+    def load_validity(self) -> Dict[str, dict]:
+        """读取全部 Cookie 有效性记录"""
+        return {
+            key: {"cookie": cookie, "valid": bool(valid), "checked_at": checked_at, "source": source}
+            for key, cookie, valid, checked_at, source in self._query(
+                "SELECT key, cookie, valid, checked_at, source FROM validity"
+            )
+        }
+
+    def save_validity(self, entries: Dict[str, dict], removed: List[str] = ()) -> None:
+        """在一个事务中写入有效性记录的变更"""
+        statements = [(
+            "INSERT OR REPLACE INTO validity (key, cookie, valid, checked_at, source) VALUES (?, ?, ?, ?, ?)",
+            (key, entry["cookie"], int(bool(entry.get("valid"))), int(entry.get("checked_at", 0)), entry.get("source"))
+        ) for key, entry in entries.items()]
+        statements += [("DELETE FROM validity WHERE key = ?", (key,)) for key in removed]
+        with self._lock:
+            self._pending.extend(statements)
+            self._flush_locked()
+
+    # ---------------- 通知状态 ----------------
+    def get_notification_date(self, site: str) -> Optional[str]:
+        """站点最近一次发送汇总通知的日期"""
+        rows = self._query("SELECT last_sent_date FROM notifications WHERE site = ?", (site,))
+        return rows[0][0] if rows else None
+
+    def set_notification_date(self, site: str, date: str) -> None:
+        """记录站点发送汇总通知的日期"""
+        self._write(
+            "INSERT OR REPLACE INTO notifications (site, last_sent_date) VALUES (?, ?)",
+            (site, date),
+            immediate=True
+        )
+
+    # ---------------- 运行结果 ----------------
+    def record_result(
+        self,
+        run_id: str,
+        run_date: str,
+        site: str,
+        account_index: int,
+        account: str,
+        status: str,
+        sign_result: Optional[str] = None,
+        message: str = "",
+        account_key: Optional[str] = None,
+        immediate: bool = False
+    ) -> None:
+        """
+        追加一个账号在本次运行中的结果
+
+        参数:
+            account_key: 账号的稳定标识，不随账号在配置中的顺序变化
+            immediate: 是否立即提交，作为完成日志使用时应立即提交，避免进程被杀后丢失
+        """
+        self._write(
+            "INSERT INTO results (run_id, run_date, site, account_index, account_key, account, status, sign_result, "
+            "message, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, run_date, site, account_index, account_key, account, status, sign_result, message,
+             int(time.time())),
+            immediate=immediate
+        )
+
+    def completed_accounts(self, run_date: str, site: str) -> Dict[str, dict]:
+        """当天已签到成功（含已签到过）的账号，按 account_key 返回最近一条结果"""
+        rows = self._query(
+            "SELECT account_key, account, sign_result, message, finished_at FROM results "
+            "WHERE run_date = ? AND site = ? AND status = 'success' AND account_key IS NOT NULL ORDER BY id",
+            (run_date, site)
+        )
+        return {
+            key: {"account": account, "sign_result": sign_result, "message": message, "finished_at": finished_at}
+            for key, account, sign_result, message, finished_at in rows
+        }
+
+    def results(self, run_date: str, site: Optional[str] = None) -> List[dict]:
+        """查询某天的账号结果，按写入顺序返回"""
+        sql = ("SELECT run_id, run_date, site, account_index, account_key, account, status, sign_result, message, "
+               "finished_at FROM results WHERE run_date = ?")
+        params: tuple = (run_date,)
+        if site is not None:
+            sql += " AND site = ?"
+            params += (site,)
+        columns = ("run_id", "run_date", "site", "account_index", "account_key", "account", "status", "sign_result",
+                   "message", "finished_at")
+        return [dict(zip(columns, row)) for row in self._query(sql + " ORDER BY id", params)]
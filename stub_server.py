@@ -0,0 +1,363 @@
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """客户端提前断开（如收益预取被取消）时不打印异常"""
+
+    daemon_threads = True
+    # 默认监听队列只有 5，大量并发新连接会被丢弃重传，测不出真实的并发效果
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    本地模拟服务，用于离线测试和性能基准
+
+    模拟论坛的签到、收益、登录接口以及 CloudFreed / YesCaptcha 的验证码接口，
+    可配置响应延迟、错误率、收益流水条数和验证码服务容量。
+
+    路径约定:
+        /<站点>/api/attendance                 签到
+        /<站点>/api/account/credit/page-N      收益流水
+        /<站点>/signIn.html                    登录页面
+        /<站点>/api/account/signIn             登录
+        /cloudfreed/createTask、getTaskResult   CloudFreed 接口
+        /yescaptcha/createTask、getTaskResult   YesCaptcha 接口
+
+    Cookie 形如 session=stub-<用户名>，其余 Cookie 视为无效；同一用户每天只能签到一次。
+    """
+
+    SESSION_PREFIX = "stub-"
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        ledger_size: int = 200,
+        page_size: int = 10,
+        record_interval: float = 12,
+        solve_time: float = 1.5,
+        captcha_slots: int = 0,
+        captcha_error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        """
+        初始化模拟服务
+
+        参数:
+            host: 监听地址
+            port: 监听端口，为 0 时自动分配
+            latency: 论坛接口的平均响应延迟(秒)
+            jitter: 延迟的随机波动范围(秒)
+            error_rate: 论坛接口返回 500 的概率
+            ledger_size: 每个用户已有的收益流水条数
+            page_size: 每页流水条数
+            record_interval: 相邻两条流水的间隔(小时)
+            solve_time: 验证码解题耗时(秒)
+            captcha_slots: 验证码服务同时解题的数量，为 0 时不限制
+            captcha_error_rate: 验证码任务失败的概率
+            seed: 随机数种子，便于重复测试
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.ledger_size = ledger_size
+        self.page_size = page_size
+        self.record_interval = record_interval
+        self.solve_time = solve_time
+        self.captcha_slots = captcha_slots
+        self.captcha_error_rate = captcha_error_rate
+        self.random = random.Random(seed)
+        self.counts: Dict[str, int] = {}
+        self._ledgers: Dict[str, List[list]] = {}
+        self._signed: Dict[str, str] = {}
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._slot_free_at: List[float] = []
+        self._lock = threading.Lock()
+        self._httpd = _QuietHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """服务根地址"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """在当前线程中运行服务，直到被中断"""
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        """停止服务"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def site_config(self, site_name: str, site_config: Dict[str, Any]) -> Dict[str, Any]:
+        """把站点配置中的论坛地址替换为模拟服务地址"""
+        config = dict(site_config)
+        for key, value in site_config.items():
+            if isinstance(value, str) and value.startswith("https://"):
+                path = urlparse(value).path
+                config[key] = f"{self.url}/{site_name}{path}"
+        return config
+
+    def captcha_url(self, provider: str) -> str:
+        """验证码服务地址，provider 为 cloudfreed 或 yescaptcha"""
+        return f"{self.url}/{provider}"
+
+    def request_count(self) -> int:
+        """收到的请求总数"""
+        with self._lock:
+            return sum(self.counts.values())
+
+    def endpoint_counts(self) -> Dict[str, int]:
+        """各接口收到的请求数"""
+        with self._lock:
+            return dict(self.counts)
+
+    def reset_counts(self) -> None:
+        """清零请求计数"""
+        with self._lock:
+            self.counts.clear()
+
+    def new_day(self) -> None:
+        """清除签到状态，模拟进入新的一天"""
+        with self._lock:
+            self._signed.clear()
+
+    # ---------------- 模拟数据 ----------------
+    def _count(self, endpoint: str) -> None:
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def _delay(self) -> None:
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            time.sleep(delay)
+
+    def _failed(self, rate: float) -> bool:
+        return rate > 0 and self.random.random() < rate
+
+    def _user(self, cookie_header: str) -> Optional[str]:
+        """从 Cookie 中取出用户名，Cookie 无效时返回 None"""
+        match = re.search(r"(?:^|;\s*)session=([^;]+)", cookie_header or "")
+        if not match or not match.group(1).startswith(self.SESSION_PREFIX):
+            return None
+        return match.group(1)[len(self.SESSION_PREFIX):]
+
+    def _ledger(self, user: str) -> List[list]:
+        """用户的收益流水，最新的在前，按小时取整使多次运行的时间戳保持一致"""
+        with self._lock:
+            if user not in self._ledgers:
+                now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+                self._ledgers[user] = [[
+                    5,
+                    1000 - i,
+                    "签到收益5个鸡腿",
+                    (now - timedelta(hours=self.record_interval * (i + 1))).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+                ] for i in range(self.ledger_size)]
+            return self._ledgers[user]
+
+    def _sign(self, user: str) -> Dict[str, Any]:
+        today = datetime.now(timezone(timedelta(hours=8))).strftime('%Y-%m-%d')
+        ledger = self._ledger(user)
+        with self._lock:
+            if self._signed.get(user) == today:
+                return {"success": False, "message": "今日已完成签到"}
+            self._signed[user] = today
+            balance = ledger[0][1] + 5 if ledger else 5
+            ledger.insert(0, [5, balance, "签到收益5个鸡腿",
+                              datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')])
+        return {"success": True, "message": "签到成功，获得 5 个鸡腿"}
+
+    def _create_task(self) -> str:
+        """创建验证码任务，服务容量用满时排在最早空出的位置之后"""
+        now = time.time()
+        with self._lock:
+            start = now
+            if self.captcha_slots > 0:
+                if len(self._slot_free_at) < self.captcha_slots:
+                    self._slot_free_at.append(now)
+                slot = min(range(len(self._slot_free_at)), key=lambda i: self._slot_free_at[i])
+                start = max(now, self._slot_free_at[slot])
+            ready_at = start + self.solve_time
+            if self.captcha_slots > 0:
+                self._slot_free_at[slot] = ready_at
+            task_id = uuid.uuid4().hex
+            self._tasks[task_id] = {"ready_at": ready_at, "failed": self._failed(self.captcha_error_rate)}
+        return task_id
+
+    def _task_state(self, task_id: str) -> str:
+        """返回 processing、ready、failed 或 missing"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            return "missing"
+        if time.time() < task["ready_at"]:
+            return "processing"
+        return "failed" if task["failed"] else "ready"
+
+    # ---------------- 请求处理 ----------------
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, data: Any, status: int = 200, cookie: Optional[str] = None) -> None:
+                if isinstance(data, (dict, list)):
+                    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                    content_type = "application/json; charset=utf-8"
+                else:
+                    body = str(data).encode('utf-8')
+                    content_type = "text/html; charset=utf-8"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if cookie:
+                    self.send_header("Set-Cookie", f"session={cookie}; Path=/")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> Dict[str, Any]:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    return json.loads(raw.decode('utf-8')) if raw else {}
+                except ValueError:
+                    return {}
+
+            def do_GET(self):
+                self._route("GET", {})
+
+            def do_POST(self):
+                self._route("POST", self._body())
+
+            def _route(self, method: str, body: Dict[str, Any]) -> None:
+                path = urlparse(self.path).path
+                parts = path.strip("/").split("/", 1)
+                prefix, rest = parts[0], "/" + (parts[1] if len(parts) > 1 else "")
+                if prefix in ("cloudfreed", "yescaptcha"):
+                    self._captcha(prefix, rest, body)
+                else:
+                    self._forum(method, rest, body)
+
+            def _forum(self, method: str, path: str, body: Dict[str, Any]) -> None:
+                page = re.fullmatch(r"/api/account/credit/page-(\d+)", path)
+                endpoint = {
+                    "/api/attendance": "attendance",
+                    "/signIn.html": "login_page",
+                    "/api/account/signIn": "login"
+                }.get(path, "credit" if page else "other")
+                stub._count(endpoint)
+                stub._delay()
+                if stub._failed(stub.error_rate):
+                    self._send("Internal Server Error", 500)
+                    return
+
+                if endpoint == "login_page":
+                    self._send("<html><body>signIn</body></html>")
+                elif endpoint == "login" and method == "POST":
+                    if not body.get("username") or not body.get("token"):
+                        self._send({"success": False, "message": "验证码错误"})
+                        return
+                    self._send({"success": True, "message": "登录成功"},
+                               cookie=f"{stub.SESSION_PREFIX}{body['username']}")
+                elif endpoint == "attendance" and method == "POST":
+                    user = stub._user(self.headers.get("Cookie"))
+                    if user is None:
+                        self._send({"success": False, "status": 404, "message": "USER NOT FOUND"})
+                        return
+                    self._send(stub._sign(user))
+                elif endpoint == "credit":
+                    user = stub._user(self.headers.get("Cookie"))
+                    if user is None:
+                        self._send({"success": False, "message": "请先登录"}, 403)
+                        return
+                    index = (int(page.group(1)) - 1) * stub.page_size
+                    records = stub._ledger(user)[index:index + stub.page_size]
+                    self._send({"success": True, "data": records})
+                else:
+                    self._send("Not Found", 404)
+
+            def _captcha(self, provider: str, path: str, body: Dict[str, Any]) -> None:
+                stub._count(f"{provider}{path.replace('/', '.') if path != '/' else '.health'}")
+                if path == "/createTask":
+                    self._send({"errorId": 0, "taskId": stub._create_task()})
+                elif path == "/getTaskResult":
+                    state = stub._task_state(str(body.get("taskId")))
+                    token = f"stub-token-{uuid.uuid4().hex}"
+                    if state == "processing":
+                        self._send({"errorId": 0, "status": "processing"})
+                    elif state == "ready" and provider == "cloudfreed":
+                        self._send({"errorId": 0, "status": "completed", "result": {"response": {"token": token}}})
+                    elif state == "ready":
+                        self._send({"errorId": 0, "status": "ready", "solution": {"token": token}})
+                    elif provider == "cloudfreed":
+                        self._send({"errorId": 1, "status": "failed"}, 500)
+                    else:
+                        self._send({"errorId": 1, "errorDescription": "ERROR_CAPTCHA_UNSOLVABLE"})
+                else:
+                    self._send({"status": "ok"})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.05, help="论坛接口平均延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机波动(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="论坛接口返回 500 的概率")
+    parser.add_argument("--ledger-size", type=int, default=200, help="每个用户的收益流水条数")
+    parser.add_argument("--solve-time", type=float, default=1.5, help="验证码解题耗时(秒)")
+    parser.add_argument("--captcha-slots", type=int, default=0, help="验证码服务同时解题数量，0 为不限制")
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0, help="验证码任务失败的概率")
+    args = parser.parse_args()
+
+    server = StubServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        ledger_size=args.ledger_size,
+        solve_time=args.solve_time,
+        captcha_slots=args.captcha_slots,
+        captcha_error_rate=args.captcha_error_rate
+    )
+    print(f"模拟服务已启动: {server.url}")
+    print(f"CloudFreed: {server.captcha_url('cloudfreed')}  YesCaptcha: {server.captcha_url('yescaptcha')}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("模拟服务已停止")
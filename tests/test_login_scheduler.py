@@ -0,0 +1,37 @@
+import random
+
+from login_scheduler import LoginScheduler
+
+
+def solve(scheduler, latency, ok=True):
+    """占满全部名额后完成一次解题，模拟并发用满时的结果"""
+    while scheduler.in_flight < scheduler.limit:
+        scheduler.acquire()
+    scheduler.release(ok, latency)
+
+
+def test_noisy_steady_latency_keeps_capacity():
+    scheduler = LoginScheduler(initial_capacity=2, max_capacity=8)
+    rng = random.Random(1)
+    # 开头一次特别快的解题，之后耗时在 4~8 秒之间波动但整体稳定
+    solve(scheduler, 2.0)
+    for _ in range(200):
+        solve(scheduler, rng.uniform(4.0, 8.0))
+    assert scheduler.limit == 8
+
+
+def test_sustained_slowdown_lowers_capacity():
+    scheduler = LoginScheduler(initial_capacity=2, max_capacity=8)
+    rng = random.Random(2)
+    for _ in range(50):
+        solve(scheduler, rng.uniform(4.0, 8.0))
+    assert scheduler.limit == 8
+    for _ in range(5):
+        solve(scheduler, rng.uniform(15.0, 20.0))
+    assert scheduler.limit < 8
+
+
+def test_failure_halves_capacity():
+    scheduler = LoginScheduler(initial_capacity=4, max_capacity=8)
+    solve(scheduler, None, ok=False)
+    assert scheduler.limit == 2
@@ -0,0 +1,48 @@
+import glob
+import json
+import os
+
+import pytest
+
+import benchmark
+
+# 登录流程中产生的 span，每一条都应带上所属账号
+LOGIN_PHASES = {"login", "login_page", "captcha", "login_submit", "probe"}
+
+
+@pytest.fixture
+def environ():
+    saved = dict(os.environ)
+    yield
+    os.environ.clear()
+    os.environ.update(saved)
+
+
+def run_traced(tmp_path, accounts):
+    """用模拟服务跑一次流水线签到，返回 trace 文件中的全部 span"""
+    trace_dir = tmp_path / "trace"
+    os.environ["TRACE_DIR"] = str(trace_dir)
+    os.environ["CAPTCHA_ADAPTIVE"] = "false"
+    args = benchmark.parse_args([
+        "--accounts", str(accounts), "--runs", "1", "--async", "--latency", "0.01",
+        "--solve-time", "0.1", "--workdir", str(tmp_path / "work")
+    ])
+    summary = benchmark.run_benchmark(args)[0]
+    assert summary["statuses"] == {"success": accounts}
+    spans = []
+    for path in glob.glob(str(trace_dir / "trace-*.jsonl")):
+        with open(path, encoding="utf-8") as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+@pytest.mark.parametrize("accounts", [1, 3], ids=["single", "batch"])
+def test_login_spans_carry_account(tmp_path, environ, accounts):
+    spans = [span for span in run_traced(tmp_path, accounts) if span["phase"] in LOGIN_PHASES]
+    assert {"login", "login_page", "captcha", "login_submit"} <= {span["phase"] for span in spans}
+    missing = [span for span in spans if span.get("account") is None]
+    assert not missing, missing
+    logged_in = {span["account"] for span in spans if span["phase"] == "login_submit"}
+    assert logged_in == set(range(1, accounts + 1))
+    batched = any(span.get("batch") for span in spans if span["phase"] == "login")
+    assert batched == (accounts > 1)
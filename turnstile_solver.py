@@ -1,7 +1,11 @@
 from curl_cffi import requests
 import time
-from typing import Dict, Optional, Any, Union
+import threading
+from typing import Callable, Dict, Optional, Any, Union, Iterable, Iterator, Tuple
 import json
+from captcha_poller import AdaptivePoller, fixed_schedule
+from login_scheduler import LoginScheduler
+from run_trace import RunTracer
 
 class TurnstileSolverError(Exception):
     """Turnstile 解决器错误基类"""
@@ -20,7 +24,10 @@ class TurnstileSolver:
         client_key: str,
         max_retries: int = 20,
         retry_interval: int = 6,
-        timeout: int = 60
+        timeout: int = 60,
+        poller: Optional[AdaptivePoller] = None,
+        scheduler: Optional[LoginScheduler] = None,
+        tracer: Optional[RunTracer] = None
     ):
         """
         初始化 Turnstile 验证码解决器
@@ -31,6 +38,10 @@ class TurnstileSolver:
             max_retries: 最大重试次数
             retry_interval: 重试间隔(秒)
             timeout: 请求超时时间(秒)
+            poller: 自适应轮询，提供时按历史耗时安排查询时间并记录每次解题耗时，
+                    不提供时按 retry_interval 固定间隔查询
+            scheduler: 并发调度，提供时同时进行的任务数不超过服务容量，其余按优先级排队
+            tracer: 运行记录，提供时记录每个任务的解题耗时（不含排队时间）
         """
         self.create_task_url = f"{api_base_url}/createTask"
         self.get_result_url = f"{api_base_url}/getTaskResult"
@@ -38,6 +49,28 @@ class TurnstileSolver:
         self.max_retries = max_retries
         self.retry_interval = retry_interval
         self.timeout = timeout
+        self.poller = poller
+        self.scheduler = scheduler
+        self.tracer = tracer
+    
+    def _schedule(self) -> Iterator[float]:
+        """每次查询结果前需要等待的秒数"""
+        if self.poller:
+            return self.poller.schedule()
+        return fixed_schedule(self.max_retries, self.retry_interval)
+    
+    def _record(self, started: float, polls: int, ok: bool) -> None:
+        """记录一次解题的耗时和查询次数"""
+        if self.poller:
+            self.poller.record(time.time() - started, polls, ok)
+    
+    def _finish(self, admitted: float, ok: Optional[bool], polls: int, **attrs: Any) -> None:
+        """归还调度名额并记录本次解题"""
+        duration = time.time() - admitted
+        if self.scheduler:
+            self.scheduler.release(ok, duration)
+        if self.tracer:
+            self.tracer.record("captcha", admitted, duration, provider="cloudfreed", ok=ok, polls=polls, **attrs)
     
     def health_check(self):
         """检查CloudFreed服务是否可用"""
@@ -95,6 +128,101 @@ class TurnstileSolver:
             print(f"CloudFreed 服务健康检查失败: {e}")
             return False
     
+    def _create_task(
+        self,
+        url: str,
+        sitekey: str,
+        proxy: Optional[Dict[str, Union[str, int]]] = None,
+        verbose: bool = False
+    ) -> str:
+        """创建 Turnstile 验证任务并返回 taskId"""
+        payload_dict = {
+            "clientKey": self.client_key,
+            "type": "Turnstile",
+            "url": url,
+            "siteKey": sitekey 
+        }
+        
+        if proxy:
+            payload_dict["proxy"] = proxy
+            
+        payload = json.dumps(payload_dict)
+        
+        headers = {"Content-Type": "application/json"}
+        response = requests.post(
+            self.create_task_url, 
+            data=payload,
+            headers=headers,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        
+        if verbose:
+            print(f"创建任务状态码: {response.status_code}")
+            print(f"创建任务响应内容: {response.json()}")
+            
+        result = response.json()
+        task_id = result.get('taskId')
+        
+        if not task_id:
+            raise TurnstileSolverError("未能获取到taskId")
+        return task_id
+    
+    def _poll_task(self, task_id: str, verbose: bool = False) -> Optional[str]:
+        """
+        查询一次任务结果
+        
+        返回:
+            任务完成时返回验证令牌，未完成时返回 None
+        """
+        # 转换为字符串形式的JSON
+        result_payload = json.dumps({
+            "clientKey": self.client_key,
+            "taskId": task_id
+        })
+        
+        result_response = requests.post(
+            self.get_result_url, 
+            data=result_payload,
+            headers={"Content-Type": "application/json"},
+            timeout=self.timeout
+        )
+        result_response.raise_for_status()
+        
+        if verbose:
+            print(f"获取结果状态码: {result_response.status_code}")
+            
+        result_data = result_response.json()
+        
+        # 检查任务是否完成
+        if result_data.get('status') != 'completed':
+            if verbose:
+                print(f"获取结果响应内容: {result_data}")
+            return None
+            
+        if verbose:
+            print("Turnstile 验证成功完成!")
+            
+        # 调整令牌获取方式，处理嵌套结构
+        result_obj = result_data.get('result', {})
+        response_obj = result_obj.get('response', {})
+        
+        # 检查响应结构
+        if isinstance(response_obj, dict) and 'token' in response_obj:
+            # 新的响应格式
+            token = response_obj.get('token')
+        else:
+            # 兼容旧响应格式
+            token = response_obj
+        
+        if not token:
+            raise TurnstileSolverError("未找到验证令牌")
+        
+        if verbose:
+            print(f"验证令牌: {token[:30]}...{token[-10:]}")
+            
+        return token
+    
     def solve(
         self,
         url: str,
@@ -102,7 +230,10 @@ class TurnstileSolver:
         action: Optional[str] = None,
         user_agent: Optional[str] = None,
         proxy: Optional[Dict[str, Union[str, int]]] = None,
-        verbose: bool = False
+        verbose: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+        priority: int = LoginScheduler.EXPIRED_COOKIE,
+        on_admitted: Optional[Callable[[], None]] = None
     ) -> str:
         """
         解决 Turnstile 验证并返回令牌
@@ -114,114 +245,174 @@ class TurnstileSolver:
             user_agent: 自定义 User-Agent
             proxy: 代理配置 {"scheme": "http", "host": "127.0.0.1", "port": 8080}
             verbose: 是否打印详细日志
+            cancel_event: 取消事件，被设置后放弃排队和轮询（例如对冲求解中另一服务已先返回）
+            priority: 排队优先级，数值小的优先，仅在配置了调度器时生效
+            on_admitted: 排队结束、开始创建任务时的回调，对冲求解从此时开始计时
             
         返回:
             验证令牌字符串
             
         异常:
-            TurnstileSolverError: 解决验证码时出错
+            TurnstileSolverError: 解决验证码时出错或被取消
         """
+        if self.scheduler and not self.scheduler.acquire(priority, cancel_event):
+            raise TurnstileSolverError("验证任务已取消")
+        if on_admitted is not None:
+            on_admitted()
+        
         if verbose:
             print("正在创建 Turnstile 验证任务...")
             
-        payload_dict = {
-            "clientKey": self.client_key,
-            "type": "Turnstile",
-            "url": url,
-            "siteKey": sitekey 
-        }
-        
-        if proxy:
-            payload_dict["proxy"] = proxy
-            
-        payload = json.dumps(payload_dict)
-            
+        admitted = time.time()
+        ok = None
+        polls = 0
         try:
             # 创建任务
-            headers = {"Content-Type": "application/json"}
-            response = requests.post(
-                self.create_task_url, 
-                data=payload,
-                headers=headers,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
-            
-            if verbose:
-                print(f"创建任务状态码: {response.status_code}")
-                print(f"创建任务响应内容: {response.json()}")
-                
-            result = response.json()
-            task_id = result.get('taskId')
-            
-            if not task_id:
-                raise TurnstileSolverError("未能获取到taskId")
-                
-            # 准备获取结果参数
-            result_payload_dict = {
-                "clientKey": self.client_key,
-                "taskId": task_id
-            }
-
-            # 转换为字符串形式的JSON
-            result_payload = json.dumps(result_payload_dict)
+            task_id = self._create_task(url, sitekey, proxy, verbose)
+            started = time.time()
 
             # 轮询获取结果
-            for attempt in range(1, self.max_retries + 1):
-                if verbose:
-                    print(f"\n正在获取 Turnstile 验证结果，尝试 {attempt}/{self.max_retries}...")
-                
-                result_response = requests.post(
-                    self.get_result_url, 
-                    data=result_payload,
-                    headers=headers,
-                    timeout=self.timeout
-                )
-                result_response.raise_for_status()
+            for delay in self._schedule():
+                if delay:
+                    if verbose:
+                        print(f"等待 {delay:.1f} 秒后获取结果...")
+                    if cancel_event is None:
+                        time.sleep(delay)
+                    elif cancel_event.wait(delay):
+                        raise TurnstileSolverError("验证任务已取消")
                 
+                polls += 1
                 if verbose:
-                    print(f"获取结果状态码: {result_response.status_code}")
-                    
-                result_data = result_response.json()
+                    print(f"\n正在获取 Turnstile 验证结果，第 {polls} 次尝试...")
                 
-                if verbose and not result_data.get('status') == 'completed':
-                    print(f"获取结果响应内容: {result_data}")
-                    
-                # 检查任务是否完成
-                if result_data.get('status') == 'completed':
-                    if verbose:
-                        print("Turnstile 验证成功完成!")
-                        
-                    # 调整令牌获取方式，处理嵌套结构
-                    result_obj = result_data.get('result', {})
-                    response_obj = result_obj.get('response', {})
-                    
-                    # 检查响应结构
-                    if isinstance(response_obj, dict) and 'token' in response_obj:
-                        # 新的响应格式
-                        token = response_obj.get('token')
-                    else:
-                        # 兼容旧响应格式
-                        token = response_obj
-                    
-                    if not token:
-                        raise TurnstileSolverError("未找到验证令牌")
-                    
-                    if verbose:
-                        print(f"验证令牌: {token[:30]}...{token[-10:]}")
-                        
+                token = self._poll_task(task_id, verbose)
+                if token:
+                    self._record(started, polls, True)
+                    ok = True
                     return token
-                
-                # 如果未完成且不是最后一次尝试，等待后重试
-                if attempt < self.max_retries:
-                    if verbose:
-                        print(f"等待 {self.retry_interval} 秒后重试...")
-                    time.sleep(self.retry_interval)
             
-            raise TurnstileSolverError(f"达到最大重试次数 ({self.max_retries})，验证失败")
+            self._record(started, polls, False)
+            raise TurnstileSolverError(f"达到最大重试次数 ({polls})，验证失败")
             
         except requests.exceptions.RequestException as e:
+            ok = False
             raise TurnstileSolverError(f"请求错误: {e}")
+        except TurnstileSolverError:
+            # 被主动取消的任务不参与容量探测
+            if cancel_event is None or not cancel_event.is_set():
+                ok = False
+            raise
+        finally:
+            self._finish(admitted, ok, polls)
+    
+    def solve_many(
+        self,
+        tasks: Iterable[Dict[str, Any]],
+        verbose: bool = False
+    ) -> Iterator[Tuple[Any, Optional[str], Optional[TurnstileSolverError]]]:
+        """
+        批量解决 Turnstile 验证，在同一个轮询循环中查询所有任务；
+        配置了调度器时按优先级排队，进行中的任务数不超过服务容量，否则一次性创建全部任务
+        
+        参数:
+            tasks: 任务列表，每项为 {"key": 标识, "url": 目标网站 URL, "sitekey": sitekey, "proxy": 可选代理,
+                   "priority": 可选排队优先级, "trace": 可选的运行记录属性（如 account）}，未提供 key 时使用任务序号
+            verbose: 是否打印详细日志
+            
+        返回:
+            生成器，每个任务完成（或失败）时产出 (key, token, error)，
+            成功时 error 为 None，失败时 token 为 None
+        """
+        # 配置了调度器时按优先级排队，有空闲名额时再创建任务
+        pending = []
+        for index, task in enumerate(tasks):
+            ticket = self.scheduler.enqueue(task.get("priority", LoginScheduler.EXPIRED_COOKIE)) if self.scheduler else None
+            pending.append((ticket, task.get("key", index), task))
+        if self.scheduler:
+            pending.sort(key=lambda item: item[0][:2])
+        
+        # taskId -> 任务状态，每个任务按各自的轮询计划安排下次查询时间
+        outstanding: Dict[str, Dict[str, Any]] = {}
+        
+        try:
+            while pending or outstanding:
+                while pending:
+                    ticket, key, task = pending[0]
+                    if self.scheduler:
+                        # 没有进行中的任务时阻塞等待名额，否则有名额才创建，没有就继续轮询
+                        admitted = self.scheduler.try_admit(ticket) if outstanding else self.scheduler.admit(ticket)
+                        if not admitted:
+                            break
+                    pending.pop(0)
+                    admitted_at = time.time()
+                    try:
+                        task_id = self._create_task(task["url"], task["sitekey"], task.get("proxy"), verbose)
+                    except (TurnstileSolverError, requests.exceptions.RequestException) as e:
+                        self._finish(admitted_at, False, 0, key=key, **task.get("trace", {}))
+                        if not isinstance(e, TurnstileSolverError):
+                            e = TurnstileSolverError(f"请求错误: {e}")
+                        yield key, None, e
+                        continue
+                    schedule = self._schedule()
+                    now = time.time()
+                    outstanding[task_id] = {
+                        "key": key,
+                        "trace": task.get("trace", {}),
+                        "schedule": schedule,
+                        "due": now + next(schedule, 0),
+                        "admitted": admitted_at,
+                        "started": now,
+                        "polls": 0
+                    }
+                    if verbose:
+                        print(f"已创建 Turnstile 验证任务，共 {len(outstanding)} 个进行中，{len(pending)} 个排队")
+                
+                if not outstanding:
+                    continue
+                
+                task_id, state = min(outstanding.items(), key=lambda item: item[1]["due"])
+                wait = state["due"] - time.time()
+                if wait > 0:
+                    if pending:
+                        # 仍有任务排队时定期检查是否有空闲名额
+                        time.sleep(min(wait, 1))
+                        continue
+                    time.sleep(wait)
+                
+                state["polls"] += 1
+                try:
+                    token = self._poll_task(task_id, verbose)
+                except (TurnstileSolverError, requests.exceptions.RequestException) as e:
+                    outstanding.pop(task_id)
+                    self._record(state["started"], state["polls"], False)
+                    self._finish(state["admitted"], False, state["polls"], key=state["key"], **state["trace"])
+                    if not isinstance(e, TurnstileSolverError):
+                        e = TurnstileSolverError(f"请求错误: {e}")
+                    yield state["key"], None, e
+                    continue
+                
+                if token:
+                    outstanding.pop(task_id)
+                    self._record(state["started"], state["polls"], True)
+                    self._finish(state["admitted"], True, state["polls"], key=state["key"], **state["trace"])
+                    yield state["key"], token, None
+                    continue
+                
+                delay = next(state["schedule"], None)
+                if delay is None:
+                    outstanding.pop(task_id)
+                    self._record(state["started"], state["polls"], False)
+                    self._finish(state["admitted"], False, state["polls"], key=state["key"], **state["trace"])
+                    yield state["key"], None, TurnstileSolverError(f"达到最大重试次数 ({state['polls']})，验证失败")
+                else:
+                    state["due"] = time.time() + delay
+        finally:
+            # 调用方提前结束时退出队列并归还名额
+            if self.scheduler:
+                for ticket, _, _ in pending:
+                    self.scheduler.withdraw(ticket)
+                for state in outstanding.values():
+                    self.scheduler.release(None)
 
 
 """ # 简单使用示例
@@ -0,0 +1,99 @@
+import hashlib
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from state_store import StateStore
+
+
+class CookieValidityCache:
+    """
+    持久化的 Cookie 有效性缓存
+
+    记录每个账号 Cookie 最近一次被确认有效的时间和检查结论，
+    在有效期(TTL)内可以跳过有效性检查，直接用于签到。记录保存在 StateStore 中。
+    """
+
+    def __init__(self, store: StateStore, ttl: int):
+        """
+        初始化 Cookie 有效性缓存
+
+        参数:
+            store: 状态存储
+            ttl: 有效期(秒)，小于等于 0 时不信任缓存
+        """
+        self.store = store
+        self.ttl = ttl
+        self._entries: Dict[str, dict] = {}
+        self._changed: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _fingerprint(cookie: str) -> str:
+        return hashlib.sha1(cookie.encode('utf-8')).hexdigest()
+
+    def load(self) -> None:
+        """从状态存储加载缓存"""
+        try:
+            self._entries = self.store.load_validity()
+        except Exception as e:
+            print(f"加载Cookie有效性缓存失败: {e}")
+            self._entries = {}
+
+    def save(self) -> None:
+        """把变更的记录在一个事务中写回状态存储"""
+        with self._lock:
+            if not self._changed and not self._removed:
+                return
+            changed = {key: self._entries[key] for key in self._changed if key in self._entries}
+            removed = list(self._removed)
+            self._changed.clear()
+            self._removed.clear()
+        try:
+            self.store.save_validity(changed, removed)
+        except Exception as e:
+            print(f"保存Cookie有效性缓存失败: {e}")
+
+    def get(self, key: str, cookie: str) -> Optional[dict]:
+        """返回与当前 Cookie 匹配的缓存记录"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry.get("cookie") == self._fingerprint(cookie):
+            return entry
+        return None
+
+    def is_fresh(self, key: str, cookie: str) -> bool:
+        """Cookie 是否在有效期内被确认过有效"""
+        if self.ttl <= 0:
+            return False
+        entry = self.get(key, cookie)
+        return bool(entry and entry.get("valid") and time.time() - entry.get("checked_at", 0) < self.ttl)
+
+    def record(self, key: str, cookie: str, valid: bool, source: str = "probe") -> None:
+        """
+        记录一次有效性结论
+
+        参数:
+            key: 账号标识
+            cookie: Cookie 字符串（只保存指纹）
+            valid: 是否有效
+            source: 结论来源，probe/login/sign
+        """
+        with self._lock:
+            self._entries[key] = {
+                "cookie": self._fingerprint(cookie),
+                "valid": valid,
+                "checked_at": int(time.time()),
+                "source": source
+            }
+            self._changed.add(key)
+            self._removed.discard(key)
+
+    def forget(self, key: str) -> None:
+        """删除账号的缓存记录"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._changed.discard(key)
+                self._removed.add(key)
@@ -1,7 +1,10 @@
 from curl_cffi import requests
 import time
+import threading
 import os
-from typing import Dict, Optional, Any, Union
+from typing import Callable, Dict, Optional, Any, Union, Iterator
+from captcha_poller import AdaptivePoller, fixed_schedule
+from run_trace import RunTracer
 
 class YesCaptchaSolverError(Exception):
     """YesCaptcha 解决器错误基类"""
@@ -22,7 +25,9 @@ class YesCaptchaSolver:
         max_retries: int = 20,
         retry_interval: int = 3,
         timeout: int = 60,
-        advanced: bool = False
+        advanced: bool = False,
+        poller: Optional[AdaptivePoller] = None,
+        tracer: Optional[RunTracer] = None
     ):
         """
         初始化 YesCaptcha 验证码解决器
@@ -34,6 +39,9 @@ class YesCaptchaSolver:
             retry_interval: 重试间隔(秒)
             timeout: 请求超时时间(秒)
             advanced: 是否使用高级解析模式(M1)
+            poller: 自适应轮询，提供时按历史耗时安排查询时间并记录每次解题耗时，
+                    不提供时按 retry_interval 固定间隔查询
+            tracer: 运行记录，提供时记录每个任务的解题耗时（单独使用和作为对冲备用服务时都记录）
         """
         self.api_base_url = api_base_url
         self.create_task_url = f"{api_base_url}/createTask"
@@ -43,13 +51,24 @@ class YesCaptchaSolver:
         self.retry_interval = retry_interval
         self.timeout = timeout
         self.advanced = advanced
+        self.poller = poller
+        self.tracer = tracer
+    
+    def _schedule(self) -> Iterator[float]:
+        """每次查询结果前需要等待的秒数"""
+        if self.poller:
+            return self.poller.schedule()
+        return fixed_schedule(self.max_retries, self.retry_interval)
     
     def solve(
         self,
         url: str,
         sitekey: str,
         user_agent: Optional[str] = None,
-        verbose: bool = False
+        verbose: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+        priority: int = 1,
+        on_admitted: Optional[Callable[[], None]] = None
     ) -> str:
         """
         解决 Turnstile 验证并返回令牌
@@ -59,6 +78,9 @@ class YesCaptchaSolver:
             sitekey: Turnstile sitekey
             user_agent: 自定义 User-Agent
             verbose: 是否打印详细日志
+            cancel_event: 取消事件，被设置后放弃轮询（例如对冲求解中另一服务已先返回）
+            priority: 排队优先级，YesCaptcha 为云服务不需要排队，仅为与 TurnstileSolver 接口一致
+            on_admitted: 开始创建任务时的回调，不需要排队，立即调用
             
         返回:
             验证令牌字符串
@@ -68,15 +90,26 @@ class YesCaptchaSolver:
         """
         if verbose:
             print("正在创建 YesCaptcha 验证任务...")
-            
-        task_id = self._create_task(url, sitekey, user_agent, verbose)
-        if not task_id:
-            raise YesCaptchaSolverError("创建验证码任务失败")
-            
-        # 获取任务结果
-        token = self._get_task_result(task_id, verbose)
-        if not token:
-            raise YesCaptchaSolverError("获取验证码结果失败")
+        if on_admitted is not None:
+            on_admitted()
+        started = time.time()
+        ok = False
+        try:
+            task_id = self._create_task(url, sitekey, user_agent, verbose)
+            if not task_id:
+                raise YesCaptchaSolverError("创建验证码任务失败")
+
+            # 获取任务结果
+            token = self._get_task_result(task_id, verbose, cancel_event)
+            if not token:
+                # 被对冲的另一服务抢先时主动取消，不计为失败
+                if cancel_event is not None and cancel_event.is_set():
+                    ok = None
+                raise YesCaptchaSolverError("获取验证码结果失败")
+            ok = True
+        finally:
+            if self.tracer:
+                self.tracer.record("captcha", started, time.time() - started, provider="yescaptcha", ok=ok)
             
         if verbose:
             print(f"验证码解决成功: {token[:30]}...{token[-10:] if len(token) > 30 else ''}")
@@ -140,7 +173,12 @@ class YesCaptchaSolver:
                 print(f"创建任务过程中发生异常: {e}")
             return None
     
-    def _get_task_result(self, task_id: str, verbose: bool = False) -> Optional[str]:
+    def _get_task_result(
+        self,
+        task_id: str,
+        verbose: bool = False,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[str]:
         """获取任务结果"""
         
         data = {
@@ -148,10 +186,22 @@ class YesCaptchaSolver:
             "taskId": task_id
         }
         
-        for attempt in range(1, self.max_retries + 1):
+        started = time.time()
+        polls = 0
+        token = None
+        
+        for delay in self._schedule():
+            if delay:
+                if cancel_event is None:
+                    time.sleep(delay)
+                elif cancel_event.wait(delay):
+                    if verbose:
+                        print("任务已取消")
+                    return None
+            polls += 1
             try:
                 if verbose:
-                    print(f"尝试获取任务结果 ({attempt}/{self.max_retries})...")
+                    print(f"尝试获取任务结果 (第 {polls} 次)...")
                     
                 response = requests.post(
                     self.get_result_url,
@@ -165,7 +215,7 @@ class YesCaptchaSolver:
                     error_desc = result.get('errorDescription', '未知错误')
                     if verbose:
                         print(f"获取结果失败: {error_desc}")
-                    return None
+                    break
                 
                 status = result.get("status")
                 
@@ -174,20 +224,22 @@ class YesCaptchaSolver:
                     token = result.get("solution", {}).get("token")
                     if verbose:
                         print("任务已完成")
-                    return token
+                    break
                 
                 # 按照文档，状态为processing时表示处理中，需等待重试
                 elif status == "processing":
                     if verbose:
-                        print(f"任务处理中，等待 {self.retry_interval} 秒后重试...")
-                    time.sleep(self.retry_interval)
+                        print("任务处理中，稍后重试...")
                     continue
                     
             except Exception as e:
                 if verbose:
                     print(f"获取任务结果过程中发生异常: {e}")
-                return None
-                
-        if verbose:
-            print("获取任务结果超时")
-        return None
+                break
+        else:
+            if verbose:
+                print("获取任务结果超时")
+        
+        if self.poller and polls:
+            self.poller.record(time.time() - started, polls, bool(token))
+        return token